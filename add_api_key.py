@@ -0,0 +1,25 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import json
+import sys
+
+from app.utils.api_key_store import add_api_key
+
+# Creates a new API key for a customer and adds its digest to the keys file (JSON) or database (.sqlite3, .db)
+# read by the SecretKeyCheckerMiddleware. The running servers load it within api_keys_reload_interval seconds.
+
+if __name__ == "__main__":
+    server_timing = "--server-timing" in sys.argv
+    arguments = [argument for argument in sys.argv if argument != "--server-timing"]
+
+    if len(arguments) < 3:
+        print("Usage: python add_api_key.py <keys path> <key id> [tier] [limits as JSON] [--server-timing]")
+        sys.exit(1)
+
+    tier = arguments[3] if len(arguments) > 3 else "default"
+    limits = json.loads(arguments[4]) if len(arguments) > 4 else {}
+
+    key = add_api_key(arguments[1], arguments[2], tier, limits, server_timing)
+    print(f"API key for {arguments[2]} (store it now, only its digest is saved): {key}")
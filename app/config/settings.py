@@ -41,6 +41,7 @@ class Settings(BaseSettings):
     # Environment variables
     rapid_api_secret_key: str = getenv("RAPID_API_SECRET_KEY", "")
     geonames_username: str = getenv("GEONAMES_USERNAME", "")
+    metrics_key: str = getenv("METRICS_KEY", "")
     env_type: str | bool = ENV_TYPE
 
     # Config file
@@ -51,13 +52,66 @@ class Settings(BaseSettings):
     docs_url: str | None = config["docs_url"]
     redoc_url: str | None = config["redoc_url"]
     secret_key_name: str = config["secret_key_name"]
+    transit_subject_cache_size: int = config["transit_subject_cache_size"]
+    calendar_cache_size: int = config["calendar_cache_size"]
+    calendar_cache_directory: str = config["calendar_cache_directory"]
+    timezone_index_path: str = config["timezone_index_path"]
+    compute_pool_workers: int = config["compute_pool_workers"]
+    get_cache_control: str = config["get_cache_control"]
+    response_cache_backend: str = config["response_cache_backend"]
+    response_cache_max_entries: int = config["response_cache_max_entries"]
+    response_cache_sqlite_path: str = config["response_cache_sqlite_path"]
+    response_cache_redis_url: str = config["response_cache_redis_url"]
+    response_cache_routes: dict = config["response_cache_routes"]
+    shared_cache_directory: str = config["shared_cache_directory"]
+    shared_cache_ttl: int = config["shared_cache_ttl"]
+    shared_cache_segments: dict = config["shared_cache_segments"]
+    api_keys_path: str = config["api_keys_path"]
+    api_keys_reload_interval: float = config["api_keys_reload_interval"]
+    rate_limit_backend: str = config["rate_limit_backend"]
+    rate_limit_sqlite_path: str = config["rate_limit_sqlite_path"]
+    rate_limit_rate: float = config["rate_limit_rate"]
+    rate_limit_burst: float = config["rate_limit_burst"]
+    rate_limit_default_cost: float = config["rate_limit_default_cost"]
+    rate_limit_costs: dict = config["rate_limit_costs"]
+    profiling_directory: str = config["profiling_directory"]
+    profiling_header: str = config["profiling_header"]
+    profiling_key_ids: list = config["profiling_key_ids"]
+    profiling_sample_rate: int = config["profiling_sample_rate"]
+    profiling_format: str = config["profiling_format"]
+    profiling_sampling_interval: float = config["profiling_sampling_interval"]
+    capture_path: str = config["capture_path"]
+    capture_sample_rate: int = config["capture_sample_rate"]
+    capture_max_body_size: int = config["capture_max_body_size"]
+    openapi_cache_path: str = config["openapi_cache_path"]
+    cache_snapshot_directory: str = config["cache_snapshot_directory"]
+    cache_snapshot_interval: int = config["cache_snapshot_interval"]
+    warm_up: bool = config["warm_up"]
+    readiness_max_queue_depth: int = config["readiness_max_queue_depth"]
+    readiness_max_event_loop_lag: float = config["readiness_max_event_loop_lag"]
+    readiness_required_dependencies: list = config["readiness_required_dependencies"]
+    readiness_cache_error_window: float = config["readiness_cache_error_window"]
+    drain_timeout: float = config["drain_timeout"]
+    compute_default_deadline: float = config["compute_default_deadline"]
+    compute_deadlines: dict = config["compute_deadlines"]
 
     # Common settings
     log_level: int = int(config["log_level"])
+    log_format: str = config["log_format"]
+    log_queue_size: int = config["log_queue_size"]
+    health_check_log_sample_rate: int = config["health_check_log_sample_rate"]
     LOGGING_CONFIG: dict = {
         "version": 1,
         "disable_existing_loggers": False,
+        # Only the formatters in use are configured: the uvicorn ones import uvicorn, which the workers
+        # started by another server (and the scripts importing the app) do not need otherwise.
         "formatters": {
+            "json": {
+                "()": "app.utils.structured_logging.JsonFormatter",
+            },
+        }
+        if config["log_format"] == "json"
+        else {
             "default": {
                 "()": "uvicorn.logging.DefaultFormatter",
                 "fmt": "[%(asctime)s] %(levelprefix)s %(message)s - Module: %(name)s",
@@ -72,12 +126,12 @@ class Settings(BaseSettings):
         },
         "handlers": {
             "default": {
-                "formatter": "default",
+                "formatter": "json" if config["log_format"] == "json" else "default",
                 "class": "logging.StreamHandler",
                 "stream": "ext://sys.stderr",
             },
             "access": {
-                "formatter": "access",
+                "formatter": "json" if config["log_format"] == "json" else "access",
                 "class": "logging.StreamHandler",
                 "stream": "ext://sys.stdout",
             },
@@ -2,18 +2,50 @@
     This is part of Astrologer API (C) 2023 Giacomo Battaglia
 """
 
-import logging
-import logging.config
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
 
 from fastapi import FastAPI
 
 from .routers import main_router
 from .config.settings import settings
 from .middleware.secret_key_checker_middleware import SecretKeyCheckerMiddleware
+from .middleware.response_cache_middleware import ResponseCacheMiddleware
+from .middleware.rate_limit_middleware import RateLimitMiddleware
+from .middleware.request_context_middleware import RequestContextMiddleware
+from .middleware.profiling_middleware import ProfilingMiddleware
+from .middleware.request_capture_middleware import RequestCaptureMiddleware
+from .utils.response_cache_backends import get_response_cache_backend
+from .utils.api_key_store import get_api_key_store
+from .utils.rate_limit_backends import get_rate_limit_backend
+from .utils.structured_logging import setup_logging
+from .utils.app_metrics import register_app_metrics
+from .utils.request_capture import CapturedRequestsWriter
+from .utils.readiness import readiness
+from .utils.cache_snapshots import cache_snapshots
+from .utils.drain import drain
+from .utils.openapi_cache import get_cached_openapi
+from .utils.kerykeion_patches import patch_kerykeion
 
 
-logging.config.dictConfig(settings.LOGGING_CONFIG)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    drain.reset()
+    # The shared caches are restored from their snapshots before the first request.
+    cache_snapshots.open_shared_memory_caches()
+    cache_snapshots.start()
+    # The worker reports not ready until warmed up (see /api/v4/health/ready).
+    readiness.start(warm_up=settings.warm_up)
+    yield
+    # Waits for the computations in progress, then saves the caches and closes the writers and backends.
+    await drain.finish()
+
+
+setup_logging(settings.LOGGING_CONFIG, settings.log_queue_size)
+patch_kerykeion()
 app = FastAPI(
+    lifespan=lifespan,
     debug=settings.debug,
     docs_url=settings.docs_url,
     redoc_url=settings.redoc_url,
@@ -38,10 +70,70 @@ app = FastAPI(
 
 app.include_router(main_router.router, tags=["Endpoints"])
 
+
+def openapi() -> dict:
+    """
+    The OpenAPI document of the app, generated once and cached on disk (openapi_cache_path) for the next
+    workers and runs, until the sources of the app or the packages change.
+    """
+
+    if app.openapi_schema is None:
+        generate = partial(FastAPI.openapi, app)
+        app.openapi_schema = get_cached_openapi(Path(__file__).parent / settings.openapi_cache_path, generate) if settings.openapi_cache_path else generate()
+
+    return app.openapi_schema
+
+
+app.openapi = openapi  # type: ignore[method-assign]
+
 #------------------------------------------------------------------------------
 # Middleware 
 #------------------------------------------------------------------------------
 
+# The middleware added last runs first: the request context, the capture, the secret key check, the profiling, the
+# rate limit, then the cache.
+response_cache_backend = get_response_cache_backend(
+    settings.response_cache_backend,
+    settings.response_cache_max_entries,
+    settings.response_cache_sqlite_path,
+    settings.response_cache_redis_url,
+)
+
+if response_cache_backend is not None:
+    drain.add_closer("the response cache", response_cache_backend.close)
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        backend=response_cache_backend,
+        routes=settings.response_cache_routes,
+    )
+
+rate_limit_backend = get_rate_limit_backend(settings.rate_limit_backend, settings.rate_limit_sqlite_path)
+
+if rate_limit_backend is not None:
+    drain.add_closer("the rate limit backend", rate_limit_backend.close)
+    app.add_middleware(
+        RateLimitMiddleware,
+        backend=rate_limit_backend,
+        secret_key_name=settings.secret_key_name,
+        rate=settings.rate_limit_rate,
+        burst=settings.rate_limit_burst,
+        costs=settings.rate_limit_costs,
+        default_cost=settings.rate_limit_default_cost,
+    )
+
+# Without profiling configured the middleware is not added at all, so the requests do not pay for it.
+if settings.debug or settings.profiling_key_ids or settings.profiling_sample_rate > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=Path(__file__).parent / settings.profiling_directory,
+        header_name=settings.profiling_header,
+        key_ids=settings.profiling_key_ids,
+        sample_rate=settings.profiling_sample_rate,
+        default_format=settings.profiling_format,
+        sampling_interval=settings.profiling_sampling_interval,
+        allow_all=settings.debug,
+    )
+
 if settings.debug is True:
     pass
 
@@ -52,4 +144,28 @@ else:
         secret_keys=[
             settings.rapid_api_secret_key,
         ],
+        key_store=get_api_key_store(settings.api_keys_path, settings.api_keys_reload_interval),
+        # The scraper has its own key (metrics_key), or the network policy protects /metrics
+        exempt_paths=("/metrics",),
     )
+
+if settings.capture_path:
+    captured_requests_writer = CapturedRequestsWriter(Path(__file__).parent / settings.capture_path)
+    drain.add_closer("the captured requests", captured_requests_writer.close)
+    app.add_middleware(
+        RequestCaptureMiddleware,
+        writer=captured_requests_writer,
+        sample_rate=settings.capture_sample_rate,
+        max_body_size=settings.capture_max_body_size,
+    )
+
+app.add_middleware(
+    RequestContextMiddleware,
+    sampled_paths=("/api/v4/health",),
+    sample_rate=settings.health_check_log_sample_rate,
+    server_timing=settings.debug,
+    endpoints=[route.path for route in app.routes],
+)
+
+register_app_metrics(response_cache_backend)
+readiness.response_cache_backend = response_cache_backend
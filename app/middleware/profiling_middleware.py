@@ -0,0 +1,112 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import re
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Collection, Union
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..utils.request_profiler import PROFILE_FORMATS, RequestProfiler, get_profiler
+from ..utils.structured_logging import request_context
+
+logger = getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the computations of some requests: those with the `header_name` header, from the keys of
+    `key_ids` (or from anyone when `allow_all`, in debug), and one in every `sample_rate` requests to the
+    /api/ endpoints (0 for none). The header value chooses the format, "pstats" (deterministic) or
+    "speedscope" (sampling), or `default_format` for any other value.
+
+    The profile is written to `directory` and its file name sent in the X-Profile response header. A
+    profiled request bypasses the response cache, the computations in flight and the shared cache, so
+    its computations run.
+
+    The middleware is only added when profiling is configured: otherwise the requests do not pay for it.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        directory: Union[str, Path],
+        header_name: str = "X-Profile",
+        key_ids: Collection[str] = (),
+        sample_rate: int = 0,
+        default_format: str = "pstats",
+        sampling_interval: float = 0.001,
+        allow_all: bool = False,
+    ) -> None:
+        self.app = app
+        self.directory = Path(directory)
+        self.header_name = header_name
+        self.key_ids = frozenset(key_ids)
+        self.sample_rate = sample_rate
+        self.default_format = default_format
+        self.sampling_interval = sampling_interval
+        self.allow_all = allow_all
+        self.profiled = 0
+        self._requests = 0
+
+    def _get_profile_format(self, scope: Scope) -> Union[str, None]:
+        if not scope.get("path", "").startswith("/api/"):
+            return None
+
+        header_value = Headers(scope=scope).get(self.header_name)
+        if header_value is not None:
+            api_key = scope.get("state", {}).get("api_key")
+
+            if self.allow_all or (api_key is not None and api_key.id in self.key_ids):
+                return header_value.strip().lower() if header_value.strip().lower() in PROFILE_FORMATS else self.default_format
+
+        if self.sample_rate > 0:
+            self._requests += 1
+            if self._requests % self.sample_rate == 0:
+                return self.default_format
+
+        return None
+
+    def _write(self, profiler: RequestProfiler, context: dict, scope: Scope) -> str:
+        endpoint = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-")
+        file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{context['request_id']}{profiler.suffix}"
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.write(self.directory / file_name)
+
+        return file_name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        context = request_context.get()
+        profile_format = self._get_profile_format(scope) if scope["type"] == "http" and context is not None else None
+
+        if profile_format is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = get_profiler(profile_format, self.sampling_interval)
+        context["profiler"] = profiler
+
+        async def send_with_profile(message: Message) -> None:
+            # The computations are done when the response starts.
+            if message["type"] == "http.response.start" and profiler.runs > 0:
+                try:
+                    file_name = await asyncio.to_thread(self._write, profiler, context, scope)
+                    self.profiled += 1
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile", file_name.encode("latin-1"))]}
+
+                except OSError as e:
+                    logger.error(f"Could not write the profile: {e}")
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+
+        finally:
+            context.pop("profiler", None)
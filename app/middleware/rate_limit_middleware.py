@@ -0,0 +1,128 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import hashlib
+import math
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import Message, ASGIApp, Receive, Scope, Send
+
+from ..utils.metrics import Counter
+from ..utils.rate_limit_backends import RateLimitBackend
+
+rate_limited_requests_total = Counter(
+    "astrologer_api_rate_limited_requests_total",
+    "Requests rejected by the rate limit, by endpoint",
+    ("endpoint",),
+)
+
+
+class RateLimitMiddleware:
+    """
+    Limits the requests of every API key with a token bucket: the bucket holds up to `burst` tokens,
+    refilled at `rate` tokens per second, and every request takes the cost of its endpoint (`costs`, by
+    path, or `default_cost`), so that an expensive chart counts more than a birth data request.
+
+    The key is the one identified by the SecretKeyCheckerMiddleware (scope["state"]["api_key"]), whose
+    limits can override the rate and the burst ({"rate": ..., "burst": ...}); without it, the value of the
+    secret_key_name header or the client address. Only the /api/ paths are limited, and endpoints with a
+    cost of 0 are not. The responses have the RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset and
+    RateLimit-Policy headers, and the rejected requests get a 429 with Retry-After. A rate of 0 is a fixed
+    quota that never refills (no RateLimit-Reset nor Retry-After), and a request costing more than the
+    burst can never pass: it gets a 403.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        backend: RateLimitBackend,
+        secret_key_name: str,
+        rate: float,
+        burst: float,
+        costs: dict[str, float],
+        default_cost: float = 1,
+    ) -> None:
+        self.app = app
+        self.backend = backend
+        self.secret_key_name = secret_key_name
+        self.rate = rate
+        self.burst = burst
+        self.costs = costs
+        self.default_cost = default_cost
+        self.rejected = 0
+
+    def _get_key_id(self, scope: Scope) -> str:
+        api_key = scope.get("state", {}).get("api_key")
+        if api_key is not None:
+            return f"key:{api_key.id}"
+
+        header_key = Headers(scope=scope).get(self.secret_key_name, "").split(":")[0] if self.secret_key_name else ""
+        if header_key:
+            return f"header:{hashlib.sha256(header_key.encode('utf-8')).hexdigest()}"
+
+        client = scope.get("client")
+        return f"client:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        cost = self.costs.get(path, self.default_cost) if scope["type"] == "http" and path.startswith("/api/") else 0
+
+        if cost <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        api_key = scope.get("state", {}).get("api_key")
+        limits = api_key.limits if api_key is not None else {}
+        rate = float(limits.get("rate", self.rate))
+        burst = float(limits.get("burst", self.burst))
+
+        if cost > burst:
+            # Never enough tokens in the bucket: retrying is pointless
+            self.rejected += 1
+            rate_limited_requests_total.inc((path if path in self.costs else "other",))
+            response = JSONResponse(
+                status_code=403,
+                content={"status": "KO", "message": f"The cost of this endpoint ({cost:g}) is over the rate limit burst of the API key ({burst:g})"},
+            )
+
+            await response(scope, receive, send)
+            return
+
+        result = await self.backend.take(self._get_key_id(scope), cost, rate, burst)
+        # A key with a rate of 0 has a fixed quota: no refill window and no reset
+        policy = f"{math.floor(burst)};w={math.ceil(burst / rate)}" if rate > 0 else str(math.floor(burst))
+        headers = [
+            (b"ratelimit-limit", str(math.floor(burst)).encode("latin-1")),
+            (b"ratelimit-remaining", str(result.remaining).encode("latin-1")),
+            (b"ratelimit-policy", policy.encode("latin-1")),
+        ]
+        if not math.isinf(result.reset):
+            headers.append((b"ratelimit-reset", str(math.ceil(result.reset)).encode("latin-1")))
+
+        if not result.allowed:
+            self.rejected += 1
+            rate_limited_requests_total.inc((path if path in self.costs else "other",))
+
+            if math.isinf(result.retry_after):
+                response = JSONResponse(status_code=429, content={"status": "KO", "message": "Too many requests, the quota of the API key is exhausted"})
+            else:
+                retry_after = str(math.ceil(result.retry_after))
+                response = JSONResponse(
+                    status_code=429,
+                    content={"status": "KO", "message": f"Too many requests, retry after {retry_after} seconds"},
+                    headers={"Retry-After": retry_after},
+                )
+            response.raw_headers.extend(headers)
+
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *headers]}
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
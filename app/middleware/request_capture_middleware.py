@@ -0,0 +1,91 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import json
+import time
+from typing import Union
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..utils.request_capture import CAPTURED_HEADERS, CapturedRequest, CapturedRequestsWriter, redact_body, redact_query
+
+
+class RequestCaptureMiddleware:
+    """
+    Captures one in every `sample_rate` requests to the /api/ endpoints in the captured requests format,
+    to be replayed by the load harness with the shape of the real traffic. The keys and the cookies are
+    not captured, the names and GeoNames usernames of the subjects and the identifiers of the ranking
+    candidates are redacted and the coordinates coarsened (see redact_body), and the requests with a body larger than `max_body_size` bytes are
+    skipped.
+    """
+
+    def __init__(self, app: ASGIApp, writer: CapturedRequestsWriter, sample_rate: int = 1, max_body_size: int = 65536) -> None:
+        self.app = app
+        self.writer = writer
+        self.sample_rate = max(1, sample_rate)
+        self.max_body_size = max_body_size
+        self._requests = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        self._requests += 1
+        if self._requests % self.sample_rate != 0:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        body_chunks: list[bytes] = []
+        body_size = 0
+        status = None
+
+        async def receive_and_capture() -> Message:
+            nonlocal body_size
+
+            message = await receive()
+            if message["type"] == "http.request":
+                body_size += len(message.get("body", b""))
+                if body_size <= self.max_body_size:
+                    body_chunks.append(message.get("body", b""))
+
+            return message
+
+        async def send_and_capture(message: Message) -> None:
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_capture, send_and_capture)
+
+        finally:
+            if body_size <= self.max_body_size:
+                self._capture(scope, b"".join(body_chunks), status, time.perf_counter() - start)
+
+    def _capture(self, scope: Scope, body: bytes, status: Union[int, None], duration: float) -> None:
+        try:
+            decoded_body = redact_body(json.loads(body)) if body else None
+        except ValueError:
+            return
+
+        headers = Headers(scope=scope)
+
+        self.writer.write(
+            CapturedRequest(
+                method=scope["method"],
+                path=scope["path"],
+                query=redact_query(scope.get("query_string", b"").decode("latin-1")),
+                headers={name: headers[name] for name in CAPTURED_HEADERS if name in headers},
+                body=decoded_body,
+                time=round(time.time(), 3),
+                status=status,
+                duration_ms=round(duration * 1000, 3),
+            )
+        )
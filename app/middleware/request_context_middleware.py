@@ -0,0 +1,119 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import re
+import time
+import uuid
+from logging import getLogger
+from typing import Collection
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..utils.metrics import request_duration_seconds, requests_in_progress, requests_total
+from ..utils.structured_logging import request_context
+
+logger = getLogger(__name__)
+
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+
+def get_server_timing(context: dict) -> str:
+    """
+    The Server-Timing header of the request: the duration (milliseconds) of every stage so far, and the
+    total duration of the request when the response starts.
+    """
+
+    timings = [*context["timings"].items(), ("total", time.perf_counter() - context["start"])]
+
+    return ", ".join(f"{name};dur={duration * 1000:.3f}" for name, duration in timings)
+
+
+class RequestContextMiddleware:
+    """
+    Sets the context of every request for the logs: the request id (from the X-Request-ID header, or a
+    new one, returned in the response), the key and the endpoint. When the request is completed, it logs
+    its status, duration and the durations of its stages; the requests to the `sampled_paths` (eg. the
+    health checks) are logged once every `sample_rate`.
+
+    The durations of the stages are also sent in the Server-Timing header, to every request when
+    `server_timing` is set (debug) and otherwise to the keys with server_timing enabled.
+
+    Every request is counted in the metrics by endpoint, method and status, with its duration; the
+    paths which are not `endpoints` of the app are counted as "other".
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sampled_paths: tuple[str, ...] = (),
+        sample_rate: int = 1,
+        server_timing: bool = False,
+        endpoints: Collection[str] = (),
+    ) -> None:
+        self.app = app
+        self.sampled_paths = sampled_paths
+        self.sample_rate = sample_rate
+        self.server_timing = server_timing
+        self.endpoints = frozenset(endpoints)
+
+    def _is_server_timing_enabled(self, scope: Scope) -> bool:
+        if self.server_timing:
+            return True
+
+        api_key = scope.get("state", {}).get("api_key")
+        return api_key is not None and api_key.server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("x-request-id", "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+
+        context = {"request_id": request_id, "scope": scope, "start": time.perf_counter(), "timings": {}}
+        token = request_context.set(context)
+        status = 500
+
+        async def send_with_request_id(message: Message) -> None:
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+
+                if self._is_server_timing_enabled(scope):
+                    headers.append((b"server-timing", get_server_timing(context).encode("latin-1")))
+
+                message = {**message, "headers": headers}
+
+            await send(message)
+
+        requests_in_progress.inc()
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+
+        finally:
+            duration = time.perf_counter() - context["start"]
+            endpoint = scope["path"] if scope["path"] in self.endpoints else "other"
+
+            requests_in_progress.dec()
+            requests_total.inc((endpoint, scope["method"], str(status)))
+            request_duration_seconds.observe((endpoint,), duration)
+
+            if logger.isEnabledFor(20):
+                logger.info(
+                    "Request completed",
+                    extra={
+                        "status": status,
+                        "duration_ms": round(duration * 1000, 3),
+                        "timings": context["timings"] or None,
+                        "sample_rate": self.sample_rate if scope["path"].startswith(self.sampled_paths) else 1,
+                    },
+                )
+
+            request_context.reset(token)
@@ -0,0 +1,149 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import hashlib
+import json
+from typing import Union
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..utils.request_hash import get_canonical_json, get_result_version
+from ..utils.response_cache_backends import ResponseCacheBackend
+from ..utils.structured_logging import request_context
+
+
+def get_response_cache_key(method: str, path: str, query_string: bytes, body: bytes) -> Union[str, None]:
+    """
+    The key of a response: the hash of the version of the results, the method, the path, the query
+    parameters sorted by name and the canonical JSON of the body, so that the key order and the
+    whitespace of the request do not matter, and the responses stored (eg. in Redis) before a deploy
+    changing the results are not served after it. Returns None when the body is not JSON.
+    """
+
+    query = urlencode(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True), key=lambda pair: pair[0]))
+
+    if body:
+        try:
+            canonical_body = get_canonical_json(json.loads(body))
+        except ValueError:
+            return None
+    else:
+        canonical_body = ""
+
+    return hashlib.sha256(f"{get_result_version()}\n{method} {path}\n{query}\n{canonical_body}".encode("utf-8")).hexdigest()
+
+
+def _encode_response(status: int, headers: list[tuple[bytes, bytes]], body: bytes) -> bytes:
+    head = json.dumps({"status": status, "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers]})
+
+    return head.encode("utf-8") + b"\n" + body
+
+
+def _decode_response(value: bytes) -> tuple[int, list[tuple[bytes, bytes]], bytes]:
+    head, _, body = value.partition(b"\n")
+    decoded_head = json.loads(head)
+
+    return decoded_head["status"], [(name.encode("latin-1"), value.encode("latin-1")) for name, value in decoded_head["headers"]], body
+
+
+class ResponseCacheMiddleware:
+    """
+    Caches the full responses of the deterministic endpoints, by the hash of the canonical request.
+
+    Only the paths in `routes` are cached, each with its own time to live and maximum response size in
+    bytes, eg. {"/api/v4/birth-chart": {"ttl": 86400, "max_size": 4194304}}. Only the successful (200)
+    responses are stored; requests with If-None-Match or Cache-Control: no-cache and the profiled
+    requests (see ProfilingMiddleware) skip the lookup, and those with Cache-Control: no-store are not
+    stored. The responses have an X-Cache header (HIT or MISS).
+    """
+
+    def __init__(self, app: ASGIApp, backend: ResponseCacheBackend, routes: dict[str, dict]) -> None:
+        self.app = app
+        self.backend = backend
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = self.routes.get(scope.get("path", "")) if scope["type"] == "http" and scope["method"] in ("GET", "POST") else None
+
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        body_replayed = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_replayed
+
+            if not body_replayed:
+                body_replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            return await receive()
+
+        key = get_response_cache_key(scope["method"], scope["path"], scope.get("query_string", b""), body)
+        if key is None:
+            await self.app(scope, replay_receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        request_cache_control = request_headers.get("cache-control", "")
+
+        context = request_context.get()
+        is_profiled = context is not None and "profiler" in context
+
+        if "if-none-match" not in request_headers and "no-cache" not in request_cache_control and not is_profiled:
+            cached_response = await self.backend.lookup(key)
+
+            if cached_response is not None:
+                status, headers, cached_body = _decode_response(cached_response)
+                await send({"type": "http.response.start", "status": status, "headers": headers + [(b"x-cache", b"HIT")]})
+                await send({"type": "http.response.body", "body": cached_body})
+                return
+
+        ttl = int(route.get("ttl", 3600))
+        max_size = int(route.get("max_size", 1048576))
+        is_storable = "no-store" not in request_cache_control
+        response_status = 0
+        response_headers: list[tuple[bytes, bytes]] = []
+        response_body: list[bytes] = []
+        response_size = 0
+
+        async def caching_send(message: Message) -> None:
+            nonlocal is_storable, response_status, response_headers, response_size
+
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                response_headers = list(message.get("headers", []))
+                is_storable = is_storable and response_status == 200 and b"no-store" not in Headers(raw=response_headers).get("cache-control", "").encode("latin-1")
+                message = {**message, "headers": response_headers + [(b"x-cache", b"MISS")]}
+
+            elif message["type"] == "http.response.body" and is_storable:
+                chunk = message.get("body", b"")
+                response_size += len(chunk)
+
+                if response_size > max_size:
+                    is_storable = False
+                    response_body.clear()
+                else:
+                    response_body.append(chunk)
+
+            await send(message)
+
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and is_storable:
+                is_storable = False
+                await self.backend.store(key, _encode_response(response_status, response_headers, b"".join(response_body)), ttl)
+
+        await self.app(scope, replay_receive, caching_send)
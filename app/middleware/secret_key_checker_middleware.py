@@ -2,31 +2,50 @@
     This is part of Astrologer API (C) 2023 Giacomo Battaglia
 """
 
+from typing import Union
+
 from starlette.datastructures import Headers
 from starlette.responses import JSONResponse
 from starlette.types import ASGIApp, Receive, Scope, Send
 import logging
 
+from ..utils.api_key_store import ApiKey, ApiKeyStore
+
+
 class SecretKeyCheckerMiddleware:
-    def __init__(self, app: ASGIApp, secret_key_name: str, secret_keys: list = []) -> None:
+    """
+    Lets through only the requests with a valid key in the secret_key_name header. The keys are the
+    secret_keys and those of the key_store; the metadata of the key (id, tier, limits) is attached to the
+    request as scope["state"]["api_key"], ie. request.state.api_key. The exempt_paths (eg. /metrics, for
+    the scraper, protected by its own key) are let through without a key.
+    """
+
+    def __init__(self, app: ASGIApp, secret_key_name: str, secret_keys: list = [], key_store: Union[ApiKeyStore, None] = None, exempt_paths: tuple[str, ...] = ()) -> None:
         self.app = app
-        self.secret_key_values = list(secret_keys)
         self.secret_key_name = secret_key_name
+        self.exempt_paths = exempt_paths
+        self.key_store = key_store or ApiKeyStore()
+
+        for index, key in enumerate(key for key in secret_keys if key):
+            self.key_store.add_static_key(key, ApiKey(id=f"secret-key-{index}"))
 
-        if not self.secret_key_name or not self.secret_key_values:
+        # With a keys file, the keys are checked even while it is empty or missing.
+        self.is_enabled = bool(self.secret_key_name) and (self.key_store.path is not None or len(self.key_store) > 0)
+
+        if not self.is_enabled:
             logging.critical("Secret key name or secret key values not set. The middleware will let all requests pass through!")
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket") or not self.is_enabled or scope.get("path") in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
         headers = Headers(scope=scope)
         header_key = headers.get(self.secret_key_name, "").split(":")[0]
-        is_valid_key = False
-
-        for key in self.secret_key_values:
-            if header_key == key:
-                is_valid_key = True
-                break
+        api_key = self.key_store.get(header_key)
 
-        if is_valid_key:
+        if api_key is not None:
+            scope.setdefault("state", {})["api_key"] = api_key
             await self.app(scope, receive, send)
 
         else:
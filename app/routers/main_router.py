@@ -1,41 +1,69 @@
 # External Libraries
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+import hmac
 from logging import getLogger
-from kerykeion import (
-    AstrologicalSubject, 
-    KerykeionChartSVG, 
-    SynastryAspects, 
-    NatalAspects, 
-    RelationshipScoreFactory, 
-    CompositeSubjectFactory
-)
-from kerykeion.settings.config_constants import DEFAULT_ACTIVE_POINTS, DEFAULT_ACTIVE_ASPECTS
+from pydantic import BaseModel
+from typing import Any, Callable, Union
 
 # Local
+from ..config.settings import settings
 from ..utils.internal_server_error_json_response import InternalServerErrorJsonResponse
 from ..utils.get_time_from_google import get_time_from_google
 from ..utils.write_request_to_log import get_write_request_to_log
+from ..utils.compute_pool import ComputePoolDrainingError, compute_pool
+from ..utils.single_flight import computations_single_flight
+from ..utils.cancellation import ClientDisconnectedError, ComputationTimeoutError, run_with_deadline
+from ..utils.request_hash import get_request_hash, get_result_version
+from ..utils.shared_memory_cache import SharedMemoryCache, get_shared_memory_cache
+from ..utils.query_request import get_query_parameters, get_request_model_from_query
+from ..utils.stage_timer import stage
+from ..utils.request_profiler import get_request_profiler
+from ..utils.readiness import clock_dependency, readiness
+from ..utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, computation_errors_total, render_metrics
+from ..utils.computations import (
+    compute_now,
+    compute_birth_data,
+    compute_birth_chart,
+    compute_synastry_chart,
+    compute_transit_chart,
+    compute_transit_aspects_data,
+    compute_synastry_aspects_data,
+    compute_natal_aspects_data,
+    compute_relationship_score,
+    compute_relationship_score_ranking,
+    compute_composite_chart,
+    compute_composite_aspects_data,
+    compute_lunar_phases_calendar,
+    compute_sign_ingresses_calendar,
+    compute_retrograde_stations_calendar,
+)
 from ..types.request_models import (
     BirthDataRequestModel,
     BirthChartRequestModel,
     SynastryChartRequestModel,
     TransitChartRequestModel,
     RelationshipScoreRequestModel,
+    RelationshipScoreRankingRequestModel,
     SynastryAspectsRequestModel,
     NatalAspectsRequestModel,
-    CompositeChartRequestModel
+    CompositeChartRequestModel,
+    CalendarRequestModel,
 )
 from ..types.response_models import (
     BirthDataResponseModel,
     BirthChartResponseModel,
     SynastryChartResponseModel,
     RelationshipScoreResponseModel,
+    RelationshipScoreRankingResponseModel,
     SynastryAspectsResponseModel,
     CompositeChartResponseModel,
     CompositeAspectsResponseModel,
     TransitAspectsResponseModel,
-    TransitChartResponseModel
+    TransitChartResponseModel,
+    LunarPhasesCalendarResponseModel,
+    SignIngressesCalendarResponseModel,
+    RetrogradeStationsCalendarResponseModel,
 )
 
 logger = getLogger(__name__)
@@ -45,30 +73,205 @@ router = APIRouter()
 
 GEONAMES_ERROR_MESSAGE = "City/Nation name error or invalid GeoNames username. Please check your username or city name and try again. You can create a free username here: https://www.geonames.org/login/. If you want to bypass the usage of GeoNames, please remove the geonames_username field from the request. Note: The nation field should be the country code (e.g. US, UK, FR, DE, etc.)."
 
-@router.get("/api/v4/health", response_description="Health check", include_in_schema=False)
-async def health(request: Request) -> JSONResponse:
+
+def get_compute_deadline(request: Request) -> float:
+    return settings.compute_deadlines.get(request.url.path, settings.compute_default_deadline)
+
+
+async def run_computation(request: Request, endpoint: str, request_model: BaseModel, compute: Callable[[Any], dict]) -> dict:
     """
-    Health check endpoint.
+    Runs the computation of an endpoint in the compute pool. Identical requests arriving while the
+    same computation is in flight share its result instead of computing it again, and the results are
+    shared with the other workers through the "results" shared cache. A profiled request always computes.
+
+    The computation is cancelled when all its requests went away: their clients disconnected or the
+    deadline of the endpoint (compute_deadlines) passed, see run_with_deadline.
     """
 
-    write_request_to_log(20, request, "Health check")
+    if get_request_profiler() is not None:
+        return await run_with_deadline(request, compute_pool.run(compute, request_model), get_compute_deadline(request))
+
+    key = get_request_hash(endpoint, request_model)
+    shared_cache = get_shared_memory_cache("results")
+
+    async def compute_or_share() -> dict:
+        if shared_cache is None:
+            return await compute_pool.run(compute, request_model)
+
+        # The results computed by the other workers are read on the event loop, without waiting in the pool.
+        response_content = shared_cache.get(key)
+        if response_content is not None:
+            return response_content
+
+        return await compute_pool.run(share_computation, shared_cache, key, compute, request_model)
+
+    return await run_with_deadline(request, computations_single_flight.run(key, compute_or_share), get_compute_deadline(request))
+
+
+def share_computation(shared_cache: SharedMemoryCache, key: str, compute: Callable[[Any], dict], request_model: BaseModel) -> dict:
+    response_content = compute(request_model)
+    shared_cache.set(key, response_content)
+
+    return response_content
+
+
+def get_json_response(response_content: dict, headers: Union[dict[str, str], None] = None) -> JSONResponse:
+    """
+    The response of a computation, timing its serialization as a stage of the request.
+    """
+
+    with stage("serialization"):
+        return JSONResponse(content=response_content, status_code=200, headers=headers)
+
+
+def is_etag_matching(request: Request, etag: str) -> bool:
+    """
+    Whether the If-None-Match header of the request matches the (strong) ETag.
+    """
+
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+
+    return "*" in candidates or etag in candidates
+
+
+async def run_cacheable_computation(request: Request, endpoint: str, request_model: BaseModel, compute: Callable[[Any], dict]) -> Response:
+    """
+    Runs the computation of a GET endpoint. The results only depend on the request and on the version
+    of the results, so the response carries their hash as ETag and can be cached by the clients and the
+    CDN; a conditional request with a matching ETag is answered with 304 before computing anything. A
+    deploy changing the results (see get_result_version) changes the ETags.
+    """
+
+    etag = f'"{get_result_version()}-{get_request_hash(endpoint, request_model)}"'
+    headers = {"ETag": etag, "Cache-Control": settings.get_cache_control}
+
+    if is_etag_matching(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        response_content = await run_computation(request, endpoint, request_model, compute)
+
+        return get_json_response(response_content, headers)
+
+    except Exception as e:
+        return get_error_json_response(request, e)
+
+
+def get_error_json_response(request: Request, e: Exception) -> JSONResponse:
+    """
+    The error response for an exception raised by a computation.
+    """
+
+    if isinstance(e, ComputePoolDrainingError):
+        write_request_to_log(30, request, e)
+
+        # Retried by the client (or the load balancer) on another worker
+        return JSONResponse(
+            content={
+                "status": "KO",
+                "message": "The server is shutting down, please retry the request.",
+            },
+            status_code=503,
+            headers={"Retry-After": "1", "Connection": "close"},
+        )
+
+    if isinstance(e, ClientDisconnectedError):
+        write_request_to_log(20, request, e)
+        computation_errors_total.inc((request.url.path, "disconnected"))
+
+        # Never received: the status is for the logs and the metrics (as "Client Closed Request").
+        return JSONResponse(content={"status": "KO", "message": str(e)}, status_code=499)
+
+    if isinstance(e, ComputationTimeoutError):
+        write_request_to_log(30, request, e)
+        computation_errors_total.inc((request.url.path, "timeout"))
+
+        return JSONResponse(
+            content={
+                "status": "KO",
+                "message": f"The computation took longer than the {e.deadline:g} seconds allowed for this endpoint. Please retry later or reduce the request (eg. fewer themes, variants or candidates).",
+            },
+            status_code=504,
+        )
+
+    write_request_to_log(40, request, e)
+
+    if "data found for this city" in str(e):
+        computation_errors_total.inc((request.url.path, "geonames"))
+
+        return JSONResponse(
+            content={
+                "status": "ERROR",
+                "message": GEONAMES_ERROR_MESSAGE,
+            },
+            status_code=400,
+        )
+
+    computation_errors_total.inc((request.url.path, "internal"))
+
+    return InternalServerErrorJsonResponse
+
+
+@router.get("/api/v4/health", response_description="Health check", include_in_schema=False)
+@router.get("/api/v4/health/live", response_description="Liveness check", include_in_schema=False)
+async def health() -> JSONResponse:
+    """
+    Liveness check endpoint: the worker is serving requests. The probes are logged (sampled) by the
+    request context middleware only.
+    """
 
     return JSONResponse(content={"status": "OK"}, status_code=200)
 
 
+@router.get("/api/v4/health/ready", response_description="Readiness check", include_in_schema=False)
+async def health_ready() -> JSONResponse:
+    """
+    Readiness check endpoint: 200 when the worker should receive traffic, 503 while it is warming up,
+    saturated (compute pool queue, event loop lag) or a required cache or dependency is failing, with
+    the report of the checks.
+    """
+
+    ready, report = readiness.get_report()
+
+    return JSONResponse(content=report, status_code=200 if ready else 503)
+
+
+@router.get("/metrics", response_description="Metrics", include_in_schema=False)
+async def metrics(request: Request) -> Response:
+    """
+    The metrics of the process in the Prometheus text format: requests, errors, durations of the
+    requests and of the stages, compute pool, caches and memory.
+
+    The endpoint is exempt from the API keys check: with metrics_key set (METRICS_KEY), the scraper sends
+    it as a bearer token, otherwise /metrics must be protected by the network policy.
+    """
+
+    if settings.metrics_key and not hmac.compare_digest(request.headers.get("authorization", "").encode("utf-8"), f"Bearer {settings.metrics_key}".encode("utf-8")):
+        return JSONResponse(status_code=401, content={"status": "KO", "message": "Unauthorized"}, headers={"WWW-Authenticate": "Bearer"})
+
+    return PlainTextResponse(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @router.get("/", response_description="Status of the API", response_model=BirthDataResponseModel, include_in_schema=False)
 async def status(request: Request) -> JSONResponse:
     """
     Returns the status of the API.
     """
 
-    from ..config.settings import settings
-
     write_request_to_log(20, request, "API is up and running")
     response_dict = {
         "status": "OK",
         "environment": settings.env_type,
         "debug": settings.debug,
+        "computations": {
+            "started": computations_single_flight.started,
+            "coalesced": computations_single_flight.coalesced,
+            "in_flight": computations_single_flight.in_flight,
+        },
     }
 
     return JSONResponse(content=response_dict, status_code=200)
@@ -96,84 +299,64 @@ async def get_now(request: Request) -> JSONResponse:
         }
     except Exception as e:
         write_request_to_log(40, request, e)
+        computation_errors_total.inc((request.url.path, "clock"))
+        clock_dependency.record(False)
         return InternalServerErrorJsonResponse
+    clock_dependency.record(True)
     logger.debug(f"Current UTC time: {datetime_dict}")
 
     try:
-        # On some Cloud providers, the time is not set correctly, so we need to get the current UTC time from the time API
-        today_subject = AstrologicalSubject(
-            city="GMT",
-            nation="UK",
-            lat=51.477928,
-            lng=-0.001545,
-            tz_str="GMT",
-            year=datetime_dict["year"],
-            month=datetime_dict["month"],
-            day=datetime_dict["day"],
-            hour=datetime_dict["hour"],
-            minute=datetime_dict["minute"],
-            online=False,
+        # The current sky is the same for all the requests of the same minute.
+        response_dict = await run_with_deadline(
+            request,
+            computations_single_flight.run(
+                ("now", datetime_dict["year"], datetime_dict["month"], datetime_dict["day"], datetime_dict["hour"], datetime_dict["minute"]),
+                lambda: compute_pool.run(compute_now, datetime_dict),
+            ),
+            get_compute_deadline(request),
         )
 
-        response_dict = {"status": "OK", "data": today_subject.model().model_dump()}
-
         return JSONResponse(content=response_dict, status_code=200)
 
     except Exception as e:
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+        return get_error_json_response(request, e)
 
 
 @router.post("/api/v4/birth-data", response_description="Birth data", response_model=BirthDataResponseModel)
 async def birth_data(birth_data_request: BirthDataRequestModel, request: Request):
     """
     Retrieve astrological data for a specific birth date. Does not include the chart nor the aspects.
+
+    Several house systems and sidereal modes can be compared in a single request with the
+    `houses_system_identifiers` and `sidereal_modes` fields: the planets are calculated once and the
+    variants are returned in `variants`, keyed as `<sidereal mode or Tropic>/<house system>`.
     """
 
     write_request_to_log(20, request, f"Birth data request")
 
-    subject = birth_data_request.subject
-
     try:
-        astrological_subject = AstrologicalSubject(
-            name=subject.name,
-            year=subject.year,
-            month=subject.month,
-            day=subject.day,
-            hour=subject.hour,
-            minute=subject.minute,
-            city=subject.city,
-            nation=subject.nation,
-            lat=subject.latitude,
-            lng=subject.longitude,
-            tz_str=subject.timezone,
-            zodiac_type=subject.zodiac_type, # type: ignore
-            sidereal_mode=subject.sidereal_mode,
-            houses_system_identifier=subject.houses_system_identifier, # type: ignore
-            perspective_type=subject.perspective_type, # type: ignore
-            geonames_username=subject.geonames_username,
-            online=True if subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "birth-data", birth_data_request, compute_birth_data)
 
-        data = astrological_subject.model().model_dump()
+        return get_json_response(response_content)
 
-        response_dict = {"status": "OK", "data": data}
+    except Exception as e:
+        return get_error_json_response(request, e)
 
-        return JSONResponse(content=response_dict, status_code=200)
 
-    except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
+@router.get("/api/v4/birth-data", response_description="Birth data", response_model=BirthDataResponseModel, openapi_extra={"parameters": get_query_parameters(BirthDataRequestModel)})
+async def get_birth_data(request: Request) -> Response:
+    """
+    Cacheable GET version of the POST endpoint, with the same validation and results. The subject fields
+    are query parameters, eg. `?name=John&year=1980&month=12&day=12&hour=12&minute=12&longitude=0&latitude=51.4&timezone=Europe/London`;
+    lists are repeated parameters, eg. `active_points=Sun&active_points=Moon`, and active aspects are written
+    as `<name>:<orb>`, eg. `active_aspects=conjunction:10`.
+    """
 
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+    write_request_to_log(20, request, f"Birth data GET request")
+
+    request_model = get_request_model_from_query(BirthDataRequestModel, request.query_params)
+
+    return await run_cacheable_computation(request, "birth-data", request_model, compute_birth_data)
 
 
 @router.post("/api/v4/birth-chart", response_description="Birth chart", response_model=BirthChartResponseModel)
@@ -184,68 +367,29 @@ async def birth_chart(request_body: BirthChartRequestModel, request: Request):
 
     write_request_to_log(20, request, f"Birth chart request")
 
-    subject = request_body.subject
-
     try:
-        astrological_subject = AstrologicalSubject(
-            name=subject.name,
-            year=subject.year,
-            month=subject.month,
-            day=subject.day,
-            hour=subject.hour,
-            minute=subject.minute,
-            city=subject.city,
-            nation=subject.nation,
-            lat=subject.latitude,
-            lng=subject.longitude,
-            tz_str=subject.timezone,
-            zodiac_type=subject.zodiac_type, # type: ignore
-            sidereal_mode=subject.sidereal_mode,
-            houses_system_identifier=subject.houses_system_identifier, # type: ignore
-            perspective_type=subject.perspective_type, # type: ignore
-            geonames_username=subject.geonames_username,
-            online=True if subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "birth-chart", request_body, compute_birth_chart)
 
-        data = astrological_subject.model().model_dump()
+        return get_json_response(response_content)
 
-        kerykeion_chart = KerykeionChartSVG(
-            astrological_subject,
-            theme=request_body.theme,
-            chart_language=request_body.language or "EN",
-            active_points=request_body.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=request_body.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        )
+    except Exception as e:
+        return get_error_json_response(request, e)
 
-        if request_body.wheel_only:
-            svg = kerykeion_chart.makeWheelOnlyTemplate(minify=True)
-        else:
-            svg = kerykeion_chart.makeTemplate(minify=True)
 
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "chart": svg,
-                "data": data,
-                "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list]
-            },
-            status_code=200,
-        )
+@router.get("/api/v4/birth-chart", response_description="Birth chart", response_model=BirthChartResponseModel, openapi_extra={"parameters": get_query_parameters(BirthChartRequestModel)})
+async def get_birth_chart(request: Request) -> Response:
+    """
+    Cacheable GET version of the POST endpoint, with the same validation and results. The subject fields
+    are query parameters, eg. `?name=John&year=1980&month=12&day=12&hour=12&minute=12&longitude=0&latitude=51.4&timezone=Europe/London`;
+    lists are repeated parameters, eg. `active_points=Sun&active_points=Moon`, and active aspects are written
+    as `<name>:<orb>`, eg. `active_aspects=conjunction:10`.
+    """
 
-    except Exception as e:
-        # If error contains "wrong username"
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
+    write_request_to_log(20, request, f"Birth chart GET request")
 
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+    request_model = get_request_model_from_query(BirthChartRequestModel, request.query_params)
+
+    return await run_cacheable_computation(request, "birth-chart", request_model, compute_birth_chart)
 
 
 @router.post("/api/v4/synastry-chart", response_description="Synastry data", response_model=SynastryChartResponseModel)
@@ -256,91 +400,13 @@ async def synastry_chart(synastry_chart_request: SynastryChartRequestModel, requ
 
     write_request_to_log(20, request, f"Synastry chart request")
 
-    first_subject = synastry_chart_request.first_subject
-    second_subject = synastry_chart_request.second_subject
-
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
-
-        second_astrological_subject = AstrologicalSubject(
-            name=second_subject.name,
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=second_subject.zodiac_type, # type: ignore
-            sidereal_mode=second_subject.sidereal_mode,
-            houses_system_identifier=second_subject.houses_system_identifier, # type: ignore
-            perspective_type=second_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "synastry-chart", synastry_chart_request, compute_synastry_chart)
 
-        kerykeion_chart = KerykeionChartSVG(
-            first_astrological_subject,
-            second_obj=second_astrological_subject,
-            chart_type="Synastry",
-            theme=synastry_chart_request.theme,
-            chart_language=synastry_chart_request.language or "EN",
-            active_points=synastry_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=synastry_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        )
-
-        if synastry_chart_request.wheel_only:
-            svg = kerykeion_chart.makeWheelOnlyTemplate(minify=True)
-        else:
-            svg = kerykeion_chart.makeTemplate(minify=True)
-
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "chart": svg,
-                "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
-                "data": {
-                    "first_subject": first_astrological_subject.model().model_dump(),
-                    "second_subject": second_astrological_subject.model().model_dump(),
-                },
-            },
-            status_code=200,
-        )
+        return get_json_response(response_content)
 
     except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
-
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+        return get_error_json_response(request, e)
 
 
 @router.post("/api/v4/transit-chart", response_description="Transit data", response_model=TransitChartResponseModel)
@@ -351,91 +417,13 @@ async def transit_chart(transit_chart_request: TransitChartRequestModel, request
 
     write_request_to_log(20, request, f"Transit chart request")
 
-    first_subject = transit_chart_request.first_subject
-    second_subject = transit_chart_request.transit_subject
-
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "transit-chart", transit_chart_request, compute_transit_chart)
 
-        second_astrological_subject = AstrologicalSubject(
-            name="Transit",
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=first_astrological_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
-
-        kerykeion_chart = KerykeionChartSVG(
-            first_astrological_subject,
-            second_obj=second_astrological_subject,
-            chart_type="Transit",
-            theme=transit_chart_request.theme,
-            chart_language=transit_chart_request.language or "EN",
-            active_points=transit_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=transit_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        )
-
-        if transit_chart_request.wheel_only:
-            svg = kerykeion_chart.makeWheelOnlyTemplate(minify=True)
-        else:
-            svg = kerykeion_chart.makeTemplate(minify=True)
-
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "chart": svg,
-                "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
-                "data": {
-                    "subject": first_astrological_subject.model().model_dump(),
-                    "transit": second_astrological_subject.model().model_dump(),
-                },
-            },
-            status_code=200,
-        )
+        return get_json_response(response_content)
 
     except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
-
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+        return get_error_json_response(request, e)
 
 
 @router.post("/api/v4/transit-aspects-data", response_description="Transit aspects data", response_model=TransitAspectsResponseModel)
@@ -446,82 +434,13 @@ async def transit_aspects_data(transit_chart_request: TransitChartRequestModel,
 
     write_request_to_log(20, request, f"Transit aspects data request")
 
-    first_subject = transit_chart_request.first_subject
-    second_subject = transit_chart_request.transit_subject
-
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
-
-        second_astrological_subject = AstrologicalSubject(
-            name="Transit",
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=first_astrological_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "transit-aspects-data", transit_chart_request, compute_transit_aspects_data)
 
-        aspects = SynastryAspects(
-            first_astrological_subject,
-            second_astrological_subject,
-            active_points=transit_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=transit_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        ).relevant_aspects
-
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "data": {
-                    "subject": first_astrological_subject.model().model_dump(),
-                    "transit": second_astrological_subject.model().model_dump(),
-                },
-                "aspects": [aspect.model_dump() for aspect in aspects],
-            },
-            status_code=200,
-        )
+        return get_json_response(response_content)
 
     except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
-
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+        return get_error_json_response(request, e)
 
 
 @router.post("/api/v4/synastry-aspects-data", response_description="Synastry aspects data", response_model=SynastryAspectsResponseModel)
@@ -532,82 +451,29 @@ async def synastry_aspects_data(aspects_request_content: SynastryAspectsRequestM
 
     write_request_to_log(20, request, f"Synastry aspects data request")
 
-    first_subject = aspects_request_content.first_subject
-    second_subject = aspects_request_content.second_subject
-
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "synastry-aspects-data", aspects_request_content, compute_synastry_aspects_data)
 
-        second_astrological_subject = AstrologicalSubject(
-            name=second_subject.name,
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=second_subject.zodiac_type, # type: ignore
-            sidereal_mode=second_subject.sidereal_mode,
-            houses_system_identifier=second_subject.houses_system_identifier, # type: ignore
-            perspective_type=second_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
+        return get_json_response(response_content)
 
-        aspects = SynastryAspects(
-            first_astrological_subject,
-            second_astrological_subject,
-            active_points=aspects_request_content.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=aspects_request_content.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        ).relevant_aspects
+    except Exception as e:
+        return get_error_json_response(request, e)
 
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "data": {
-                    "first_subject": first_astrological_subject.model().model_dump(),
-                    "second_subject": second_astrological_subject.model().model_dump(),
-                },
-                "aspects": [aspect.model_dump() for aspect in aspects],
-            },
-            status_code=200,
-        )
 
-    except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
+@router.get("/api/v4/synastry-aspects-data", response_description="Synastry aspects data", response_model=SynastryAspectsResponseModel, openapi_extra={"parameters": get_query_parameters(SynastryAspectsRequestModel)})
+async def get_synastry_aspects_data(request: Request) -> Response:
+    """
+    Cacheable GET version of the POST endpoint, with the same validation and results. The subjects fields
+    are query parameters prefixed with `first_` and `second_`, eg. `?first_name=John&first_year=1980&...&second_name=Jane&second_year=1985&...`;
+    lists are repeated parameters, eg. `active_points=Sun&active_points=Moon`, and active aspects are written
+    as `<name>:<orb>`, eg. `active_aspects=conjunction:10`.
+    """
 
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+    write_request_to_log(20, request, f"Synastry aspects data GET request")
+
+    request_model = get_request_model_from_query(SynastryAspectsRequestModel, request.query_params)
+
+    return await run_cacheable_computation(request, "synastry-aspects-data", request_model, compute_synastry_aspects_data)
 
 
 @router.post("/api/v4/natal-aspects-data", response_description="Birth aspects data", response_model=SynastryAspectsResponseModel)
@@ -618,57 +484,29 @@ async def natal_aspects_data(aspects_request_content: NatalAspectsRequestModel,
 
     write_request_to_log(20, request, f"Natal aspects data request")
 
-    subject = aspects_request_content.subject
-
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=subject.name,
-            year=subject.year,
-            month=subject.month,
-            day=subject.day,
-            hour=subject.hour,
-            minute=subject.minute,
-            city=subject.city,
-            nation=subject.nation,
-            lat=subject.latitude,
-            lng=subject.longitude,
-            tz_str=subject.timezone,
-            zodiac_type=subject.zodiac_type, # type: ignore
-            sidereal_mode=subject.sidereal_mode,
-            houses_system_identifier=subject.houses_system_identifier, # type: ignore
-            perspective_type=subject.perspective_type, # type: ignore
-            geonames_username=subject.geonames_username,
-            online=True if subject.geonames_username else False,
-        )
-
-        aspects = NatalAspects(
-            first_astrological_subject,
-            active_points=aspects_request_content.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=aspects_request_content.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        ).relevant_aspects
+        response_content = await run_computation(request, "natal-aspects-data", aspects_request_content, compute_natal_aspects_data)
 
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "data": {"subject": first_astrological_subject.model().model_dump()},
-                "aspects": [aspect.model_dump() for aspect in aspects],
-            },
-            status_code=200,
-        )
+        return get_json_response(response_content)
 
     except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
+        return get_error_json_response(request, e)
 
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+
+@router.get("/api/v4/natal-aspects-data", response_description="Birth aspects data", response_model=SynastryAspectsResponseModel, openapi_extra={"parameters": get_query_parameters(NatalAspectsRequestModel)})
+async def get_natal_aspects_data(request: Request) -> Response:
+    """
+    Cacheable GET version of the POST endpoint, with the same validation and results. The subject fields
+    are query parameters, eg. `?name=John&year=1980&month=12&day=12&hour=12&minute=12&longitude=0&latitude=51.4&timezone=Europe/London`;
+    lists are repeated parameters, eg. `active_points=Sun&active_points=Moon`, and active aspects are written
+    as `<name>:<orb>`, eg. `active_aspects=conjunction:10`.
+    """
+
+    write_request_to_log(20, request, f"Natal aspects data GET request")
+
+    request_model = get_request_model_from_query(NatalAspectsRequestModel, request.query_params)
+
+    return await run_cacheable_computation(request, "natal-aspects-data", request_model, compute_natal_aspects_data)
 
 
 @router.post("/api/v4/relationship-score", response_description="Relationship score", response_model=RelationshipScoreResponseModel)
@@ -689,80 +527,38 @@ async def relationship_score(relationship_score_request: RelationshipScoreReques
 
     first_subject = relationship_score_request.first_subject
     second_subject = relationship_score_request.second_subject
-
     write_request_to_log(20, request, f"Getting composite data for: {first_subject} and {second_subject}")
 
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "relationship-score", relationship_score_request, compute_relationship_score)
 
-        second_astrological_subject = AstrologicalSubject(
-            name=second_subject.name,
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=second_subject.zodiac_type, # type: ignore
-            sidereal_mode=second_subject.sidereal_mode,
-            houses_system_identifier=second_subject.houses_system_identifier, # type: ignore
-            perspective_type=second_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
+        return get_json_response(response_content)
 
-        score_factory = RelationshipScoreFactory(first_astrological_subject, second_astrological_subject)
-        score_model = score_factory.get_relationship_score()
-
-        response_content = {
-            "status": "OK",
-            "score": score_model.score_value,
-            "score_description": score_model.score_description,
-            "is_destiny_sign": score_model.is_destiny_sign,
-            "aspects": [aspect.model_dump() for aspect in score_model.aspects],
-            "data": {
-                "first_subject": first_astrological_subject.model().model_dump(),
-                "second_subject": second_astrological_subject.model().model_dump(),
-            },
-        }
+    except Exception as e:
+        return get_error_json_response(request, e)
 
-        return JSONResponse(content=response_content, status_code=200)
 
-    except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
+@router.post("/api/v4/relationship-score-ranking", response_description="Relationship score ranking", response_model=RelationshipScoreRankingResponseModel)
+async def relationship_score_ranking(ranking_request: RelationshipScoreRankingRequestModel, request: Request) -> JSONResponse:
+    """
+    Ranks a list of candidates by their relationship score with a subject and returns the best matches.
+    The scores are the same returned by the Relationship Score endpoint (Ciro Discepolo method).
 
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+    Candidates that can not reach the best matches, judging by their planetary positions alone, are discarded
+    before being fully scored, so the endpoint scales to large candidate lists. Up to 50000 candidates can be
+    sent, each with its subject or with the positions returned for it by the Birth Data endpoint: a candidate
+    sent with its positions costs no computation of its chart.
+    """
+
+    write_request_to_log(20, request, f"Relationship score ranking request for {len(ranking_request.candidates)} candidates")
+
+    try:
+        response_content = await run_computation(request, "relationship-score-ranking", ranking_request, compute_relationship_score_ranking)
+
+        return get_json_response(response_content)
+
+    except Exception as e:
+        return get_error_json_response(request, e)
 
 
 @router.post("/api/v4/composite-chart", response_description="Composite data", response_model=CompositeChartResponseModel)
@@ -774,96 +570,15 @@ async def composite_chart(composite_chart_request: CompositeChartRequestModel, r
 
     first_subject = composite_chart_request.first_subject
     second_subject = composite_chart_request.second_subject
-
     write_request_to_log(20, request, f"Getting composite data for: {first_subject} and {second_subject}")
 
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
-
-        second_astrological_subject = AstrologicalSubject(
-            name=second_subject.name,
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=second_subject.zodiac_type, # type: ignore
-            sidereal_mode=second_subject.sidereal_mode,
-            houses_system_identifier=second_subject.houses_system_identifier, # type: ignore
-            perspective_type=second_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
-
-        composite_factory = CompositeSubjectFactory(first_astrological_subject, second_astrological_subject)
-        composite_subject = composite_factory.get_midpoint_composite_subject_model()
-
-        kerykeion_chart = KerykeionChartSVG(
-            composite_subject,
-            chart_type="Composite",
-            theme=composite_chart_request.theme
-        )
-
-        if composite_chart_request.wheel_only:
-            svg = kerykeion_chart.makeWheelOnlyTemplate(minify=True)
-        else:
-            svg = kerykeion_chart.makeTemplate(minify=True)
-
-        composite_subject_dict = composite_subject.model_dump()
-        for key in ["first_subject", "second_subject"]:
-            if key in composite_subject_dict:
-                composite_subject_dict.pop(key)
+        response_content = await run_computation(request, "composite-chart", composite_chart_request, compute_composite_chart)
 
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "chart": svg,
-                "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
-                "data": {
-                    "composite_subject": composite_subject_dict,
-                    "first_subject": first_astrological_subject.model().model_dump(),
-                    "second_subject": second_astrological_subject.model().model_dump(),
-                },
-            },
-            status_code=200,
-        )
+        return get_json_response(response_content)
 
     except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
-
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
+        return get_error_json_response(request, e)
 
 
 @router.post("/api/v4/composite-aspects-data", response_description="Composite aspects data", response_model=CompositeAspectsResponseModel)
@@ -874,86 +589,80 @@ async def composite_aspects_data(composite_chart_request: CompositeChartRequestM
 
     first_subject = composite_chart_request.first_subject
     second_subject = composite_chart_request.second_subject
-
     write_request_to_log(20, request, f"Getting composite data for: {first_subject} and {second_subject}")
 
     try:
-        first_astrological_subject = AstrologicalSubject(
-            name=first_subject.name,
-            year=first_subject.year,
-            month=first_subject.month,
-            day=first_subject.day,
-            hour=first_subject.hour,
-            minute=first_subject.minute,
-            city=first_subject.city,
-            nation=first_subject.nation,
-            lat=first_subject.latitude,
-            lng=first_subject.longitude,
-            tz_str=first_subject.timezone,
-            zodiac_type=first_subject.zodiac_type, # type: ignore
-            sidereal_mode=first_subject.sidereal_mode,
-            houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
-            perspective_type=first_subject.perspective_type, # type: ignore
-            geonames_username=first_subject.geonames_username,
-            online=True if first_subject.geonames_username else False,
-        )
+        response_content = await run_computation(request, "composite-aspects-data", composite_chart_request, compute_composite_aspects_data)
 
-        second_astrological_subject = AstrologicalSubject(
-            name=second_subject.name,
-            year=second_subject.year,
-            month=second_subject.month,
-            day=second_subject.day,
-            hour=second_subject.hour,
-            minute=second_subject.minute,
-            city=second_subject.city,
-            nation=second_subject.nation,
-            lat=second_subject.latitude,
-            lng=second_subject.longitude,
-            tz_str=second_subject.timezone,
-            zodiac_type=second_subject.zodiac_type, # type: ignore
-            sidereal_mode=second_subject.sidereal_mode,
-            houses_system_identifier=second_subject.houses_system_identifier, # type: ignore
-            perspective_type=second_subject.perspective_type, # type: ignore
-            geonames_username=second_subject.geonames_username,
-            online=True if second_subject.geonames_username else False,
-        )
+        return get_json_response(response_content)
 
-        composite_factory = CompositeSubjectFactory(first_astrological_subject, second_astrological_subject)
-        composite_data = composite_factory.get_midpoint_composite_subject_model()
-        aspects = NatalAspects(
-            composite_data,
-            active_points=composite_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
-            active_aspects=composite_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
-        ).relevant_aspects
+    except Exception as e:
+        return get_error_json_response(request, e)
 
-        composite_subject_dict = composite_data.model_dump()
-        for key in ["first_subject", "second_subject"]:
-            if key in composite_subject_dict:
-                composite_subject_dict.pop(key)
 
-        return JSONResponse(
-            content={
-                "status": "OK",
-                "data": {
-                    "composite_subject": composite_subject_dict,
-                    "first_subject": first_astrological_subject.model().model_dump(),
-                    "second_subject": second_astrological_subject.model().model_dump(),
-                },
-                "aspects": [aspect.model_dump() for aspect in aspects],
-            },
-            status_code=200,
-        )
+@router.get("/api/v4/composite-aspects-data", response_description="Composite aspects data", response_model=CompositeAspectsResponseModel, openapi_extra={"parameters": get_query_parameters(CompositeChartRequestModel)})
+async def get_composite_aspects_data(request: Request) -> Response:
+    """
+    Cacheable GET version of the POST endpoint, with the same validation and results. The subjects fields
+    are query parameters prefixed with `first_` and `second_`, eg. `?first_name=John&first_year=1980&...&second_name=Jane&second_year=1985&...`;
+    lists are repeated parameters, eg. `active_points=Sun&active_points=Moon`, and active aspects are written
+    as `<name>:<orb>`, eg. `active_aspects=conjunction:10`.
+    """
+
+    write_request_to_log(20, request, f"Composite aspects data GET request")
+
+    request_model = get_request_model_from_query(CompositeChartRequestModel, request.query_params)
+
+    return await run_cacheable_computation(request, "composite-aspects-data", request_model, compute_composite_aspects_data)
+
+
+@router.post("/api/v4/lunar-phases-calendar", response_description="Lunar phases calendar", response_model=LunarPhasesCalendarResponseModel)
+async def lunar_phases_calendar(calendar_request: CalendarRequestModel, request: Request) -> JSONResponse:
+    """
+    Retrieves the New Moons, First Quarters, Full Moons and Last Quarters of a range of months, and the lunar phase
+    of every day. The calendar is read from tables calculated once per year, so a whole year costs as a single lookup.
+    """
+
+    write_request_to_log(20, request, f"Lunar phases calendar request")
+
+    try:
+        response_content = await run_computation(request, "lunar-phases-calendar", calendar_request, compute_lunar_phases_calendar)
+
+        return get_json_response(response_content)
 
     except Exception as e:
-        if "data found for this city" in str(e):
-            write_request_to_log(40, request, e)
-            return JSONResponse(
-                content={
-                    "status": "ERROR",
-                    "message": GEONAMES_ERROR_MESSAGE,
-                },
-                status_code=400,
-            )
+        return get_error_json_response(request, e)
 
-        write_request_to_log(40, request, e)
-        return InternalServerErrorJsonResponse
\ No newline at end of file
+
+@router.post("/api/v4/sign-ingresses-calendar", response_description="Sign ingresses calendar", response_model=SignIngressesCalendarResponseModel)
+async def sign_ingresses_calendar(calendar_request: CalendarRequestModel, request: Request) -> JSONResponse:
+    """
+    Retrieves the dates when the planets, from the Sun to Pluto, enter a new sign in a range of months.
+    """
+
+    write_request_to_log(20, request, f"Sign ingresses calendar request")
+
+    try:
+        response_content = await run_computation(request, "sign-ingresses-calendar", calendar_request, compute_sign_ingresses_calendar)
+
+        return get_json_response(response_content)
+
+    except Exception as e:
+        return get_error_json_response(request, e)
+
+
+@router.post("/api/v4/retrograde-stations-calendar", response_description="Retrograde stations calendar", response_model=RetrogradeStationsCalendarResponseModel)
+async def retrograde_stations_calendar(calendar_request: CalendarRequestModel, request: Request) -> JSONResponse:
+    """
+    Retrieves the dates when the planets, from Mercury to Pluto, station retrograde or direct in a range of months.
+    """
+
+    write_request_to_log(20, request, f"Retrograde stations calendar request")
+
+    try:
+        response_content = await run_computation(request, "retrograde-stations-calendar", calendar_request, compute_retrograde_stations_calendar)
+
+        return get_json_response(response_content)
+
+    except Exception as e:
+        return get_error_json_response(request, e)
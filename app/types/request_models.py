@@ -1,11 +1,12 @@
 from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, get_args, Union
 from kerykeion.kr_types.kr_models import ActiveAspect
-from pytz import all_timezones
-from kerykeion.kr_types.kr_literals import KerykeionChartTheme, KerykeionChartLanguage, SiderealMode, ZodiacType, HousesSystemIdentifier, PerspectiveType, AxialCusps, Planet
+from kerykeion.kr_types.kr_literals import KerykeionChartTheme, KerykeionChartLanguage, SiderealMode, ZodiacType, HousesSystemIdentifier, PerspectiveType, AxialCusps, Planet, Quality
 from kerykeion.settings.config_constants import DEFAULT_ACTIVE_POINTS, DEFAULT_ACTIVE_ASPECTS
 from abc import ABC
 
+from ..utils.timezones import is_valid_timezone, get_timezone_from_coordinates
+
 class AbstractBaseSubjectModel(BaseModel, ABC):
     year: int = Field(description="The year of birth.", examples=[1980])
     month: int = Field(description="The month of birth.", examples=[12])
@@ -40,7 +41,7 @@ class AbstractBaseSubjectModel(BaseModel, ABC):
     def validate_timezone(cls, value):
         if value is None:
             return None
-        if value not in all_timezones:
+        if not is_valid_timezone(value):
             raise ValueError(f"Invalid timezone '{value}'. Please use a valid timezone. You can find a list of valid timezones at https://en.wikipedia.org/wiki/List_of_tz_database_time_zones.")
         return value
 
@@ -110,6 +111,10 @@ class AbstractBaseSubjectModel(BaseModel, ABC):
         tz = self.timezone
         geonames = self.geonames_username
 
+        # Without the timezone, it is resolved offline from the coordinates when possible
+        if lat is not None and lng is not None and tz is None and not geonames:
+            tz = self.timezone = get_timezone_from_coordinates(lat, lng)
+
         # If latitude, longitude, and timezone are all missing, geonames_username must be provided
         if lat is None and lng is None and tz is None:
             if not geonames:
@@ -207,6 +212,8 @@ class BirthChartRequestModel(BaseModel):
     theme: Optional[KerykeionChartTheme] = Field(default="classic", description="The theme of the chart.", examples=["classic", "light", "dark", "dark-high-contrast"])
     language: Optional[KerykeionChartLanguage] = Field(default="EN", description="The language of the chart.", examples=list(get_args(KerykeionChartLanguage)))
     wheel_only: Optional[bool] = Field(default=False, description="If set to True, only the zodiac wheel will be returned. No additional information will be displayed.")
+    themes: Optional[list[KerykeionChartTheme]] = Field(default=None, description="Additional themes to render the chart in, returned in 'charts'. The chart is calculated only once for all of them.", examples=[["dark", "light"]])
+    languages: Optional[list[KerykeionChartLanguage]] = Field(default=None, description="Additional languages to render the chart in, returned in 'charts'. Combined with every theme requested.", examples=[["IT", "ES"]])
     active_points: Optional[list[Union[Planet, AxialCusps]]] = Field(default=DEFAULT_ACTIVE_POINTS, description="The active points to display in the chart.", examples=[DEFAULT_ACTIVE_POINTS])
     active_aspects: Optional[list[ActiveAspect]] = Field(default=DEFAULT_ACTIVE_ASPECTS, description="The active aspects to display in the chart.", examples=[DEFAULT_ACTIVE_ASPECTS])
 
@@ -220,6 +227,8 @@ class SynastryChartRequestModel(BaseModel):
     theme: Optional[KerykeionChartTheme] = Field(default="classic", description="The theme of the chart.", examples=["classic", "light", "dark", "dark-high-contrast"])
     language: Optional[KerykeionChartLanguage] = Field(default="EN", description="The language of the chart.", examples=list(get_args(KerykeionChartLanguage)))
     wheel_only: Optional[bool] = Field(default=False, description="If set to True, only the zodiac wheel will be returned. No additional information will be displayed.")
+    themes: Optional[list[KerykeionChartTheme]] = Field(default=None, description="Additional themes to render the chart in, returned in 'charts'. The chart is calculated only once for all of them.", examples=[["dark", "light"]])
+    languages: Optional[list[KerykeionChartLanguage]] = Field(default=None, description="Additional languages to render the chart in, returned in 'charts'. Combined with every theme requested.", examples=[["IT", "ES"]])
     active_points: Optional[list[Union[Planet, AxialCusps]]] = Field(default=DEFAULT_ACTIVE_POINTS, description="The active points to display in the chart.", examples=[DEFAULT_ACTIVE_POINTS])
     active_aspects: Optional[list[ActiveAspect]] = Field(default=DEFAULT_ACTIVE_ASPECTS, description="The active aspects to display in the chart.", examples=[DEFAULT_ACTIVE_ASPECTS])
 
@@ -233,6 +242,8 @@ class TransitChartRequestModel(BaseModel):
     theme: Optional[KerykeionChartTheme] = Field(default="classic", description="The theme of the chart.", examples=["classic", "light", "dark", "dark-high-contrast"])
     language: Optional[KerykeionChartLanguage] = Field(default="EN", description="The language of the chart.", examples=list(get_args(KerykeionChartLanguage)))
     wheel_only: Optional[bool] = Field(default=False, description="If set to True, only the zodiac wheel will be returned. No additional information will be displayed.")
+    themes: Optional[list[KerykeionChartTheme]] = Field(default=None, description="Additional themes to render the chart in, returned in 'charts'. The chart is calculated only once for all of them.", examples=[["dark", "light"]])
+    languages: Optional[list[KerykeionChartLanguage]] = Field(default=None, description="Additional languages to render the chart in, returned in 'charts'. Combined with every theme requested.", examples=[["IT", "ES"]])
     active_points: Optional[list[Union[Planet, AxialCusps]]] = Field(default=DEFAULT_ACTIVE_POINTS, description="The active points to display in the chart.", examples=[DEFAULT_ACTIVE_POINTS])
     active_aspects: Optional[list[ActiveAspect]] = Field(default=DEFAULT_ACTIVE_ASPECTS, description="The active aspects to display in the chart.", examples=[DEFAULT_ACTIVE_ASPECTS])
 
@@ -242,6 +253,16 @@ class BirthDataRequestModel(BaseModel):
     """
 
     subject: SubjectModel = Field(description="The name of the person to get the Birth Chart for.")
+    houses_system_identifiers: Optional[list[HousesSystemIdentifier]] = Field(
+        default=None,
+        description="Additional house systems to return, as variants of the subject. The planets are calculated only once for all the variants.",
+        examples=[["P", "K", "W"]],
+    )
+    sidereal_modes: Optional[list[SiderealMode]] = Field(
+        default=None,
+        description="Additional sidereal modes to return, as variants of the subject. Combined with every house system requested.",
+        examples=[["LAHIRI", "RAMAN"]],
+    )
 
 
 class RelationshipScoreRequestModel(BaseModel):
@@ -253,6 +274,47 @@ class RelationshipScoreRequestModel(BaseModel):
     second_subject: SubjectModel = Field(description="The name of the person to get the Birth Chart for.")
 
 
+class RelationshipScorePositionsModel(BaseModel):
+    """
+    The positions of a candidate of the Relationship Score Ranking endpoint, as returned for its subject by
+    the Birth Data endpoint: they can be stored with the profile and sent instead of the subject.
+    """
+
+    sun: float = Field(ge=0, lt=360, description="The absolute position of the Sun (subject.sun.abs_pos).", examples=[85.0])
+    moon: float = Field(ge=0, lt=360, description="The absolute position of the Moon (subject.moon.abs_pos).", examples=[10.5])
+    venus: float = Field(ge=0, lt=360, description="The absolute position of Venus (subject.venus.abs_pos).", examples=[120.3])
+    mars: float = Field(ge=0, lt=360, description="The absolute position of Mars (subject.mars.abs_pos).", examples=[140.8])
+    ascendant: float = Field(ge=0, lt=360, description="The absolute position of the Ascendant (subject.ascendant.abs_pos).", examples=[160.2])
+    sun_quality: Quality = Field(description="The quality of the sign of the Sun (subject.sun.quality).", examples=["Mutable"])
+
+
+class RelationshipScoreCandidateModel(BaseModel):
+    """
+    A candidate of the Relationship Score Ranking endpoint, with either its subject or its positions.
+    """
+
+    id: str = Field(description="The identifier of the candidate, returned as is in the ranking.", examples=["profile-1"])
+    subject: Optional[SubjectModel] = Field(default=None, description="The data of the candidate.")
+    positions: Optional[RelationshipScorePositionsModel] = Field(default=None, description="The positions of the candidate, computed once with the Birth Data endpoint: nothing is computed for the candidate.")
+
+    @model_validator(mode="after")
+    def check_subject_or_positions(self):
+        if (self.subject is None) == (self.positions is None):
+            raise ValueError("Provide either the subject or the positions of the candidate.")
+
+        return self
+
+
+class RelationshipScoreRankingRequestModel(BaseModel):
+    """
+    The request model for the Relationship Score Ranking endpoint.
+    """
+
+    subject: SubjectModel = Field(description="The subject to find the best matches for.")
+    candidates: list[RelationshipScoreCandidateModel] = Field(description="The candidates to rank against the subject, at most 50000. Large lists should send the positions of the candidates.", min_length=1, max_length=50000)
+    top_k: int = Field(default=10, ge=1, description="The number of best matches to return.", examples=[10])
+
+
 class SynastryAspectsRequestModel(BaseModel):
     """
     The request model for the Aspects endpoint.
@@ -283,5 +345,48 @@ class CompositeChartRequestModel(BaseModel):
     theme: Optional[KerykeionChartTheme] = Field(default="classic", description="The theme of the chart.", examples=["classic", "light", "dark", "dark-high-contrast"])
     language: Optional[KerykeionChartLanguage] = Field(default="EN", description="The language of the chart.", examples=list(get_args(KerykeionChartLanguage)))
     wheel_only: Optional[bool] = Field(default=False, description="If set to True, only the zodiac wheel will be returned. No additional information will be displayed.")
+    themes: Optional[list[KerykeionChartTheme]] = Field(default=None, description="Additional themes to render the chart in, returned in 'charts'. The chart is calculated only once for all of them.", examples=[["dark", "light"]])
+    languages: Optional[list[KerykeionChartLanguage]] = Field(default=None, description="Additional languages to render the chart in, returned in 'charts'. Combined with every theme requested.", examples=[["IT", "ES"]])
     active_points: Optional[list[Union[Planet, AxialCusps]]] = Field(default=DEFAULT_ACTIVE_POINTS, description="The active points to display in the chart.", examples=[DEFAULT_ACTIVE_POINTS])
     active_aspects: Optional[list[ActiveAspect]] = Field(default=DEFAULT_ACTIVE_ASPECTS, description="The active aspects to display in the chart.", examples=[DEFAULT_ACTIVE_ASPECTS])
+
+
+class CalendarRequestModel(BaseModel):
+    """
+    The request model for the Calendar endpoints.
+    """
+
+    start_year: int = Field(description="The year of the first month of the calendar.", examples=[2024])
+    start_month: int = Field(default=1, description="The first month of the calendar.", examples=[1])
+    end_year: int = Field(description="The year of the last month of the calendar.", examples=[2024])
+    end_month: int = Field(default=12, description="The last month of the calendar (included).", examples=[12])
+    timezone: str = Field(default="UTC", description="The timezone of the dates of the calendar.", examples=["Europe/London"])
+    sidereal_mode: Optional[SiderealMode] = Field(default=None, description="The sidereal mode of the sign ingresses and lunar phases. Tropical if not set.", examples=[None])
+
+    @field_validator("start_year", "end_year")
+    def validate_year(cls, value):
+        if value < 1800 or value > 2100:
+            raise ValueError(f"Invalid year '{value}'. Please use a value between 1800 and 2100.")
+        return value
+
+    @field_validator("start_month", "end_month")
+    def validate_month(cls, value):
+        if value < 1 or value > 12:
+            raise ValueError(f"Invalid month '{value}'. Please use a value between 1 and 12.")
+        return value
+
+    @field_validator("timezone")
+    def validate_timezone(cls, value):
+        if not is_valid_timezone(value):
+            raise ValueError(f"Invalid timezone '{value}'. Please use a valid timezone. You can find a list of valid timezones at https://en.wikipedia.org/wiki/List_of_tz_database_time_zones.")
+        return value
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if (self.start_year, self.start_month) > (self.end_year, self.end_month):
+            raise ValueError("The start of the calendar must not be after its end.")
+
+        if self.end_year - self.start_year >= 10:
+            raise ValueError("The calendar can span at most 10 years.")
+
+        return self
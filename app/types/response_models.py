@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 
 from kerykeion.kr_types import LunarPhaseModel, AstrologicalSubjectModel, CompositeSubjectModel
+from kerykeion.kr_types.kr_models import RelationshipScoreAspectModel
 from kerykeion.kr_types import Quality, Element, Sign, Houses, Planet, AxialCusps, AspectName, SignsEmoji, SignNumbers, PointType, ZodiacType
 from typing import Optional
 
@@ -107,6 +108,10 @@ class BirthDataResponseModel(BaseModel):
     """
     status: str = Field(description="The status of the response.")
     data: BirthDataModel = Field(description="The data of the subject.")
+    variants: Optional[dict[str, BirthDataModel]] = Field(
+        default=None,
+        description="The data of the subject for every combination of sidereal mode (or 'Tropic') and house system requested, keyed as '<mode>/<house system>', eg. 'LAHIRI/W'.",
+    )
 
 
 class BirthChartResponseModel(BaseModel):
@@ -116,6 +121,10 @@ class BirthChartResponseModel(BaseModel):
     status: str = Field(description="The status of the response.")
     data: BirthDataModel = Field(description="The data of the subject.")
     chart: str = Field(description="The SVG chart of the birth chart.")
+    charts: Optional[dict[str, str]] = Field(
+        default=None,
+        description="The SVG chart for every combination of theme and language requested, keyed as '<theme>/<language>', eg. 'dark/IT'.",
+    )
     aspects: list[AspectModel] = Field(description="The aspects of the birth chart.")
 
 
@@ -151,6 +160,10 @@ class SynastryChartResponseModel(BaseModel):
     status: str = Field(description="The status of the response.")
     data: DoubleDataModel = Field(description="The data of the two subjects.")
     chart: str = Field(description="The SVG chart of the synastry.")
+    charts: Optional[dict[str, str]] = Field(
+        default=None,
+        description="The SVG chart for every combination of theme and language requested, keyed as '<theme>/<language>', eg. 'dark/IT'.",
+    )
     aspects: list[AspectModel] = Field(description="The aspects between the two subjects.")
 
 
@@ -161,6 +174,10 @@ class TransitChartResponseModel(BaseModel):
     status: str = Field(description="The status of the response.")
     data: TransitDataModel = Field(description="The data of the two subjects.")
     chart: str = Field(description="The SVG chart of the transit.")
+    charts: Optional[dict[str, str]] = Field(
+        default=None,
+        description="The SVG chart for every combination of theme and language requested, keyed as '<theme>/<language>', eg. 'dark/IT'.",
+    )
     aspects: list[AspectModel] = Field(description="The aspects between the two subjects.")
 
 
@@ -185,6 +202,29 @@ class RelationshipScoreResponseModel(BaseModel):
     is_destiny_sign: bool = Field(description="If the two sings are reciprocally destiny signs.")
 
 
+class RelationshipScoreRankingItemModel(BaseModel):
+    """
+    A ranked candidate of the Relationship Score Ranking endpoint.
+    """
+
+    id: str = Field(description="The identifier of the candidate, as sent in the request.")
+    score: float = Field(description="The relationship score between the subject and the candidate.")
+    score_description: str = Field(description="The description of the relationship score.")
+    is_destiny_sign: bool = Field(description="If the two sings are reciprocally destiny signs.")
+    aspects: list[RelationshipScoreAspectModel] = Field(description="The aspects that contributed to the score.")
+
+
+class RelationshipScoreRankingResponseModel(BaseModel):
+    """
+    The response model for the Relationship Score Ranking endpoint.
+    """
+
+    status: str = Field(description="The status of the response.")
+    ranking: list[RelationshipScoreRankingItemModel] = Field(description="The best candidates, sorted by score.")
+    candidates_count: int = Field(description="The number of candidates received.")
+    scored_count: int = Field(description="The number of candidates that had to be fully scored.")
+
+
 class SynastryAspectsResponseModel(BaseModel):
     """
     The response model for the Aspects endpoint.
@@ -203,6 +243,10 @@ class CompositeChartResponseModel(BaseModel):
     status: str = Field(description="The status of the response.")
     data: CompositeDataModel = Field(description="The data of the subjects and the composite chart.")
     chart: str = Field(description="The SVG chart of the composite chart.")
+    charts: Optional[dict[str, str]] = Field(
+        default=None,
+        description="The SVG chart for every combination of theme and language requested, keyed as '<theme>/<language>', eg. 'dark/IT'.",
+    )
     aspects: list[AspectModel] = Field(description="The aspects between the two subjects.")
 
 
@@ -213,4 +257,75 @@ class CompositeAspectsResponseModel(BaseModel):
 
     status: str = Field(description="The status of the response.")
     data: CompositeDataModel = Field(description="The data of the subjects and the composite chart.")
-    aspects: list[AspectModel] = Field(description="A list with the aspects between the two subjects.")
\ No newline at end of file
+    aspects: list[AspectModel] = Field(description="A list with the aspects between the two subjects.")
+
+class LunarPhaseEventModel(BaseModel):
+    """
+    A main lunar phase of the Lunar Phases Calendar endpoint.
+    """
+
+    date: str = Field(description="The ISO 8601 date and time of the phase, in the timezone of the request.")
+    phase: str = Field(description="The name of the phase.", examples=["New Moon", "First Quarter", "Full Moon", "Last Quarter"])
+
+
+class DailyLunarPhaseModel(BaseModel):
+    """
+    The lunar phase of a day of the Lunar Phases Calendar endpoint.
+    """
+
+    date: str = Field(description="The ISO 8601 date of the day.")
+    lunar_phase: LunarPhaseModel = Field(description="The lunar phase at noon (UT) of the day.")
+
+
+class LunarPhasesCalendarResponseModel(BaseModel):
+    """
+    The response model for the Lunar Phases Calendar endpoint.
+    """
+
+    status: str = Field(description="The status of the response.")
+    lunar_phases: list[LunarPhaseEventModel] = Field(description="The main lunar phases in the requested months, sorted by date.")
+    days: list[DailyLunarPhaseModel] = Field(description="The lunar phase of every day of the requested months.")
+
+
+class SignIngressModel(BaseModel):
+    """
+    A sign ingress of the Sign Ingresses Calendar endpoint.
+    """
+
+    date: str = Field(description="The ISO 8601 date and time of the ingress, in the timezone of the request.")
+    planet: Planet = Field(description="The planet entering the sign.")
+    sign: Sign = Field(description="The sign entered.")
+    sign_num: SignNumbers = Field(description="The number of the sign entered.")
+    emoji: SignsEmoji = Field(description="The emoji of the sign entered.")
+    retrograde: bool = Field(description="If the planet enters the sign moving retrograde.")
+
+
+class SignIngressesCalendarResponseModel(BaseModel):
+    """
+    The response model for the Sign Ingresses Calendar endpoint.
+    """
+
+    status: str = Field(description="The status of the response.")
+    sign_ingresses: list[SignIngressModel] = Field(description="The sign ingresses in the requested months, sorted by date.")
+
+
+class RetrogradeStationModel(BaseModel):
+    """
+    A station of the Retrograde Stations Calendar endpoint.
+    """
+
+    date: str = Field(description="The ISO 8601 date and time of the station, in the timezone of the request.")
+    planet: Planet = Field(description="The stationing planet.")
+    station: str = Field(description="'retrograde' when the planet turns retrograde, 'direct' when it turns direct.")
+    sign: Sign = Field(description="The sign of the station.")
+    position: float = Field(description="The position of the station inside the sign.")
+    abs_pos: float = Field(description="The absolute position of the station in the 360 degrees circle of the zodiac.")
+
+
+class RetrogradeStationsCalendarResponseModel(BaseModel):
+    """
+    The response model for the Retrograde Stations Calendar endpoint.
+    """
+
+    status: str = Field(description="The status of the response.")
+    retrograde_stations: list[RetrogradeStationModel] = Field(description="The stations in the requested months, sorted by date.")
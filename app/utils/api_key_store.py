@@ -0,0 +1,194 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from typing import Union
+
+logger = getLogger(__name__)
+
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+
+@dataclass(frozen=True)
+class ApiKey:
+    """
+    The metadata of an API key, attached to the request scope as scope["state"]["api_key"].
+    """
+
+    id: str
+    tier: str = "default"
+    limits: dict = field(default_factory=dict)
+    # Whether the responses have the Server-Timing header with the durations of the stages
+    server_timing: bool = False
+
+
+def get_api_key_digest(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ApiKeyStore:
+    """
+    The valid API keys, by the SHA-256 digest of the key: the keys themselves are never stored, and
+    a lookup is a single dictionary access whatever the number of keys.
+
+    The keys are read from a JSON file, {"keys": [{"digest": ..., "id": ..., "tier": ..., "limits": {...},
+    "server_timing": ...}]}, or from a SQLite database with an api_keys (digest, id, tier, limits,
+    server_timing) table, the server_timing column being optional, chosen by the suffix of
+    the path. The file is checked for changes at most every reload_interval seconds and reloaded without
+    restarting; a file which cannot be read keeps the previous keys.
+
+    static_keys are plain keys always accepted (eg. the RapidAPI proxy secret).
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None, reload_interval: float = 5.0, static_keys: Union[dict[str, ApiKey], None] = None) -> None:
+        self.path = Path(path) if path else None
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self._static_keys = {get_api_key_digest(key): api_key for key, api_key in (static_keys or {}).items() if key}
+        self._keys: dict[str, ApiKey] = dict(self._static_keys)
+        self._file_version: tuple = ()
+        self._checked_at = 0.0
+        self._lock = Lock()
+
+        self.reload_if_changed(force=True)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add_static_key(self, key: str, api_key: ApiKey) -> None:
+        with self._lock:
+            self._static_keys[get_api_key_digest(key)] = api_key
+            self._keys = {**self._keys, **self._static_keys}
+
+    def _get_file_version(self) -> tuple:
+        assert self.path is not None
+        paths = [self.path, self.path.with_name(self.path.name + "-wal")] if self.path.suffix in SQLITE_SUFFIXES else [self.path]
+
+        return tuple((stat.st_mtime_ns, stat.st_size) for stat in (os.stat(path) for path in paths if path.exists()))
+
+    def _read_keys(self) -> dict[str, ApiKey]:
+        assert self.path is not None
+
+        if self.path.suffix in SQLITE_SUFFIXES:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            connection.row_factory = sqlite3.Row
+            try:
+                rows = connection.execute("SELECT * FROM api_keys").fetchall()
+            finally:
+                connection.close()
+
+            entries = [{**dict(row), "limits": json.loads(row["limits"] or "{}")} for row in rows]
+
+        else:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))["keys"]
+
+        return {
+            entry["digest"].lower(): ApiKey(
+                id=entry["id"],
+                tier=entry.get("tier") or "default",
+                limits=entry.get("limits") or {},
+                server_timing=bool(entry.get("server_timing")),
+            )
+            for entry in entries
+        }
+
+    def reload_if_changed(self, force: bool = False) -> None:
+        if self.path is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+
+        with self._lock:
+            self._checked_at = now
+
+            try:
+                file_version = self._get_file_version()
+                if file_version == self._file_version and not force:
+                    return
+
+                self._keys = {**self._read_keys(), **self._static_keys}
+                self._file_version = file_version
+                self.reloads += 1
+                logger.info(f"Loaded {len(self._keys)} API keys from {self.path}")
+
+            except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+                logger.error(f"Could not load the API keys from {self.path}, keeping the previous ones: {e}")
+
+    def get(self, key: str) -> Union[ApiKey, None]:
+        """
+        The metadata of the key, or None when the key is not valid.
+        """
+
+        self.reload_if_changed()
+
+        if not key:
+            return None
+
+        # The time of the lookup only depends on the digest of the key, which reveals nothing about the
+        # valid keys: unlike comparing the keys, it cannot be used to guess them.
+        return self._keys.get(get_api_key_digest(key))
+
+
+def get_api_key_store(path: str, reload_interval: float) -> ApiKeyStore:
+    """
+    The store of the keys file configured with api_keys_path (relative to the app directory), or an
+    empty store when it is not set.
+    """
+
+    if not path:
+        return ApiKeyStore()
+
+    keys_path = Path(path)
+    if not keys_path.is_absolute():
+        keys_path = Path(__file__).parent.parent / keys_path
+
+    return ApiKeyStore(keys_path, reload_interval)
+
+
+def add_api_key(path: Union[str, Path], id: str, tier: str = "default", limits: Union[dict, None] = None, server_timing: bool = False) -> str:
+    """
+    Generates a new key, adds its digest to the keys file or database and returns the key, which is
+    not stored anywhere and must be handed to the customer.
+    """
+
+    path = Path(path)
+    key = secrets.token_urlsafe(32)
+    entry = {"digest": get_api_key_digest(key), "id": id, "tier": tier, "limits": limits or {}, "server_timing": server_timing}
+
+    if path.suffix in SQLITE_SUFFIXES:
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS api_keys (digest TEXT PRIMARY KEY, id TEXT NOT NULL, tier TEXT NOT NULL, limits TEXT NOT NULL, server_timing INTEGER NOT NULL DEFAULT 0)"
+                )
+                # The tables created before the server_timing column
+                if "server_timing" not in [column[1] for column in connection.execute("PRAGMA table_info(api_keys)")]:
+                    connection.execute("ALTER TABLE api_keys ADD COLUMN server_timing INTEGER NOT NULL DEFAULT 0")
+
+                connection.execute(
+                    "INSERT INTO api_keys (digest, id, tier, limits, server_timing) VALUES (?, ?, ?, ?, ?)",
+                    (entry["digest"], id, tier, json.dumps(entry["limits"]), int(server_timing)),
+                )
+        finally:
+            connection.close()
+
+    else:
+        keys = json.loads(path.read_text(encoding="utf-8"))["keys"] if path.exists() else []
+        temporary_path = path.with_name(path.name + ".tmp")
+        temporary_path.write_text(json.dumps({"keys": [*keys, entry]}, indent=2), encoding="utf-8")
+        temporary_path.replace(path)
+
+    return key
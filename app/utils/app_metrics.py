@@ -0,0 +1,109 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from typing import Union
+
+from .compute_pool import compute_pool
+from .lru_cache import LRUCache
+from .metrics import CallbackMetric
+from .readiness import readiness
+from .response_cache_backends import ResponseCacheBackend
+from .shared_memory_cache import get_open_shared_memory_caches
+from .single_flight import computations_single_flight
+from .structured_logging import queue_handlers
+
+
+def get_cache_statistics(response_cache_backend: Union[ResponseCacheBackend, None]) -> dict[str, tuple[int, int]]:
+    """
+    The hits and misses of every cache of the process: the in-process LRU caches, the shared cache
+    segments (shared_<name>, as seen by this process) and the response cache.
+    """
+
+    statistics = {name: (cache.hits, cache.misses) for name, cache in list(LRUCache.registry.items())}
+
+    for name, shared_cache in get_open_shared_memory_caches().items():
+        statistics[f"shared_{name}"] = (shared_cache.hits, shared_cache.misses)
+
+    if response_cache_backend is not None:
+        statistics["response_cache"] = (response_cache_backend.hits, response_cache_backend.misses)
+
+    return statistics
+
+
+def register_app_metrics(response_cache_backend: Union[ResponseCacheBackend, None] = None) -> None:
+    """
+    Registers the metrics read from the counters the components already keep, collected only when
+    the /metrics endpoint is requested.
+    """
+
+    CallbackMetric(
+        "astrologer_api_compute_pool_tasks",
+        "Computations waiting for a thread of the compute pool (queued) and being computed (running)",
+        "gauge",
+        ("state",),
+        lambda: {("queued",): compute_pool.queued, ("running",): compute_pool.running},
+    )
+    CallbackMetric(
+        "astrologer_api_compute_pool_completed_total",
+        "Computations completed by the compute pool",
+        "counter",
+        (),
+        lambda: {(): compute_pool.completed},
+    )
+    CallbackMetric(
+        "astrologer_api_compute_pool_cancelled_total",
+        "Computations cancelled before running (their request was cancelled, or the worker drained)",
+        "counter",
+        (),
+        lambda: {(): compute_pool.cancelled},
+    )
+    CallbackMetric(
+        "astrologer_api_computations_total",
+        "Computations started, and identical requests coalesced with a computation in flight",
+        "counter",
+        ("result",),
+        lambda: {("started",): computations_single_flight.started, ("coalesced",): computations_single_flight.coalesced},
+    )
+    CallbackMetric(
+        "astrologer_api_computations_in_flight",
+        "Distinct computations in flight",
+        "gauge",
+        (),
+        lambda: {(): computations_single_flight.in_flight},
+    )
+    CallbackMetric(
+        "astrologer_api_cache_hits_total",
+        "Hits of the caches",
+        "counter",
+        ("cache",),
+        lambda: {(name,): hits for name, (hits, _) in get_cache_statistics(response_cache_backend).items()},
+    )
+    CallbackMetric(
+        "astrologer_api_cache_misses_total",
+        "Misses of the caches",
+        "counter",
+        ("cache",),
+        lambda: {(name,): misses for name, (_, misses) in get_cache_statistics(response_cache_backend).items()},
+    )
+    CallbackMetric(
+        "astrologer_api_cache_hit_ratio",
+        "Hits over lookups of the caches since the start of the process",
+        "gauge",
+        ("cache",),
+        lambda: {(name,): hits / (hits + misses) for name, (hits, misses) in get_cache_statistics(response_cache_backend).items() if hits + misses},
+    )
+    CallbackMetric(
+        "astrologer_api_log_records_dropped_total",
+        "Log records dropped because the logging queue was full",
+        "counter",
+        (),
+        lambda: {(): sum(queue_handler.dropped for queue_handler in queue_handlers)},
+    )
+    CallbackMetric(
+        "astrologer_api_event_loop_lag_seconds",
+        "How late the event loop wakes up a sleeping task, as last measured",
+        "gauge",
+        (),
+        lambda: {(): readiness.event_loop_lag_monitor.lag} if readiness.event_loop_lag_monitor.lag is not None else {},
+    )
@@ -0,0 +1,351 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import json
+import os
+import swisseph as swe
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Union
+from kerykeion.kr_types.kr_literals import SiderealMode
+from kerykeion.utilities import calculate_moon_phase, get_kerykeion_point_from_degree
+
+import kerykeion
+
+from .cancellation import check_cancelled
+from .lru_cache import LRUCache
+from .timezones import get_timezone
+from ..config.settings import settings
+
+logger = getLogger(__name__)
+
+# Bump when the content of the tables changes, the tables on disk of other versions are ignored.
+TABLES_VERSION = 1
+
+EPHEMERIS_PATH = str(Path(kerykeion.__file__).parent / "sweph")
+
+LUNAR_PHASES_NAMES = ("New Moon", "First Quarter", "Full Moon", "Last Quarter")
+
+# Swiss Ephemeris numbers of the planets in the calendars, with the sampling step in days: it must be
+# short enough for a planet not to cross two signs (or stations) in one step.
+CALENDAR_PLANETS = {
+    "Sun": (0, 1.0),
+    "Moon": (1, 0.25),
+    "Mercury": (2, 1.0),
+    "Venus": (3, 1.0),
+    "Mars": (4, 1.0),
+    "Jupiter": (5, 1.0),
+    "Saturn": (6, 1.0),
+    "Uranus": (7, 1.0),
+    "Neptune": (8, 1.0),
+    "Pluto": (9, 1.0),
+}
+
+# Sun and Moon are never retrograde.
+STATIONS_PLANETS = ("Mercury", "Venus", "Mars", "Jupiter", "Saturn", "Uranus", "Neptune", "Pluto")
+
+# Bisection steps, the 0.25 days Moon step is refined to well under a second.
+BISECTION_STEPS = 24
+
+calendar_tables_cache = LRUCache("calendar_tables", settings.calendar_cache_size)
+
+
+def _get_cache_directory() -> Path:
+    directory = Path(settings.calendar_cache_directory)
+    if not directory.is_absolute():
+        directory = Path(__file__).parent.parent / directory
+
+    return directory / f"v{TABLES_VERSION}-swe{swe.version}"
+
+
+def _get_flags(sidereal_mode: Union[SiderealMode, None]) -> int:
+    swe.set_ephe_path(EPHEMERIS_PATH)
+
+    if not sidereal_mode:
+        return swe.FLG_SWIEPH + swe.FLG_SPEED
+
+    swe.set_sid_mode(getattr(swe, "SIDM_" + sidereal_mode))
+    return swe.FLG_SWIEPH + swe.FLG_SPEED + swe.FLG_SIDEREAL
+
+
+def _bisect(function: Callable[[float], int], start: float, end: float) -> float:
+    """
+    Returns the julian day, between start and end, where the value of the function changes.
+    """
+
+    start_value = function(start)
+    for _ in range(BISECTION_STEPS):
+        middle = (start + end) / 2
+        if function(middle) == start_value:
+            start = middle
+        else:
+            end = middle
+
+    return end
+
+
+def _find_changes(function: Callable[[float], int], start: float, end: float, step: float) -> list[tuple[float, int]]:
+    """
+    Samples the function every step from start to end, and returns the julian day and the new value of
+    every change of the function.
+    """
+
+    changes = []
+    previous_julian_day = start
+    previous_value = function(start)
+
+    julian_day = start
+    while julian_day < end:
+        julian_day = min(julian_day + step, end)
+        value = function(julian_day)
+
+        if value != previous_value:
+            change_julian_day = _bisect(function, previous_julian_day, julian_day)
+            # The last day belongs to the next year table.
+            if change_julian_day < end:
+                changes.append((change_julian_day, value))
+
+        previous_julian_day, previous_value = julian_day, value
+
+    return changes
+
+
+def _calculate_year_tables(year: int, sidereal_mode: Union[SiderealMode, None]) -> dict:
+    """
+    Calculates the lunar phases, sign ingresses and retrograde stations of a year, as julian days (UT).
+    """
+
+    flags = _get_flags(sidereal_mode)
+    start = swe.julday(year, 1, 1, 0.0)
+    end = swe.julday(year + 1, 1, 1, 0.0)
+
+    def longitude(julian_day: float, planet_number: int) -> float:
+        return swe.calc_ut(julian_day, planet_number, flags)[0][0]
+
+    def speed(julian_day: float, planet_number: int) -> float:
+        return swe.calc_ut(julian_day, planet_number, flags)[0][3]
+
+    def lunar_phase_index(julian_day: float) -> int:
+        return int(((longitude(julian_day, 1) - longitude(julian_day, 0)) % 360) // 90)
+
+    lunar_phases = [[julian_day, index] for julian_day, index in _find_changes(lunar_phase_index, start, end, 0.25)]
+
+    sign_ingresses = []
+    for planet_name, (planet_number, step) in CALENDAR_PLANETS.items():
+        # The tables of a year take a while: a cancelled computation stops between two planets.
+        check_cancelled()
+        for julian_day, sign_num in _find_changes(lambda jd: int(longitude(jd, planet_number) // 30), start, end, step):
+            sign_ingresses.append([julian_day, planet_name, sign_num, speed(julian_day, planet_number) < 0])
+
+    retrograde_stations = []
+    for planet_name in STATIONS_PLANETS:
+        check_cancelled()
+        planet_number, step = CALENDAR_PLANETS[planet_name]
+        for julian_day, retrograde in _find_changes(lambda jd: int(speed(jd, planet_number) < 0), start, end, step):
+            retrograde_stations.append([julian_day, planet_name, bool(retrograde), longitude(julian_day, planet_number)])
+
+    sign_ingresses.sort()
+    retrograde_stations.sort()
+
+    # Sun and Moon positions at noon (UT) of every day, for the daily lunar phase.
+    daily_positions = []
+    julian_day = start + 0.5
+    while julian_day < end:
+        daily_positions.append([longitude(julian_day, 1), longitude(julian_day, 0)])
+        julian_day += 1
+
+    return {
+        "year": year,
+        "sidereal_mode": sidereal_mode,
+        "lunar_phases": lunar_phases,
+        "sign_ingresses": sign_ingresses,
+        "retrograde_stations": retrograde_stations,
+        "daily_positions": daily_positions,
+    }
+
+
+def _read_year_tables(path: Path) -> Union[dict, None]:
+    try:
+        with open(path, "r") as tables_file:
+            return json.load(tables_file)
+
+    except FileNotFoundError:
+        return None
+
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable calendar tables {path}: {e}")
+        return None
+
+
+def _write_year_tables(path: Path, tables: dict) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary_path, "w") as tables_file:
+            json.dump(tables, tables_file, separators=(",", ":"))
+
+        # Atomic, concurrent workers never read a partial file.
+        os.replace(temporary_path, path)
+
+    except OSError as e:
+        logger.warning(f"Could not write calendar tables {path}: {e}")
+
+
+def get_year_tables(year: int, sidereal_mode: Union[SiderealMode, None] = None) -> dict:
+    """
+    Returns the calendar tables of a year, calculated on first use and then cached in memory
+    and on disk.
+    """
+
+    key = (year, sidereal_mode)
+    tables = calendar_tables_cache.get(key)
+    if tables is not None:
+        return tables
+
+    path = _get_cache_directory() / f"{sidereal_mode or 'Tropic'}-{year}.json"
+    tables = _read_year_tables(path)
+
+    if tables is None:
+        tables = _calculate_year_tables(year, sidereal_mode)
+        _write_year_tables(path, tables)
+
+    calendar_tables_cache.set(key, tables)
+
+    return tables
+
+
+def julian_day_to_datetime(julian_day: float) -> datetime:
+    """
+    Converts a julian day (UT) to an aware UTC datetime, rounded to the second.
+    """
+
+    year, month, day, hour, minute, seconds = swe.jdut1_to_utc(julian_day, swe.GREG_CAL)
+    return datetime(year, month, day, hour, minute, tzinfo=timezone.utc) + timedelta(seconds=round(seconds))
+
+
+def _get_utc_range(start_year: int, start_month: int, end_year: int, end_month: int, tz_str: str) -> tuple[datetime, datetime]:
+    """
+    The UTC start (included) and end (excluded) of the months range, in the given timezone.
+    """
+
+    local_timezone = get_timezone(tz_str)
+    end_year, end_month = (end_year + 1, 1) if end_month == 12 else (end_year, end_month + 1)
+
+    start = local_timezone.localize(datetime(start_year, start_month, 1)).astimezone(timezone.utc)
+    end = local_timezone.localize(datetime(end_year, end_month, 1)).astimezone(timezone.utc)
+
+    return start, end
+
+
+def _get_events(table_name: str, start: datetime, end: datetime, sidereal_mode: Union[SiderealMode, None]) -> list[tuple[datetime, list]]:
+    events = []
+    # The end is excluded: a range ending in December does not need the tables of the next year.
+    last_year = (end - timedelta(microseconds=1)).year
+    for year in range(start.year, last_year + 1):
+        for row in get_year_tables(year, sidereal_mode)[table_name]:
+            date = julian_day_to_datetime(row[0])
+            if start <= date < end:
+                events.append((date, row))
+
+    return events
+
+
+def get_lunar_phases_calendar(
+    start_year: int,
+    start_month: int,
+    end_year: int,
+    end_month: int,
+    tz_str: str = "UTC",
+    sidereal_mode: Union[SiderealMode, None] = None,
+) -> dict[str, list[dict]]:
+    """
+    Returns the main lunar phases of the months range, with their time in the given timezone, and
+    the lunar phase of every day (calculated at noon UT).
+    """
+
+    start, end = _get_utc_range(start_year, start_month, end_year, end_month, tz_str)
+    local_timezone = get_timezone(tz_str)
+
+    lunar_phases = [
+        {"date": date.astimezone(local_timezone).isoformat(), "phase": LUNAR_PHASES_NAMES[row[1]]}
+        for date, row in _get_events("lunar_phases", start, end, sidereal_mode)
+    ]
+
+    days = []
+    for year in range(start_year, end_year + 1):
+        tables = get_year_tables(year, sidereal_mode)
+        for day_of_year, (moon_position, sun_position) in enumerate(tables["daily_positions"]):
+            day = datetime(year, 1, 1) + timedelta(days=day_of_year)
+            if not (start_year, start_month) <= (day.year, day.month) <= (end_year, end_month):
+                continue
+
+            days.append({"date": day.date().isoformat(), "lunar_phase": calculate_moon_phase(moon_position, sun_position).model_dump()})
+
+    return {"lunar_phases": lunar_phases, "days": days}
+
+
+def get_sign_ingresses_calendar(
+    start_year: int,
+    start_month: int,
+    end_year: int,
+    end_month: int,
+    tz_str: str = "UTC",
+    sidereal_mode: Union[SiderealMode, None] = None,
+) -> list[dict]:
+    """
+    Returns the sign ingresses of the planets in the months range, with their time in the given timezone.
+    """
+
+    start, end = _get_utc_range(start_year, start_month, end_year, end_month, tz_str)
+    local_timezone = get_timezone(tz_str)
+
+    sign_ingresses = []
+    for date, (_, planet_name, sign_num, retrograde) in _get_events("sign_ingresses", start, end, sidereal_mode):
+        point = get_kerykeion_point_from_degree(sign_num * 30, planet_name, point_type="Planet")
+        sign_ingresses.append(
+            {
+                "date": date.astimezone(local_timezone).isoformat(),
+                "planet": planet_name,
+                "sign": point.sign,
+                "sign_num": point.sign_num,
+                "emoji": point.emoji,
+                "retrograde": retrograde,
+            }
+        )
+
+    return sign_ingresses
+
+
+def get_retrograde_stations_calendar(
+    start_year: int,
+    start_month: int,
+    end_year: int,
+    end_month: int,
+    tz_str: str = "UTC",
+    sidereal_mode: Union[SiderealMode, None] = None,
+) -> list[dict]:
+    """
+    Returns the retrograde and direct stations of the planets in the months range, with their time in the
+    given timezone.
+    """
+
+    start, end = _get_utc_range(start_year, start_month, end_year, end_month, tz_str)
+    local_timezone = get_timezone(tz_str)
+
+    retrograde_stations = []
+    for date, (_, planet_name, retrograde, abs_pos) in _get_events("retrograde_stations", start, end, sidereal_mode):
+        point = get_kerykeion_point_from_degree(abs_pos, planet_name, point_type="Planet")
+        retrograde_stations.append(
+            {
+                "date": date.astimezone(local_timezone).isoformat(),
+                "planet": planet_name,
+                "station": "retrograde" if retrograde else "direct",
+                "sign": point.sign,
+                "position": point.position,
+                "abs_pos": point.abs_pos,
+            }
+        )
+
+    return retrograde_stations
@@ -0,0 +1,236 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import copy
+import math
+import swisseph as swe
+from typing import Union
+from kerykeion import AstrologicalSubject
+from kerykeion.utilities import get_kerykeion_point_from_degree, get_planet_house, get_number_from_name
+from kerykeion.kr_types.kr_literals import HousesSystemIdentifier, SiderealMode
+
+# Sidereal modes whose positions are not a plain shift of the tropical ones, as they are projected
+# on the ecliptic of a fixed epoch.
+NON_SHIFTABLE_SIDEREAL_MODES = {"J2000", "J1900", "B1950"}
+
+PLANETS_ATTRIBUTES = (
+    "sun",
+    "moon",
+    "mercury",
+    "venus",
+    "mars",
+    "jupiter",
+    "saturn",
+    "uranus",
+    "neptune",
+    "pluto",
+    "mean_node",
+    "true_node",
+    "mean_south_node",
+    "true_south_node",
+    "chiron",
+    "mean_lilith",
+)
+
+AXIAL_CUSPS_ATTRIBUTES = ("ascendant", "descendant", "medium_coeli", "imum_coeli")
+
+HOUSES_ATTRIBUTES = (
+    "first_house",
+    "second_house",
+    "third_house",
+    "fourth_house",
+    "fifth_house",
+    "sixth_house",
+    "seventh_house",
+    "eighth_house",
+    "ninth_house",
+    "tenth_house",
+    "eleventh_house",
+    "twelfth_house",
+)
+
+
+def get_variant_name(sidereal_mode: Union[SiderealMode, None], houses_system_identifier: HousesSystemIdentifier) -> str:
+    """
+    Returns the key of a variant in the response, eg. "Tropic/P" or "LAHIRI/W".
+    """
+
+    return f"{sidereal_mode or 'Tropic'}/{houses_system_identifier}"
+
+
+def _get_ayanamsa(julian_day: float, sidereal_mode: Union[SiderealMode, None]) -> float:
+    if not sidereal_mode:
+        return 0.0
+
+    swe.set_sid_mode(getattr(swe, "SIDM_" + sidereal_mode))
+    return swe.get_ayanamsa_ex_ut(julian_day, swe.FLG_SWIEPH)[1]
+
+
+def _get_ayanamsa_daily_rate(julian_day: float, sidereal_mode: Union[SiderealMode, None]) -> float:
+    return _get_ayanamsa(julian_day + 0.5, sidereal_mode) - _get_ayanamsa(julian_day - 0.5, sidereal_mode)
+
+
+def _is_shiftable(astrological_subject: AstrologicalSubject, sidereal_mode: Union[SiderealMode, None]) -> bool:
+    """
+    Whether the positions for the sidereal mode can be obtained shifting the ones of the subject.
+    Heliocentric charts and the fixed epoch modes need a full calculation.
+    """
+
+    if astrological_subject.sidereal_mode == sidereal_mode:
+        return True
+
+    if astrological_subject.perspective_type == "Heliocentric":
+        return False
+
+    return astrological_subject.sidereal_mode not in NON_SHIFTABLE_SIDEREAL_MODES and sidereal_mode not in NON_SHIFTABLE_SIDEREAL_MODES
+
+
+def _get_planets_speeds(astrological_subject: AstrologicalSubject) -> dict[str, float]:
+    """
+    Longitude speeds of the planets of the subject, needed to keep the retrograde flag exact when
+    shifting to another sidereal mode (the ayanamsa itself moves by ~50" per year).
+    """
+
+    _get_ayanamsa(astrological_subject.julian_day, astrological_subject.sidereal_mode)
+
+    speeds = {}
+    for attribute in PLANETS_ATTRIBUTES:
+        point = astrological_subject[attribute]
+        if point is None:
+            continue
+
+        planet_number = get_number_from_name(point.name)
+        # South nodes move as the north nodes
+        if planet_number == 1000:
+            planet_number = 10
+        elif planet_number == 1100:
+            planet_number = 11
+
+        speeds[attribute] = swe.calc_ut(astrological_subject.julian_day, planet_number, astrological_subject._iflag)[0][3]
+
+    return speeds
+
+
+def _get_full_variant(astrological_subject: AstrologicalSubject, sidereal_mode: Union[SiderealMode, None], houses_system_identifier: HousesSystemIdentifier) -> AstrologicalSubject:
+    return AstrologicalSubject(
+        name=astrological_subject.name,
+        year=astrological_subject.year,
+        month=astrological_subject.month,
+        day=astrological_subject.day,
+        hour=astrological_subject.hour,
+        minute=astrological_subject.minute,
+        city=astrological_subject.city,
+        nation=astrological_subject.nation,
+        lat=astrological_subject.lat,
+        lng=astrological_subject.lng,
+        tz_str=astrological_subject.tz_str,
+        zodiac_type="Sidereal" if sidereal_mode else "Tropic",
+        sidereal_mode=sidereal_mode,
+        houses_system_identifier=houses_system_identifier,
+        perspective_type=astrological_subject.perspective_type,
+        online=False,
+        is_dst=astrological_subject.is_dst,
+        disable_chiron_and_lilith=astrological_subject.disable_chiron_and_lilith,
+    )
+
+
+def _get_shifted_variant(
+    astrological_subject: AstrologicalSubject,
+    sidereal_mode: Union[SiderealMode, None],
+    houses_system_identifier: HousesSystemIdentifier,
+    planets_speeds: dict[str, float],
+) -> AstrologicalSubject:
+    julian_day = astrological_subject.julian_day
+    subject_ayanamsa = _get_ayanamsa(julian_day, astrological_subject.sidereal_mode)
+    variant_ayanamsa = _get_ayanamsa(julian_day, sidereal_mode)
+    shift = subject_ayanamsa - variant_ayanamsa
+    speed_shift = _get_ayanamsa_daily_rate(julian_day, astrological_subject.sidereal_mode) - _get_ayanamsa_daily_rate(julian_day, sidereal_mode)
+
+    variant = copy.copy(astrological_subject)
+    variant.zodiac_type = "Sidereal" if sidereal_mode else "Tropic"
+    variant.sidereal_mode = sidereal_mode
+    variant.houses_system_identifier = houses_system_identifier
+    variant.houses_system_name = swe.house_name(houses_system_identifier.encode("ascii"))
+
+    # Houses are cheap to calculate, and some systems (eg. whole sign) depend on the zodiac, so they are
+    # always calculated as Kerykeion does.
+    if sidereal_mode:
+        swe.set_sid_mode(getattr(swe, "SIDM_" + sidereal_mode))
+        houses_degree_ut, ascmc = swe.houses_ex(
+            tjdut=julian_day,
+            lat=astrological_subject.lat,
+            lon=astrological_subject.lng,
+            hsys=houses_system_identifier.encode("ascii"),
+            flags=swe.FLG_SIDEREAL,
+        )
+    else:
+        houses_degree_ut, ascmc = swe.houses(tjdut=julian_day, lat=astrological_subject.lat, lon=astrological_subject.lng, hsys=houses_system_identifier.encode("ascii"))
+
+    variant._houses_degree_ut = houses_degree_ut
+
+    for attribute, degree in zip(HOUSES_ATTRIBUTES, houses_degree_ut):
+        setattr(variant, attribute, get_kerykeion_point_from_degree(degree, astrological_subject[attribute].name, point_type="House"))
+
+    variant._houses_list = [variant[attribute] for attribute in HOUSES_ATTRIBUTES]
+
+    axial_cusps_degrees = (ascmc[0], math.fmod(ascmc[0] + 180, 360), ascmc[1], math.fmod(ascmc[1] + 180, 360))
+
+    for attribute, degree in zip(AXIAL_CUSPS_ATTRIBUTES, axial_cusps_degrees):
+        point = get_kerykeion_point_from_degree(degree, astrological_subject[attribute].name, point_type="AxialCusps")
+        point.house = get_planet_house(degree, houses_degree_ut)
+        point.retrograde = False
+        setattr(variant, attribute, point)
+
+    # Planets are shifted by the difference of the ayanamsas.
+    for attribute in PLANETS_ATTRIBUTES:
+        subject_point = astrological_subject[attribute]
+        if subject_point is None:
+            continue
+
+        degree = subject_point.abs_pos if shift == 0 else math.fmod(subject_point.abs_pos + shift + 360, 360)
+        point = get_kerykeion_point_from_degree(degree, subject_point.name, point_type="Planet")
+        point.house = get_planet_house(degree, houses_degree_ut)
+        point.retrograde = planets_speeds[attribute] + speed_shift < 0
+        setattr(variant, attribute, point)
+
+    return variant
+
+
+def get_astrological_subject_variants(
+    astrological_subject: AstrologicalSubject,
+    sidereal_modes: list[Union[SiderealMode, None]],
+    houses_system_identifiers: list[HousesSystemIdentifier],
+) -> dict[str, AstrologicalSubject]:
+    """
+    Derives from an already calculated subject one variant for every combination of sidereal mode
+    (None meaning Tropic) and house system, keyed by get_variant_name.
+
+    Planets are calculated only once: the variants get the houses of their house system and the planets
+    shifted by the difference of the ayanamsas. Heliocentric subjects and the fixed epoch sidereal modes
+    are not a plain shift, so those variants are fully calculated.
+    """
+
+    variants = {}
+    planets_speeds = None
+
+    for sidereal_mode in sidereal_modes:
+        for houses_system_identifier in houses_system_identifiers:
+            variant_name = get_variant_name(sidereal_mode, houses_system_identifier)
+            if variant_name in variants:
+                continue
+
+            if sidereal_mode == astrological_subject.sidereal_mode and houses_system_identifier == astrological_subject.houses_system_identifier:
+                variants[variant_name] = astrological_subject
+                continue
+
+            if not _is_shiftable(astrological_subject, sidereal_mode):
+                variants[variant_name] = _get_full_variant(astrological_subject, sidereal_mode, houses_system_identifier)
+                continue
+
+            if planets_speeds is None:
+                planets_speeds = _get_planets_speeds(astrological_subject)
+
+            variants[variant_name] = _get_shifted_variant(astrological_subject, sidereal_mode, houses_system_identifier, planets_speeds)
+
+    return variants
@@ -0,0 +1,230 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import struct
+import time
+import zlib
+from functools import cache
+from logging import getLogger
+from pathlib import Path
+from typing import Union
+
+from ..config.settings import settings
+from .request_hash import get_result_version
+from .shared_memory_cache import FORMAT_VERSION as SHARED_CACHE_FORMAT_VERSION
+from .shared_memory_cache import SharedMemoryCache, get_open_shared_memory_caches, get_shared_memory_cache
+
+logger = getLogger(__name__)
+
+MAGIC = b"ASNP"
+# The version of the snapshot files format
+FORMAT_VERSION = 1
+# Magic, format version, fingerprint, entries
+HEADER = struct.Struct("<4sI32sI")
+# Digest of the key, expiry, last use, length and crc32 of the data
+ENTRY = struct.Struct("<16sddII")
+
+
+@cache
+def get_snapshot_fingerprint() -> bytes:
+    """
+    The fingerprint of what the cached values depend on: the version of the results (kerykeion and the
+    sources computing them, see get_result_version) and the encoding of the shared cache. A snapshot
+    with another fingerprint is discarded, so a deploy changing the results starts with empty caches.
+    """
+
+    return hashlib.sha256(f"{FORMAT_VERSION}\nresults=={get_result_version()}\nshared_cache=={SHARED_CACHE_FORMAT_VERSION}\n".encode()).digest()
+
+
+def save_snapshot(cache: SharedMemoryCache, path: Union[str, Path], fingerprint: bytes) -> int:
+    """
+    Writes the valid entries of the cache to the snapshot file, as stored in the cache (compressed),
+    replacing it atomically. Returns the number of entries.
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    entries = 0
+
+    try:
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, fingerprint, 0))
+
+            for digest, expires_at, last_used, data in cache.get_entries():
+                snapshot_file.write(ENTRY.pack(digest, expires_at, last_used, len(data), zlib.crc32(data)))
+                snapshot_file.write(data)
+                entries += 1
+
+            snapshot_file.seek(0)
+            snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, fingerprint, entries))
+
+        temporary_path.replace(path)
+
+    finally:
+        temporary_path.unlink(missing_ok=True)
+
+    return entries
+
+
+def load_snapshot(cache: SharedMemoryCache, path: Union[str, Path], fingerprint: bytes) -> int:
+    """
+    Stores the entries of the snapshot file in the cache, skipping the expired ones. A snapshot of another
+    version is ignored, and a truncated or corrupted one is read up to the first invalid entry. Returns
+    the number of entries restored.
+    """
+
+    try:
+        with open(path, "rb") as snapshot_file:
+            snapshot = snapshot_file.read()
+    except FileNotFoundError:
+        return 0
+
+    if len(snapshot) < HEADER.size:
+        return 0
+
+    magic, format_version, snapshot_fingerprint, entries = HEADER.unpack_from(snapshot, 0)
+    if magic != MAGIC or format_version != FORMAT_VERSION or snapshot_fingerprint != fingerprint:
+        logger.info(f"Discarded the cache snapshot {path}, saved by another version")
+        return 0
+
+    offset, restored = HEADER.size, 0
+
+    for _ in range(entries):
+        if offset + ENTRY.size > len(snapshot):
+            break
+
+        digest, expires_at, last_used, length, crc = ENTRY.unpack_from(snapshot, offset)
+        data = snapshot[offset + ENTRY.size : offset + ENTRY.size + length]
+        offset += ENTRY.size + length
+
+        if len(data) != length or zlib.crc32(data) != crc:
+            logger.warning(f"The cache snapshot {path} is corrupted, restored only its first entries")
+            break
+
+        restored += cache.set_entry(digest, expires_at, last_used, data)
+
+    return restored
+
+
+class CacheSnapshots:
+    """
+    Snapshots of the shared cache segments (the subjects and the results), so that a restarted or
+    redeployed server starts with the caches of the previous one.
+
+    A segment is restored from its snapshot by the process creating it (the first worker, or the
+    master of the prefork server), and saved every `interval` seconds and on shutdown. The workers
+    share the segments, so a snapshot saved by another worker since (half an interval ago, or since
+    the shutdown began) is not saved again.
+    """
+
+    def __init__(self, directory: Union[Path, None], interval: int) -> None:
+        self.directory = directory
+        self.interval = interval
+        self._task: Union[asyncio.Task, None] = None
+
+    def get_path(self, name: str) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{name}.snapshot"
+
+    def open_shared_memory_caches(self) -> None:
+        """
+        Opens every configured shared cache segment, restoring the ones created by this process.
+        """
+
+        for name in settings.shared_cache_segments:
+            shared_cache = get_shared_memory_cache(name)
+
+            if self.directory is None or shared_cache is None or not shared_cache.created:
+                continue
+
+            start = time.perf_counter()
+
+            try:
+                restored = load_snapshot(shared_cache, self.get_path(name), get_snapshot_fingerprint())
+            except OSError as e:
+                logger.error(f"Could not restore the {name} cache: {e}")
+                continue
+
+            # Restored once, even when the caches are opened again (eg. by another lifespan of the app).
+            shared_cache.created = False
+
+            if restored:
+                logger.info(f"Restored {restored} entries of the {name} cache in {time.perf_counter() - start:.3f}s")
+
+    def save(self, unless_saved_since: float = 0) -> dict[str, int]:
+        """
+        Saves the snapshot of every shared cache segment open in this process, unless saved after
+        `unless_saved_since` (a timestamp). Returns the number of entries saved by segment.
+        """
+
+        if self.directory is None:
+            return {}
+
+        saved = {}
+
+        for name, shared_cache in get_open_shared_memory_caches().items():
+            path = self.get_path(name)
+
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+
+                with open(path.with_name(f"{path.name}.lock"), "a") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                    if unless_saved_since and path.exists() and path.stat().st_mtime >= unless_saved_since:
+                        continue
+
+                    saved[name] = save_snapshot(shared_cache, path, get_snapshot_fingerprint())
+
+            except OSError as e:
+                logger.error(f"Could not save the {name} cache: {e}")
+
+        if saved:
+            logger.info(f"Saved the cache snapshots: {', '.join(f'{name} ({entries} entries)' for name, entries in saved.items())}")
+
+        return saved
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.save, time.time() - self.interval / 2)
+
+    def start(self) -> None:
+        """
+        Starts the periodic snapshots, from the running event loop.
+        """
+
+        if self.directory is not None and self.interval > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stops the periodic snapshots and saves the snapshots, unless another worker did since.
+        """
+
+        stopped_at = time.time()
+
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await asyncio.to_thread(self.save, stopped_at)
+
+
+def _get_snapshot_directory() -> Union[Path, None]:
+    if not settings.cache_snapshot_directory:
+        return None
+
+    directory = Path(settings.cache_snapshot_directory)
+
+    return directory if directory.is_absolute() else Path(__file__).parent.parent / directory
+
+
+cache_snapshots = CacheSnapshots(_get_snapshot_directory(), settings.cache_snapshot_interval)
@@ -0,0 +1,86 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Awaitable, TypeVar, Union
+
+from fastapi import Request
+
+T = TypeVar("T")
+
+# How often the client connection is checked while a computation runs (seconds)
+DISCONNECT_POLL_INTERVAL = 0.2
+
+# Set when the computation running in this context is not awaited anymore (see ComputePool.run)
+computation_cancelled: ContextVar[Union[threading.Event, None]] = ContextVar("computation_cancelled", default=None)
+
+
+class ComputationCancelledError(Exception):
+    """
+    Raised in the compute pool by a computation cancelled while running: its request went away.
+    """
+
+
+class ComputationTimeoutError(Exception):
+    """
+    Raised for a request whose computation did not complete within the deadline of its endpoint.
+    """
+
+    def __init__(self, deadline: float) -> None:
+        super().__init__(f"The computation did not complete within its deadline of {deadline}s")
+        self.deadline = deadline
+
+
+class ClientDisconnectedError(Exception):
+    """
+    Raised for a request whose client disconnected before its computation completed.
+    """
+
+
+def check_cancelled() -> None:
+    """
+    Stops the running computation when it was cancelled, between two of its stages (see stage): a thread
+    cannot be interrupted, so a cancelled computation ends at its next stage instead of completing.
+    """
+
+    cancelled = computation_cancelled.get()
+
+    if cancelled is not None and cancelled.is_set():
+        raise ComputationCancelledError("The computation was cancelled")
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run_with_deadline(request: Request, computation: Awaitable[T], deadline: float) -> T:
+    """
+    Awaits the computation of the request, cancelling it when the client disconnects
+    (ClientDisconnectedError) or after `deadline` seconds (ComputationTimeoutError). A cancelled
+    computation is dropped when still queued in the compute pool, and stopped at its next stage when
+    running.
+    """
+
+    computation_task = asyncio.ensure_future(computation)
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(request))
+
+    try:
+        done, _ = await asyncio.wait((computation_task, disconnect_task), timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+
+    finally:
+        disconnect_task.cancel()
+
+        if not computation_task.done():
+            computation_task.cancel()
+
+    if computation_task in done:
+        return computation_task.result()
+
+    if disconnect_task in done:
+        raise ClientDisconnectedError("The client disconnected before the computation completed")
+
+    raise ComputationTimeoutError(deadline)
@@ -0,0 +1,106 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from functools import cache
+from pathlib import Path
+from typing import Union
+from kerykeion import KerykeionChartSVG
+from kerykeion.settings.kerykeion_settings import get_settings
+from kerykeion.kr_types.kr_literals import KerykeionChartTheme, KerykeionChartLanguage
+
+import kerykeion.charts
+
+THEMES_DIRECTORY = Path(kerykeion.charts.__file__).parent / "themes"
+
+# Stands in for the theme CSS while the chart is rendered and minified, it survives the minification untouched.
+THEME_PLACEHOLDER = "/*astrologer-api-theme*/"
+
+
+def get_chart_variant_name(theme: Union[KerykeionChartTheme, None], language: KerykeionChartLanguage) -> str:
+    """
+    Returns the key of a chart variant in the response, eg. "dark/EN".
+    """
+
+    return f"{theme}/{language}"
+
+
+@cache
+def _get_minified_theme_css(theme: KerykeionChartTheme) -> str:
+    """
+    The theme CSS, minified as the KerykeionChartSVG minification would do inside the chart.
+    """
+
+    with open(THEMES_DIRECTORY / f"{theme}.css", "r") as theme_file:
+        css = theme_file.read()
+
+    return css.replace('"', "'").replace("\n", "").replace("\t", "").replace("    ", "").replace("  ", "")
+
+
+def _make_template(kerykeion_chart: KerykeionChartSVG, wheel_only: bool) -> str:
+    if wheel_only:
+        return kerykeion_chart.makeWheelOnlyTemplate(minify=True)
+
+    return kerykeion_chart.makeTemplate(minify=True)
+
+
+def get_chart_variants(
+    kerykeion_chart: KerykeionChartSVG,
+    themes: list[Union[KerykeionChartTheme, None]],
+    languages: list[KerykeionChartLanguage],
+    wheel_only: bool,
+) -> dict[str, str]:
+    """
+    Renders the chart in every combination of theme and language, keyed by get_chart_variant_name.
+
+    The chart geometry and aspects are calculated only once, by the KerykeionChartSVG. The chart is then
+    rendered and minified once per language, with a placeholder for the theme, and every theme is
+    obtained replacing the placeholder with its CSS. The output is identical to a separate render.
+    """
+
+    variants = {}
+
+    for language in dict.fromkeys(languages):
+        # Only the labels depend on the language, the geometry and the aspects are kept.
+        kerykeion_chart.chart_language = language
+        kerykeion_chart.language_settings = get_settings(kerykeion_chart.new_settings_file)["language_settings"][language]
+
+        if kerykeion_chart.chart_type == "Transit":
+            kerykeion_chart.t_name = kerykeion_chart.language_settings["transit_name"]
+
+        template = None
+        for theme in dict.fromkeys(themes):
+            # Without a theme the style tag is empty, and the minification could change the document.
+            if theme is None:
+                kerykeion_chart.set_up_theme(None)
+                variants[get_chart_variant_name(theme, language)] = _make_template(kerykeion_chart, wheel_only)
+                continue
+
+            if template is None:
+                kerykeion_chart.color_style_tag = THEME_PLACEHOLDER
+                template = _make_template(kerykeion_chart, wheel_only)
+
+            variants[get_chart_variant_name(theme, language)] = template.replace(THEME_PLACEHOLDER, _get_minified_theme_css(theme))
+
+    return variants
+
+
+def make_chart_svg(
+    kerykeion_chart: KerykeionChartSVG,
+    theme: Union[KerykeionChartTheme, None],
+    language: KerykeionChartLanguage,
+    themes: Union[list[KerykeionChartTheme], None],
+    languages: Union[list[KerykeionChartLanguage], None],
+    wheel_only: bool,
+) -> tuple[str, Union[dict[str, str], None]]:
+    """
+    Returns the SVG of the chart in the requested theme and language and, when additional themes or
+    languages are requested, all the variants (the requested chart included) as get_chart_variants does.
+    """
+
+    if not themes and not languages:
+        return _make_template(kerykeion_chart, wheel_only), None
+
+    charts = get_chart_variants(kerykeion_chart, [theme, *(themes or [])], [language, *(languages or [])], wheel_only)
+
+    return charts[get_chart_variant_name(theme, language)], charts
@@ -0,0 +1,366 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from kerykeion import AstrologicalSubject, KerykeionChartSVG, SynastryAspects, NatalAspects, RelationshipScoreFactory, CompositeSubjectFactory
+from kerykeion.settings.config_constants import DEFAULT_ACTIVE_POINTS, DEFAULT_ACTIVE_ASPECTS
+
+from .get_astrological_subject import get_astrological_subject
+from .astrological_subject_variants import get_astrological_subject_variants
+from .astrological_calendar import get_lunar_phases_calendar, get_sign_ingresses_calendar, get_retrograde_stations_calendar
+from .chart_variants import make_chart_svg
+from .relationship_score_ranking import get_relationship_score_ranking
+from .stage_timer import stage
+from .transit_subject_cache import get_transit_astrological_subject
+from ..types.request_models import (
+    BirthDataRequestModel,
+    BirthChartRequestModel,
+    SynastryChartRequestModel,
+    TransitChartRequestModel,
+    RelationshipScoreRequestModel,
+    RelationshipScoreRankingRequestModel,
+    SynastryAspectsRequestModel,
+    NatalAspectsRequestModel,
+    CompositeChartRequestModel,
+    CalendarRequestModel,
+)
+
+# The calculations behind the endpoints of the main router. They are plain synchronous functions, run in the
+# compute pool, and return the content of the response.
+
+
+def compute_now(datetime_dict: dict) -> dict:
+    # On some Cloud providers, the time is not set correctly, so the current UTC time comes from the time API
+    today_subject = AstrologicalSubject(
+        city="GMT",
+        nation="UK",
+        lat=51.477928,
+        lng=-0.001545,
+        tz_str="GMT",
+        year=datetime_dict["year"],
+        month=datetime_dict["month"],
+        day=datetime_dict["day"],
+        hour=datetime_dict["hour"],
+        minute=datetime_dict["minute"],
+        online=False,
+    )
+
+    return {"status": "OK", "data": today_subject.model().model_dump()}
+
+
+def compute_birth_data(birth_data_request: BirthDataRequestModel) -> dict:
+    astrological_subject = get_astrological_subject(birth_data_request.subject)
+
+    response_dict = {"status": "OK", "data": astrological_subject.model().model_dump()}
+
+    if birth_data_request.houses_system_identifiers or birth_data_request.sidereal_modes:
+        variants = get_astrological_subject_variants(
+            astrological_subject,
+            sidereal_modes=[astrological_subject.sidereal_mode, *(birth_data_request.sidereal_modes or [])],
+            houses_system_identifiers=[astrological_subject.houses_system_identifier, *(birth_data_request.houses_system_identifiers or [])],
+        )
+        response_dict["variants"] = {name: variant.model().model_dump() for name, variant in variants.items()}
+
+    return response_dict
+
+
+def compute_birth_chart(birth_chart_request: BirthChartRequestModel) -> dict:
+    astrological_subject = get_astrological_subject(birth_chart_request.subject)
+
+    with stage("aspects"):
+        kerykeion_chart = KerykeionChartSVG(
+            astrological_subject,
+            theme=birth_chart_request.theme,
+            chart_language=birth_chart_request.language or "EN",
+            active_points=birth_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=birth_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        )
+
+    with stage("render"):
+        svg, charts = make_chart_svg(
+            kerykeion_chart,
+            theme=birth_chart_request.theme,
+            language=birth_chart_request.language or "EN",
+            themes=birth_chart_request.themes,
+            languages=birth_chart_request.languages,
+            wheel_only=bool(birth_chart_request.wheel_only),
+        )
+
+    return {
+        "status": "OK",
+        "chart": svg,
+        "charts": charts,
+        "data": astrological_subject.model().model_dump(),
+        "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
+    }
+
+
+def compute_synastry_chart(synastry_chart_request: SynastryChartRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(synastry_chart_request.first_subject)
+    second_astrological_subject = get_astrological_subject(synastry_chart_request.second_subject)
+
+    with stage("aspects"):
+        kerykeion_chart = KerykeionChartSVG(
+            first_astrological_subject,
+            second_obj=second_astrological_subject,
+            chart_type="Synastry",
+            theme=synastry_chart_request.theme,
+            chart_language=synastry_chart_request.language or "EN",
+            active_points=synastry_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=synastry_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        )
+
+    with stage("render"):
+        svg, charts = make_chart_svg(
+            kerykeion_chart,
+            theme=synastry_chart_request.theme,
+            language=synastry_chart_request.language or "EN",
+            themes=synastry_chart_request.themes,
+            languages=synastry_chart_request.languages,
+            wheel_only=bool(synastry_chart_request.wheel_only),
+        )
+
+    return {
+        "status": "OK",
+        "chart": svg,
+        "charts": charts,
+        "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
+        "data": {
+            "first_subject": first_astrological_subject.model().model_dump(),
+            "second_subject": second_astrological_subject.model().model_dump(),
+        },
+    }
+
+
+def compute_transit_chart(transit_chart_request: TransitChartRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(transit_chart_request.first_subject)
+    with stage("transit_subject"):
+        second_astrological_subject, second_subject_data = get_transit_astrological_subject(transit_chart_request.transit_subject, transit_chart_request.first_subject)
+
+    with stage("aspects"):
+        kerykeion_chart = KerykeionChartSVG(
+            first_astrological_subject,
+            second_obj=second_astrological_subject,
+            chart_type="Transit",
+            theme=transit_chart_request.theme,
+            chart_language=transit_chart_request.language or "EN",
+            active_points=transit_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=transit_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        )
+
+    with stage("render"):
+        svg, charts = make_chart_svg(
+            kerykeion_chart,
+            theme=transit_chart_request.theme,
+            language=transit_chart_request.language or "EN",
+            themes=transit_chart_request.themes,
+            languages=transit_chart_request.languages,
+            wheel_only=bool(transit_chart_request.wheel_only),
+        )
+
+    return {
+        "status": "OK",
+        "chart": svg,
+        "charts": charts,
+        "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
+        "data": {
+            "subject": first_astrological_subject.model().model_dump(),
+            "transit": second_subject_data,
+        },
+    }
+
+
+def compute_transit_aspects_data(transit_chart_request: TransitChartRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(transit_chart_request.first_subject)
+    with stage("transit_subject"):
+        second_astrological_subject, second_subject_data = get_transit_astrological_subject(transit_chart_request.transit_subject, transit_chart_request.first_subject)
+
+    with stage("aspects"):
+        aspects = SynastryAspects(
+            first_astrological_subject,
+            second_astrological_subject,
+            active_points=transit_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=transit_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        ).relevant_aspects
+
+    return {
+        "status": "OK",
+        "data": {
+            "subject": first_astrological_subject.model().model_dump(),
+            "transit": second_subject_data,
+        },
+        "aspects": [aspect.model_dump() for aspect in aspects],
+    }
+
+
+def compute_synastry_aspects_data(aspects_request_content: SynastryAspectsRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(aspects_request_content.first_subject)
+    second_astrological_subject = get_astrological_subject(aspects_request_content.second_subject)
+
+    with stage("aspects"):
+        aspects = SynastryAspects(
+            first_astrological_subject,
+            second_astrological_subject,
+            active_points=aspects_request_content.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=aspects_request_content.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        ).relevant_aspects
+
+    return {
+        "status": "OK",
+        "data": {
+            "first_subject": first_astrological_subject.model().model_dump(),
+            "second_subject": second_astrological_subject.model().model_dump(),
+        },
+        "aspects": [aspect.model_dump() for aspect in aspects],
+    }
+
+
+def compute_natal_aspects_data(aspects_request_content: NatalAspectsRequestModel) -> dict:
+    astrological_subject = get_astrological_subject(aspects_request_content.subject)
+
+    with stage("aspects"):
+        aspects = NatalAspects(
+            astrological_subject,
+            active_points=aspects_request_content.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=aspects_request_content.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        ).relevant_aspects
+
+    return {
+        "status": "OK",
+        "data": {"subject": astrological_subject.model().model_dump()},
+        "aspects": [aspect.model_dump() for aspect in aspects],
+    }
+
+
+def compute_relationship_score(relationship_score_request: RelationshipScoreRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(relationship_score_request.first_subject)
+    second_astrological_subject = get_astrological_subject(relationship_score_request.second_subject)
+
+    with stage("score"):
+        score_model = RelationshipScoreFactory(first_astrological_subject, second_astrological_subject).get_relationship_score()
+
+    return {
+        "status": "OK",
+        "score": score_model.score_value,
+        "score_description": score_model.score_description,
+        "is_destiny_sign": score_model.is_destiny_sign,
+        "aspects": [aspect.model_dump() for aspect in score_model.aspects],
+        "data": {
+            "first_subject": first_astrological_subject.model().model_dump(),
+            "second_subject": second_astrological_subject.model().model_dump(),
+        },
+    }
+
+
+def compute_relationship_score_ranking(ranking_request: RelationshipScoreRankingRequestModel) -> dict:
+    with stage("ranking"):
+        ranking, scored_count = get_relationship_score_ranking(
+            ranking_request.subject,
+            ranking_request.candidates,
+            ranking_request.top_k,
+        )
+
+    return {
+        "status": "OK",
+        "ranking": ranking,
+        "candidates_count": len(ranking_request.candidates),
+        "scored_count": scored_count,
+    }
+
+
+def _get_composite_subject_dict(composite_subject) -> dict:
+    composite_subject_dict = composite_subject.model_dump()
+    for key in ["first_subject", "second_subject"]:
+        if key in composite_subject_dict:
+            composite_subject_dict.pop(key)
+
+    return composite_subject_dict
+
+
+def compute_composite_chart(composite_chart_request: CompositeChartRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(composite_chart_request.first_subject)
+    second_astrological_subject = get_astrological_subject(composite_chart_request.second_subject)
+
+    with stage("composite"):
+        composite_subject = CompositeSubjectFactory(first_astrological_subject, second_astrological_subject).get_midpoint_composite_subject_model()
+
+    with stage("aspects"):
+        kerykeion_chart = KerykeionChartSVG(
+            composite_subject,
+            chart_type="Composite",
+            theme=composite_chart_request.theme,
+            chart_language=composite_chart_request.language or "EN",
+        )
+
+    with stage("render"):
+        svg, charts = make_chart_svg(
+            kerykeion_chart,
+            theme=composite_chart_request.theme,
+            language=composite_chart_request.language or "EN",
+            themes=composite_chart_request.themes,
+            languages=composite_chart_request.languages,
+            wheel_only=bool(composite_chart_request.wheel_only),
+        )
+
+    return {
+        "status": "OK",
+        "chart": svg,
+        "charts": charts,
+        "aspects": [aspect.model_dump() for aspect in kerykeion_chart.aspects_list],
+        "data": {
+            "composite_subject": _get_composite_subject_dict(composite_subject),
+            "first_subject": first_astrological_subject.model().model_dump(),
+            "second_subject": second_astrological_subject.model().model_dump(),
+        },
+    }
+
+
+def compute_composite_aspects_data(composite_chart_request: CompositeChartRequestModel) -> dict:
+    first_astrological_subject = get_astrological_subject(composite_chart_request.first_subject)
+    second_astrological_subject = get_astrological_subject(composite_chart_request.second_subject)
+
+    with stage("composite"):
+        composite_subject = CompositeSubjectFactory(first_astrological_subject, second_astrological_subject).get_midpoint_composite_subject_model()
+
+    with stage("aspects"):
+        aspects = NatalAspects(
+            composite_subject,
+            active_points=composite_chart_request.active_points or DEFAULT_ACTIVE_POINTS,
+            active_aspects=composite_chart_request.active_aspects or DEFAULT_ACTIVE_ASPECTS,
+        ).relevant_aspects
+
+    return {
+        "status": "OK",
+        "data": {
+            "composite_subject": _get_composite_subject_dict(composite_subject),
+            "first_subject": first_astrological_subject.model().model_dump(),
+            "second_subject": second_astrological_subject.model().model_dump(),
+        },
+        "aspects": [aspect.model_dump() for aspect in aspects],
+    }
+
+
+def _get_calendar_arguments(calendar_request: CalendarRequestModel) -> tuple:
+    return (
+        calendar_request.start_year,
+        calendar_request.start_month,
+        calendar_request.end_year,
+        calendar_request.end_month,
+        calendar_request.timezone,
+        calendar_request.sidereal_mode,
+    )
+
+
+def compute_lunar_phases_calendar(calendar_request: CalendarRequestModel) -> dict:
+    with stage("calendar"):
+        return {"status": "OK", **get_lunar_phases_calendar(*_get_calendar_arguments(calendar_request))}
+
+
+def compute_sign_ingresses_calendar(calendar_request: CalendarRequestModel) -> dict:
+    with stage("calendar"):
+        return {"status": "OK", "sign_ingresses": get_sign_ingresses_calendar(*_get_calendar_arguments(calendar_request))}
+
+
+def compute_retrograde_stations_calendar(calendar_request: CalendarRequestModel) -> dict:
+    with stage("calendar"):
+        return {"status": "OK", "retrograde_stations": get_retrograde_stations_calendar(*_get_calendar_arguments(calendar_request))}
@@ -0,0 +1,121 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, TypeVar
+
+from ..config.settings import settings
+from .cancellation import computation_cancelled
+from .request_profiler import get_request_profiler
+from .stage_timer import record_stage
+
+T = TypeVar("T")
+
+
+class ComputePoolDrainingError(RuntimeError):
+    """
+    Raised for a computation submitted while the worker is draining (shutting down).
+    """
+
+
+class ComputePool:
+    """
+    The threads running the astrological calculations, so that the event loop keeps serving requests
+    while a chart is computed.
+
+    The Swiss Ephemeris keeps global state (ephemeris path, sidereal mode, topocentric position), so
+    calculations must not overlap: the pool should have a single worker unless every calculation sets
+    that state under a lock.
+
+    While `draining`, new computations are refused with ComputePoolDrainingError.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.draining = False
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compute")
+
+    def _run(self, state: dict, submitted_at: float, function: Callable[..., T], *args: Any) -> T:
+        record_stage("queue", time.perf_counter() - submitted_at)
+
+        with self._lock:
+            if not state["dequeued"]:
+                state["dequeued"] = True
+                self.queued -= 1
+
+            self.running += 1
+
+        try:
+            profiler = get_request_profiler()
+            if profiler is None:
+                return function(*args)
+
+            with profiler.running():
+                return function(*args)
+
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        """
+        Runs the function in the pool and waits for its result. The context variables of the caller
+        (eg. the request id) are visible to the function, and the wait in the queue is recorded as the
+        "queue" stage of the request. The function is profiled when the request is.
+
+        When the caller is cancelled the computation is dropped if still queued, and stopped at its next
+        stage if running (see check_cancelled).
+        """
+
+        if self.draining:
+            raise ComputePoolDrainingError("The compute pool is draining")
+
+        state = {"dequeued": False}
+
+        with self._lock:
+            self.queued += 1
+
+        cancelled = threading.Event()
+        context = contextvars.copy_context()
+        context.run(computation_cancelled.set, cancelled)
+        loop = asyncio.get_running_loop()
+
+        try:
+            return await loop.run_in_executor(self._executor, context.run, functools.partial(self._run, state, time.perf_counter(), function, *args))
+
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+        finally:
+            # Cancelled before running (the caller was cancelled, or the pool shut down)
+            with self._lock:
+                if not state["dequeued"]:
+                    state["dequeued"] = True
+                    self.queued -= 1
+                    self.cancelled += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the threads, after the queued computations (wait) or cancelling them. The pool can be used
+        again afterwards, with new threads (eg. when the app is started again in the same process).
+        """
+
+        executor, self._executor = self._executor, ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute")
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+compute_pool = ComputePool(settings.compute_pool_workers)
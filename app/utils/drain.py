@@ -0,0 +1,85 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import time
+from logging import getLogger
+from typing import Callable, Union
+
+from ..config.settings import settings
+from .cache_snapshots import cache_snapshots
+from .compute_pool import compute_pool
+from .readiness import readiness
+
+logger = getLogger(__name__)
+
+
+class Drain:
+    """
+    The graceful shutdown of a worker. From the start of the drain (the shutdown signal when the server
+    supports it, see prefork_server, or the end of the uvicorn shutdown) the worker reports not ready
+    and the compute pool refuses new computations, while the computations in progress finish.
+
+    The end of the drain, in the lifespan shutdown, waits for the compute pool to be idle until
+    `timeout` seconds after the start, cancels the computations still queued, then saves the cache
+    snapshots and closes what was registered with add_closer (writers and backends), in order.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.started_at: Union[float, None] = None
+        self._closers: list[tuple[str, Callable[[], None]]] = []
+
+    @property
+    def draining(self) -> bool:
+        return self.started_at is not None
+
+    def add_closer(self, name: str, close: Callable[[], None]) -> None:
+        self._closers.append((name, close))
+
+    def start(self) -> None:
+        """
+        Starts the drain. It only sets flags, so that it can be called from a signal handler.
+        """
+
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+            readiness.draining = True
+            compute_pool.draining = True
+
+    def reset(self) -> None:
+        """
+        Accepts computations again, when the app is started again in the same process (eg. by the tests).
+        """
+
+        self.started_at = None
+        readiness.draining = False
+        compute_pool.draining = False
+
+    async def finish(self) -> None:
+        self.start()
+        assert self.started_at is not None
+        deadline = self.started_at + self.timeout
+
+        while compute_pool.queued + compute_pool.running > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if compute_pool.queued + compute_pool.running > 0:
+            logger.error(f"Drain timeout of {self.timeout}s exceeded: {compute_pool.queued} computations cancelled, {compute_pool.running} still running")
+
+        compute_pool.shutdown(wait=False)
+
+        await readiness.stop()
+        await cache_snapshots.stop()
+
+        for name, close in self._closers:
+            try:
+                await asyncio.to_thread(close)
+            except Exception as e:
+                logger.error(f"Could not close {name}: {e}")
+
+        logger.info(f"Drained in {time.monotonic() - self.started_at:.3f}s, {compute_pool.completed} computations completed")
+
+
+drain = Drain(settings.drain_timeout)
@@ -0,0 +1,71 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from kerykeion import AstrologicalSubject, KerykeionException
+
+from .request_hash import get_canonical_request_json
+from .shared_memory_cache import get_shared_memory_cache
+from .request_profiler import get_request_profiler
+from .stage_timer import stage
+from .readiness import geonames_dependency
+from ..types.request_models import SubjectModel
+
+
+def get_astrological_subject(subject: SubjectModel) -> AstrologicalSubject:
+    """
+    Returns the Kerykeion AstrologicalSubject for a validated SubjectModel. The subjects are shared
+    by the workers through the "subjects" shared cache, and every call returns a new object.
+    """
+
+    with stage("subject"):
+        shared_cache = get_shared_memory_cache("subjects")
+        # A profiled request builds the subject, to profile it.
+        if shared_cache is None or get_request_profiler() is not None:
+            return build_astrological_subject(subject)
+
+        return shared_cache.get_or_set(get_canonical_request_json(subject), build_astrological_subject, subject)
+
+
+class TimedAstrologicalSubject(AstrologicalSubject):
+    """
+    An AstrologicalSubject timing the GeoNames requests as a stage of the request, and recording their
+    outcome in the status of the GeoNames dependency.
+    """
+
+    def _fetch_and_set_tz_and_coordinates_from_geonames(self) -> None:
+        with stage("geonames"):
+            try:
+                super()._fetch_and_set_tz_and_coordinates_from_geonames()
+
+            except KerykeionException:
+                geonames_dependency.record(False)
+                raise
+
+            geonames_dependency.record(True)
+
+
+def build_astrological_subject(subject: SubjectModel) -> AstrologicalSubject:
+    """
+    Builds the Kerykeion AstrologicalSubject for a validated SubjectModel.
+    """
+
+    return TimedAstrologicalSubject(
+        name=subject.name,
+        year=subject.year,
+        month=subject.month,
+        day=subject.day,
+        hour=subject.hour,
+        minute=subject.minute,
+        city=subject.city,
+        nation=subject.nation,
+        lat=subject.latitude,
+        lng=subject.longitude,
+        tz_str=subject.timezone,
+        zodiac_type=subject.zodiac_type, # type: ignore
+        sidereal_mode=subject.sidereal_mode,
+        houses_system_identifier=subject.houses_system_identifier, # type: ignore
+        perspective_type=subject.perspective_type, # type: ignore
+        geonames_username=subject.geonames_username,
+        online=True if subject.geonames_username else False,
+    )
@@ -0,0 +1,27 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import kerykeion.charts.kerykeion_chart_svg
+
+from .stage_timer import stage
+
+_scour_string = kerykeion.charts.kerykeion_chart_svg.scourString
+
+
+def _timed_scour_string(*args, **kwargs) -> str:
+    with stage("minify"):
+        return _scour_string(*args, **kwargs)
+
+
+def patch_kerykeion() -> None:
+    """
+    The changes the app makes to kerykeion, all of them here, applied once by app.main.
+
+    - kerykeion.charts.kerykeion_chart_svg.scourString: the minification of the charts (Scour, called by
+      KerykeionChartSVG.makeTemplate and makeWheelOnlyTemplate with minify=True) is timed as the "minify"
+      stage of the request. The function is replaced in the module, so it applies to every chart rendered
+      in the process; the charts are unchanged.
+    """
+
+    kerykeion.charts.kerykeion_chart_svg.scourString = _timed_scour_string
@@ -0,0 +1,246 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import math
+import os
+import resource
+import sys
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Union
+
+# Upper bounds (seconds) of the buckets of the duration histograms
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric(ABC):
+    """
+    A metric exposed by the /metrics endpoint in the Prometheus text format. Every instance is
+    registered by name in `Metric.registry`.
+    """
+
+    registry: dict[str, "Metric"] = {}
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...]) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+
+        Metric.registry[name] = self
+
+    @abstractmethod
+    def get_samples(self) -> list[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """
+        The samples of the metric: (name suffix, label names, label values, value).
+        """
+
+
+class Counter(Metric):
+    """
+    A thread safe counter with labels, only going up.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, description, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def inc(self, label_values: tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self) -> dict[tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def get_samples(self) -> list[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        return [("", self.label_names, label_values, value) for label_values, value in self.collect().items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """
+    A thread safe value with labels, going up and down (eg. the requests in progress).
+    """
+
+    type = "gauge"
+
+    def dec(self, label_values: tuple[str, ...] = (), amount: float = 1) -> None:
+        self.inc(label_values, -amount)
+
+
+class CallbackMetric(Metric):
+    """
+    A counter or gauge read when the metrics are collected, from the counters the components already
+    keep (eg. the hits of the caches): nothing is added to the path of the requests.
+
+    The callback returns the values by label values.
+    """
+
+    def __init__(self, name: str, description: str, type: str, label_names: tuple[str, ...], callback: Callable[[], dict[tuple[str, ...], float]]) -> None:
+        super().__init__(name, description, label_names)
+        self.type = type
+        self.callback = callback
+
+    def get_samples(self) -> list[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        return [("", self.label_names, label_values, value) for label_values, value in self.callback().items()]
+
+
+class Histogram(Metric):
+    """
+    A thread safe histogram with labels: for every combination of the label values, the count of the
+    observations in every bucket, their sum and their number. Observing is a bisection and three
+    additions, so it can be done for every request.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...], buckets: tuple[float, ...] = DURATION_BUCKETS) -> None:
+        super().__init__(name, description, label_names)
+        self.buckets = buckets
+        # Label values -> [count of each bucket (the last one for +Inf), sum, count]
+        self._values: dict[tuple[str, ...], list] = {}
+        self._lock = Lock()
+
+    def observe(self, label_values: tuple[str, ...], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            values = self._values.get(label_values)
+            if values is None:
+                values = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            values[0][index] += 1
+            values[1] += value
+            values[2] += 1
+
+    def collect(self) -> dict[tuple[str, ...], tuple[list[int], float, int]]:
+        """
+        A snapshot of the histogram: label values -> (count of each bucket, sum, count).
+        """
+
+        with self._lock:
+            return {label_values: (list(values[0]), values[1], values[2]) for label_values, values in self._values.items()}
+
+    def get_samples(self) -> list[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        samples = []
+        label_names = (*self.label_names, "le")
+
+        for label_values, (bucket_counts, total, count) in self.collect().items():
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip((*self.buckets, math.inf), bucket_counts):
+                cumulative_count += bucket_count
+                samples.append(("_bucket", label_names, (*label_values, format_value(upper_bound)), cumulative_count))
+
+            samples.append(("_sum", self.label_names, label_values, total))
+            samples.append(("_count", self.label_names, label_values, count))
+
+        return samples
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def format_value(value: Union[int, float]) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return f"{value:.1f}"
+
+    return repr(value)
+
+
+def escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_metrics() -> str:
+    """
+    All the registered metrics in the Prometheus text exposition format (version 0.0.4). A metric whose
+    callback fails is skipped.
+    """
+
+    lines = []
+
+    for metric in list(Metric.registry.values()):
+        try:
+            samples = metric.get_samples()
+        except Exception:
+            continue
+
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+
+        for suffix, label_names, label_values, value in samples:
+            labels = ",".join(f'{label_name}="{escape_label_value(label_value)}"' for label_name, label_value in zip(label_names, label_values))
+            lines.append(f"{metric.name}{suffix}{{{labels}}} {format_value(value)}" if labels else f"{metric.name}{suffix} {format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def get_process_memory() -> dict[tuple[str, ...], float]:
+    """
+    The resident and virtual memory of the process in bytes, from /proc on Linux; elsewhere only the
+    peak resident memory is known.
+    """
+
+    try:
+        with open("/proc/self/statm") as statm:
+            virtual_pages, resident_pages = statm.read().split()[:2]
+
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        return {("resident",): int(resident_pages) * page_size, ("virtual",): int(virtual_pages) * page_size}
+
+    except (OSError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {("max_resident",): max_rss if sys.platform == "darwin" else max_rss * 1024}
+
+
+stage_duration_seconds = Histogram(
+    "astrologer_api_stage_duration_seconds",
+    "Duration of the stages of the computations (subject, geonames, aspects, chart, render, serialization, ...)",
+    ("endpoint", "stage"),
+)
+
+request_duration_seconds = Histogram(
+    "astrologer_api_request_duration_seconds",
+    "Duration of the requests, until the response is sent",
+    ("endpoint",),
+)
+
+requests_total = Counter(
+    "astrologer_api_requests_total",
+    "Requests served, by endpoint, method and status",
+    ("endpoint", "method", "status"),
+)
+
+requests_in_progress = Gauge(
+    "astrologer_api_requests_in_progress",
+    "Requests being served",
+)
+
+computation_errors_total = Counter(
+    "astrologer_api_computation_errors_total",
+    "Computations failed, by endpoint and type (geonames: city not found or invalid GeoNames username, clock: time API unreachable, timeout: over the compute deadline, disconnected: client gone, internal: any other error)",
+    ("endpoint", "type"),
+)
+
+process_memory_bytes = CallbackMetric(
+    "astrologer_api_process_memory_bytes",
+    "Memory of the process",
+    "gauge",
+    ("type",),
+    get_process_memory,
+)
@@ -0,0 +1,80 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import hashlib
+import json
+import os
+from importlib.metadata import version
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Union
+
+logger = getLogger(__name__)
+
+APP_DIRECTORY = Path(__file__).parent.parent
+
+# The packages whose versions change the generated OpenAPI document (the models of kerykeion are part of it)
+OPENAPI_PACKAGES = ("fastapi", "pydantic", "kerykeion")
+
+
+def get_openapi_fingerprint() -> str:
+    """
+    The fingerprint of everything the OpenAPI document is generated from: the sources and the config of
+    the app (and which config is loaded), and the versions of the packages. It does not import the app,
+    so that a cached document is found without the cost of importing it.
+    """
+
+    digest = hashlib.sha256(f"ENV_TYPE={os.getenv('ENV_TYPE', '')}\n".encode())
+
+    for package in OPENAPI_PACKAGES:
+        digest.update(f"{package}=={version(package)}\n".encode())
+
+    for path in sorted([*APP_DIRECTORY.rglob("*.py"), *APP_DIRECTORY.glob("config/*.toml")]):
+        digest.update(path.relative_to(APP_DIRECTORY).as_posix().encode() + b"\n")
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
+def load_cached_openapi(path: Union[str, Path], fingerprint: str) -> Union[dict, None]:
+    """
+    The cached OpenAPI document, or None when missing, unreadable or generated from other sources.
+    """
+
+    try:
+        with open(path, encoding="utf-8") as cache_file:
+            cached = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get("fingerprint") != fingerprint:
+        return None
+
+    return cached.get("openapi")
+
+
+def get_cached_openapi(path: Union[str, Path], generate: Callable[[], dict]) -> dict:
+    """
+    The OpenAPI document from the cache file, or generated and written to it. Generating the document
+    builds the JSON schema of every model (about 100 ms), for every worker and every dump_schema.py run.
+    """
+
+    fingerprint = get_openapi_fingerprint()
+
+    openapi = load_cached_openapi(path, fingerprint)
+    if openapi is not None:
+        return openapi
+
+    openapi = generate()
+
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = Path(path).with_name(f"{Path(path).name}.{os.getpid()}.tmp")
+        temporary_path.write_text(json.dumps({"fingerprint": fingerprint, "openapi": openapi}), encoding="utf-8")
+        temporary_path.replace(path)
+
+    except OSError as e:
+        logger.warning(f"Could not write the OpenAPI cache {path}: {e}")
+
+    return openapi
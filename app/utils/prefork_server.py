@@ -0,0 +1,310 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import gc
+import importlib
+import logging
+import logging.config
+import mmap
+import os
+import signal
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import FrameType
+from typing import Union, get_args
+
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_STRUCT = struct.Struct("d")
+
+# The modules imported by app.main and uvicorn: app.main itself is imported by every worker, since it
+# starts the threads of the logging and of the middlewares, which would not survive the fork.
+PRELOADED_MODULES = (
+    "uvicorn.server",
+    "uvicorn.lifespan.on",
+    "uvicorn.protocols.http.auto",
+    "uvicorn.loops.auto",
+    "app.routers.main_router",
+    "app.middleware.secret_key_checker_middleware",
+    "app.middleware.response_cache_middleware",
+    "app.middleware.rate_limit_middleware",
+    "app.middleware.request_context_middleware",
+    "app.middleware.profiling_middleware",
+    "app.middleware.request_capture_middleware",
+    "app.utils.api_key_store",
+    "app.utils.rate_limit_backends",
+    "app.utils.structured_logging",
+    "app.utils.app_metrics",
+    "app.utils.request_capture",
+    "app.utils.drain",
+)
+
+
+@dataclass
+class Worker:
+    index: int
+    pid: int
+    started: float
+
+
+def preload() -> None:
+    """
+    Loads in the master, before the workers are forked, what every worker would otherwise load for
+    itself: kerykeion, uvicorn and the app modules, the shared caches (restored from their snapshots), the
+    timezone index, the timezones, the chart themes, the calendar tables of the current year, and the
+    code paths and templates of a chart (by computing one).
+    """
+
+    # Imported here: the master only needs them to preload, and the workers inherit them.
+    import swisseph
+    from kerykeion.kr_types.kr_literals import KerykeionChartTheme
+
+    from ..types.request_models import BirthChartRequestModel
+    from .astrological_calendar import get_year_tables
+    from .cache_snapshots import cache_snapshots
+    from .chart_variants import _get_minified_theme_css
+    from .computations import compute_birth_chart
+    from .readiness import WARM_UP_SUBJECT
+    from .timezones import get_timezone_index, is_valid_timezone
+
+    start = time.perf_counter()
+
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+
+    # The shared caches are created, and restored from their snapshots, by the master.
+    cache_snapshots.open_shared_memory_caches()
+
+    get_timezone_index()
+    is_valid_timezone("UTC")
+
+    for theme in get_args(KerykeionChartTheme):
+        _get_minified_theme_css(theme)
+
+    try:
+        get_year_tables(datetime.now(timezone.utc).year)
+        compute_birth_chart(BirthChartRequestModel.model_validate({"subject": WARM_UP_SUBJECT}))
+
+    except Exception as e:
+        logger.error(f"Preload failed: {e}")
+
+    # The ephemeris files are opened again by every worker: the file offsets must not be shared.
+    swisseph.close()
+
+    # The preloaded objects are never collected, so that the garbage collector of the workers does not
+    # write to (and copy) their pages.
+    gc.collect()
+    gc.freeze()
+
+    logger.info(f"Preloaded in {time.perf_counter() - start:.3f}s, {gc.get_freeze_count()} objects shared with the workers")
+
+
+async def serve_worker(server, listening_socket: socket.socket, heartbeats: mmap.mmap, index: int, heartbeat_interval: float) -> None:
+    async def beat() -> None:
+        while True:
+            HEARTBEAT_STRUCT.pack_into(heartbeats, HEARTBEAT_STRUCT.size * index, time.monotonic())
+            await asyncio.sleep(heartbeat_interval)
+
+    heartbeat_task = asyncio.create_task(beat())
+
+    try:
+        await server.serve(sockets=[listening_socket])
+    finally:
+        heartbeat_task.cancel()
+
+
+class PreforkServer:
+    """
+    Runs the app in `workers` processes forked from a master, sharing the listening socket and, copy on
+    write, everything the master preloaded (see preload): the memory of a worker is mostly its own
+    requests and caches.
+
+    The master supervises the workers: a worker that exits is started again (after `restart_delay`
+    seconds when it did not live that long, so that a worker failing at startup does not fork in a
+    loop), and a worker whose event loop did not beat for `worker_timeout` seconds is killed and
+    started again. On SIGTERM or SIGINT the workers are stopped gracefully: they drain (finishing the
+    requests and computations in progress for up to drain_timeout seconds) and are killed when still
+    running after `graceful_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        workers: int = 2,
+        worker_timeout: float = 30,
+        graceful_timeout: float = settings.drain_timeout + 10,
+        restart_delay: float = 1,
+        heartbeat_interval: float = 1,
+        uvicorn_options: Union[dict, None] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.workers_count = max(1, workers)
+        self.worker_timeout = worker_timeout
+        self.graceful_timeout = graceful_timeout
+        self.restart_delay = restart_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.uvicorn_options = uvicorn_options or {}
+        self.workers: dict[int, Worker] = {}
+        self.restarts = 0
+        self._stopping = False
+        self._socket: Union[socket.socket, None] = None
+        self._heartbeats = mmap.mmap(-1, HEARTBEAT_STRUCT.size * self.workers_count)
+
+    def _get_heartbeat(self, index: int) -> float:
+        return HEARTBEAT_STRUCT.unpack_from(self._heartbeats, HEARTBEAT_STRUCT.size * index)[0]
+
+    def _run_worker(self, index: int) -> None:
+        """
+        The worker process: serves the app on the listening socket of the master until stopped. On
+        SIGTERM the worker starts draining (see drain) while uvicorn stops accepting connections, and
+        uvicorn cancels the requests still running after drain_timeout seconds.
+        """
+
+        import uvicorn
+
+        from .drain import drain
+
+        class DrainingServer(uvicorn.Server):
+            def handle_exit(self, sig: int, frame: Union[FrameType, None]) -> None:
+                drain.start()
+                super().handle_exit(sig, frame)
+
+        for signal_number in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signal_number, signal.SIG_DFL)
+
+        assert self._socket is not None
+        config = uvicorn.Config(
+            "app.main:app",
+            # The logging is configured by the app, with its own threads.
+            log_config=None,
+            timeout_graceful_shutdown=int(settings.drain_timeout),
+            **self.uvicorn_options,
+        )
+        asyncio.run(serve_worker(DrainingServer(config), self._socket, self._heartbeats, index, self.heartbeat_interval))
+
+    def _spawn_worker(self, index: int) -> None:
+        HEARTBEAT_STRUCT.pack_into(self._heartbeats, HEARTBEAT_STRUCT.size * index, time.monotonic())
+
+        pid = os.fork()
+
+        if pid == 0:
+            exit_code = 0
+
+            try:
+                self._run_worker(index)
+            except BaseException:
+                logger.exception(f"Worker {index} failed")
+                exit_code = 1
+            finally:
+                # The records still queued are written: os._exit does not run the atexit handlers.
+                from .structured_logging import stop_logging
+
+                stop_logging()
+                logging.shutdown()
+                os._exit(exit_code)
+
+        self.workers[pid] = Worker(index, pid, time.monotonic())
+        logger.info(f"Worker {index} started", extra={"pid": pid})
+
+    def _reap_workers(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+
+            if pid == 0:
+                return
+
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+
+            if not self._stopping:
+                self.restarts += 1
+                logger.warning(f"Worker {worker.index} exited with status {os.waitstatus_to_exitcode(status)}, starting it again", extra={"pid": pid})
+
+                if time.monotonic() - worker.started < self.restart_delay:
+                    time.sleep(self.restart_delay)
+
+                self._spawn_worker(worker.index)
+
+    def _kill_stalled_workers(self) -> None:
+        now = time.monotonic()
+
+        for worker in list(self.workers.values()):
+            if now - self._get_heartbeat(worker.index) > self.worker_timeout:
+                logger.error(f"Worker {worker.index} did not answer for {self.worker_timeout}s, killing it", extra={"pid": worker.pid})
+
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _handle_stop(self, signal_number: int, frame: Union[FrameType, None]) -> None:
+        self._stopping = True
+
+    def _stop_workers(self) -> None:
+        for worker in self.workers.values():
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap_workers()
+            time.sleep(0.1)
+
+        for worker in self.workers.values():
+            logger.warning(f"Worker {worker.index} still running after {self.graceful_timeout}s, killing it", extra={"pid": worker.pid})
+            try:
+                os.kill(worker.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            self.workers.pop(pid, None)
+
+    def run(self) -> None:
+        """
+        Preloads, binds the socket, forks the workers and supervises them until SIGTERM or SIGINT.
+        """
+
+        preload()
+
+        self._socket = socket.create_server((self.host, self.port), backlog=2048)
+        logger.info(f"Listening on {self.host}:{self.port} with {self.workers_count} workers")
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        for index in range(self.workers_count):
+            self._spawn_worker(index)
+
+        while not self._stopping:
+            self._reap_workers()
+            self._kill_stalled_workers()
+            time.sleep(0.2)
+
+        logger.info("Stopping the workers")
+        self._stop_workers()
+        self._socket.close()
+
+
+def setup_master_logging() -> None:
+    """
+    The logging of the master, without the queue threads of the workers: threads do not survive a fork.
+    """
+
+    logging.config.dictConfig(settings.LOGGING_CONFIG)
@@ -0,0 +1,131 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from typing import Any, TypeVar, Union, get_args, get_origin
+
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic.fields import FieldInfo
+from starlette.datastructures import QueryParams
+
+from ..types.request_models import AbstractBaseSubjectModel
+
+T = TypeVar("T", bound=BaseModel)
+
+# Query parameters prefixes of the subjects, eg. first_year and second_year. The fields of a single
+# subject have no prefix.
+SUBJECT_PREFIXES = {
+    "subject": "",
+    "first_subject": "first_",
+    "second_subject": "second_",
+    "transit_subject": "transit_",
+}
+
+
+def _get_subject_model(annotation: Any) -> Union[type[AbstractBaseSubjectModel], None]:
+    if isinstance(annotation, type) and issubclass(annotation, AbstractBaseSubjectModel):
+        return annotation
+
+    return None
+
+
+def _is_list(annotation: Any) -> bool:
+    if get_origin(annotation) is list:
+        return True
+
+    return any(get_origin(argument) is list for argument in get_args(annotation))
+
+
+def _parse_active_aspect(value: str) -> Union[dict, str]:
+    """
+    Active aspects are passed as "<name>:<orb>", eg. "conjunction:10".
+    """
+
+    name, separator, orb = value.partition(":")
+    if not separator:
+        return value
+
+    return {"name": name, "orb": orb}
+
+
+def _get_query_parameter(name: str, field: FieldInfo, required: bool) -> dict:
+    schema = TypeAdapter(field.annotation).json_schema()
+
+    # The models referenced in the schema are in the body of the POST endpoint only.
+    if "$defs" in schema:
+        schema = {"type": "array", "items": {"type": "string"}} if _is_list(field.annotation) else {"type": "string"}
+
+    parameter = {"name": name, "in": "query", "required": required, "schema": schema}
+    if field.description:
+        parameter["description"] = field.description
+
+    return parameter
+
+
+def get_query_parameters(request_model_class: type[BaseModel]) -> list[dict]:
+    """
+    The OpenAPI description of the query parameters read by get_request_model_from_query, for the
+    openapi_extra of the GET variants: the parameters are not declared to FastAPI, which would
+    validate them a second time.
+    """
+
+    parameters = []
+
+    for field_name, field in request_model_class.model_fields.items():
+        subject_model = _get_subject_model(field.annotation)
+
+        if subject_model is not None:
+            prefix = SUBJECT_PREFIXES.get(field_name, f"{field_name}_")
+            for name, subject_field in subject_model.model_fields.items():
+                parameters.append(_get_query_parameter(prefix + name, subject_field, field.is_required() and subject_field.is_required()))
+
+        elif field_name == "active_aspects":
+            parameters.append(
+                {
+                    "name": field_name,
+                    "in": "query",
+                    "required": False,
+                    "schema": {"type": "array", "items": {"type": "string"}},
+                    "description": f"{field.description} Written as <name>:<orb>, eg. conjunction:10.",
+                }
+            )
+
+        else:
+            parameters.append(_get_query_parameter(field_name, field, field.is_required()))
+
+    return parameters
+
+
+def get_request_model_from_query(request_model_class: type[T], query_params: QueryParams) -> T:
+    """
+    Builds the request model of a POST endpoint from the query parameters of its GET variant, so the two
+    are validated in the same way. Lists are repeated parameters (eg. active_points=Sun&active_points=Moon),
+    and the subjects fields are prefixed as in SUBJECT_PREFIXES. Unknown parameters are ignored, as the
+    unknown fields of a JSON body.
+    """
+
+    data: dict[str, Any] = {}
+
+    for field_name, field in request_model_class.model_fields.items():
+        subject_model = _get_subject_model(field.annotation)
+
+        if subject_model is not None:
+            prefix = SUBJECT_PREFIXES.get(field_name, f"{field_name}_")
+            subject = {name: query_params[prefix + name] for name in subject_model.model_fields if prefix + name in query_params}
+            if subject:
+                data[field_name] = subject
+
+        elif _is_list(field.annotation):
+            values = query_params.getlist(field_name)
+            if values:
+                data[field_name] = [_parse_active_aspect(value) for value in values] if field_name == "active_aspects" else values
+
+        elif field_name in query_params:
+            data[field_name] = query_params[field_name]
+
+    try:
+        return request_model_class.model_validate(data)
+
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("query", *error["loc"])} for error in e.errors()])
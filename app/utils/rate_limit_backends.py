@@ -0,0 +1,153 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import math
+from abc import ABC, abstractmethod
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Union
+
+from .lru_cache import LRUCache
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    # Tokens left in the bucket after the request
+    remaining: int
+    # Seconds before the request can be retried (0 when allowed, infinite when the bucket does not refill)
+    retry_after: float
+    # Seconds before the bucket is full again (infinite when it does not refill)
+    reset: float
+
+
+def get_refill_time(tokens: float, rate: float) -> float:
+    """
+    Seconds to refill `tokens` tokens at `rate` tokens per second: infinite when the bucket does not
+    refill (a rate of 0, a fixed quota).
+    """
+
+    if tokens <= 0:
+        return 0.0
+
+    return tokens / rate if rate > 0 else math.inf
+
+
+def take_tokens(tokens: float, updated_at: float, now: float, cost: float, rate: float, burst: float) -> tuple[float, RateLimitResult]:
+    """
+    The token bucket: it holds up to `burst` tokens, refilled at `rate` tokens per second (never with a
+    rate of 0), and a request takes `cost` tokens. Returns the tokens left and the result, whose
+    retry_after and reset are infinite when the bucket does not refill.
+    """
+
+    rate = max(0.0, rate)
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+    if tokens >= cost:
+        tokens -= cost
+        return tokens, RateLimitResult(True, math.floor(tokens), 0.0, get_refill_time(burst - tokens, rate))
+
+    return tokens, RateLimitResult(False, math.floor(tokens), get_refill_time(cost - tokens, rate), get_refill_time(burst - tokens, rate))
+
+
+class RateLimitBackend(ABC):
+    """
+    Where the token buckets of the RateLimitMiddleware are kept, by key id. close releases what the
+    backend holds (eg. a connection) on shutdown.
+    """
+
+    name = "none"
+
+    @abstractmethod
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> RateLimitResult:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    The buckets in the process: each worker limits the requests it serves.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 100000) -> None:
+        self._buckets = LRUCache("rate_limit_buckets", max_keys)
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> RateLimitResult:
+        now = time.time()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens, result = take_tokens(tokens, updated_at, now, cost, rate, burst)
+        self._buckets.set(key, (tokens, now))
+
+        return result
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    The buckets in a SQLite database shared by the workers of the host, updated in a transaction so the
+    workers see each other's requests.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self._lock = Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    def _take(self, key: str, cost: float, rate: float, burst: float) -> RateLimitResult:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                now = time.time()
+                row = self._connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, result = take_tokens(*(row or (burst, now)), now, cost, rate, burst)
+                self._connection.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)", (key, tokens, now))
+                self._connection.execute("COMMIT")
+
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        return result
+
+    async def take(self, key: str, cost: float, rate: float, burst: float) -> RateLimitResult:
+        return await asyncio.to_thread(self._take, key, cost, rate, burst)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def get_rate_limit_backend(name: str, sqlite_path: str) -> Union[RateLimitBackend, None]:
+    """
+    The backend configured with rate_limit_backend: "memory", "sqlite" or "none".
+    """
+
+    if name == "memory":
+        return MemoryRateLimitBackend()
+
+    if name == "sqlite":
+        path = Path(sqlite_path)
+        if not path.is_absolute():
+            path = Path(__file__).parent.parent / path
+
+        return SQLiteRateLimitBackend(path)
+
+    if name in ("none", ""):
+        return None
+
+    raise ValueError(f"Unknown rate limit backend: {name}")
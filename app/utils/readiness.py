@@ -0,0 +1,218 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import time
+from logging import getLogger
+from threading import Lock
+from typing import Union
+
+from ..config.settings import settings
+from .compute_pool import compute_pool
+from .response_cache_backends import ResponseCacheBackend
+from .shared_memory_cache import get_open_shared_memory_caches
+
+logger = getLogger(__name__)
+
+# The subject of the warm-up chart
+WARM_UP_SUBJECT = {
+    "name": "Warm-up",
+    "year": 2000,
+    "month": 1,
+    "day": 1,
+    "hour": 12,
+    "minute": 0,
+    "latitude": 51.5074,
+    "longitude": -0.1278,
+    "city": "London",
+    "nation": "GB",
+    "timezone": "Europe/London",
+}
+
+
+class DependencyHealth:
+    """
+    The outcome of the last calls to an external dependency (GeoNames, the time API): "failing" after
+    `failure_threshold` consecutive failures, until a call succeeds again, and "unknown" before the first
+    call. A single failure (eg. a city not found) does not make the dependency failing.
+
+    Every instance is registered by name in `DependencyHealth.registry`.
+    """
+
+    registry: dict[str, "DependencyHealth"] = {}
+
+    def __init__(self, name: str, failure_threshold: int = 3) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.consecutive_failures = 0
+        self.last_call: Union[float, None] = None
+        self._lock = Lock()
+
+        DependencyHealth.registry[name] = self
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self.consecutive_failures = 0 if success else self.consecutive_failures + 1
+            self.last_call = time.time()
+
+    @property
+    def status(self) -> str:
+        if self.last_call is None:
+            return "unknown"
+
+        return "failing" if self.consecutive_failures >= self.failure_threshold else "ok"
+
+
+geonames_dependency = DependencyHealth("geonames")
+clock_dependency = DependencyHealth("clock")
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task sleeping `interval` seconds: a loop blocked by a
+    synchronous computation or overloaded with callbacks serves every request that late.
+    """
+
+    def __init__(self, interval: float = 0.25) -> None:
+        self.interval = interval
+        self.lag: Union[float, None] = None
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - start - self.interval)
+
+
+class Readiness:
+    """
+    Whether the worker should receive traffic: not draining (see drain), warmed up, with at most `max_queue_depth` computations
+    waiting for the compute pool, an event loop lag of at most `max_event_loop_lag` seconds, and none of
+    the `required_dependencies` (caches or dependencies, by name) failing. The other caches and
+    dependencies are reported without affecting the readiness.
+
+    The report does not depend on the previous probes, so that several probers (eg. the load balancer
+    health checks and the orchestrator) get the same answer. Only the changes of the readiness are
+    logged, not every probe.
+    """
+
+    def __init__(self, max_queue_depth: int, max_event_loop_lag: float, required_dependencies: tuple[str, ...] = (), cache_error_window: float = 30) -> None:
+        self.max_queue_depth = max_queue_depth
+        self.max_event_loop_lag = max_event_loop_lag
+        self.required_dependencies = required_dependencies
+        self.cache_error_window = cache_error_window
+        self.warmed_up = False
+        self.draining = False
+        self.response_cache_backend: Union[ResponseCacheBackend, None] = None
+        self.event_loop_lag_monitor = EventLoopLagMonitor()
+        self._ready: Union[bool, None] = None
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self, warm_up: bool = True) -> None:
+        """
+        Starts the event loop lag monitor and the warm-up, from the running event loop.
+        """
+
+        self._tasks.append(asyncio.create_task(self.event_loop_lag_monitor.run()))
+
+        if warm_up:
+            self._tasks.append(asyncio.create_task(self.warm_up()))
+        else:
+            self.warmed_up = True
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def warm_up(self) -> None:
+        """
+        Computes a birth chart, so that the ephemeris files, the timezones, the chart templates and the
+        code paths of the first requests are loaded before the worker reports ready. A failure is
+        logged, and the worker reports ready anyway: the requests would fail the same way.
+        """
+
+        from ..types.request_models import BirthChartRequestModel
+        from .computations import compute_birth_chart
+
+        start = time.perf_counter()
+
+        try:
+            await compute_pool.run(
+                compute_birth_chart,
+                BirthChartRequestModel.model_validate({"subject": WARM_UP_SUBJECT}),
+            )
+            logger.info(f"Warmed up in {time.perf_counter() - start:.3f}s")
+
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+
+        self.warmed_up = True
+
+    def get_cache_statuses(self) -> dict[str, str]:
+        """
+        The response cache is "failing" when it had an error in the last `cache_error_window` seconds,
+        "disabled" when not configured; the shared cache segments are "ok" once opened.
+        """
+
+        statuses = {f"shared_{name}": "ok" for name in get_open_shared_memory_caches()}
+
+        if self.response_cache_backend is None:
+            statuses["response_cache"] = "disabled"
+        else:
+            last_error_at = self.response_cache_backend.last_error_at
+            is_failing = last_error_at is not None and time.monotonic() - last_error_at < self.cache_error_window
+            statuses["response_cache"] = "failing" if is_failing else "ok"
+
+        return statuses
+
+    def get_report(self) -> tuple[bool, dict]:
+        """
+        Whether the worker is ready, and the compact report of the checks: the names of the failing
+        ones, the warm-up, the queue depth, the event loop lag (milliseconds, null before the first
+        measure), and the status of the caches and of the dependencies.
+        """
+
+        lag = self.event_loop_lag_monitor.lag
+        caches = self.get_cache_statuses()
+        dependencies = {name: dependency.status for name, dependency in DependencyHealth.registry.items()}
+
+        failing = [
+            *(["draining"] if self.draining else []),
+            *(["warm_up"] if not self.warmed_up else []),
+            *(["queue"] if compute_pool.queued > self.max_queue_depth else []),
+            *(["event_loop_lag"] if lag is not None and lag > self.max_event_loop_lag else []),
+            *(name for name in self.required_dependencies if {**caches, **dependencies}.get(name) == "failing"),
+        ]
+        ready = not failing
+
+        if ready != self._ready:
+            if ready:
+                logger.info("Ready")
+            else:
+                logger.warning(f"Not ready: {', '.join(failing)}")
+
+            self._ready = ready
+
+        return ready, {
+            "status": "OK" if ready else "KO",
+            "failing": failing,
+            "warmed_up": self.warmed_up,
+            "queue": compute_pool.queued,
+            "max_queue": self.max_queue_depth,
+            "event_loop_lag_ms": round(lag * 1000, 1) if lag is not None else None,
+            "max_event_loop_lag_ms": round(self.max_event_loop_lag * 1000, 1),
+            "caches": caches,
+            "dependencies": dependencies,
+        }
+
+
+readiness = Readiness(
+    settings.readiness_max_queue_depth,
+    settings.readiness_max_event_loop_lag,
+    tuple(settings.readiness_required_dependencies),
+    settings.readiness_cache_error_window,
+)
@@ -0,0 +1,198 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from kerykeion import AstrologicalSubject, RelationshipScoreFactory
+from kerykeion.aspects.aspects_utils import get_aspect_from_two_points
+from kerykeion.settings.kerykeion_settings import get_settings
+from kerykeion.settings.config_constants import DEFAULT_ACTIVE_ASPECTS
+
+from .lru_cache import LRUCache
+from .get_astrological_subject import get_astrological_subject
+from ..types.request_models import SubjectModel, RelationshipScoreCandidateModel
+
+POSITION_VECTOR_CACHE_SIZE = 100_000
+
+# The points used by the Ciro Discepolo method, in the order of the position vectors.
+VECTOR_POINTS = ("Sun", "Moon", "Venus", "Mars", "Ascendant")
+VECTOR_ATTRIBUTES = ("sun", "moon", "venus", "mars", "ascendant")
+
+# Pairs of (first subject point, second subject point) scored by RelationshipScoreFactory.
+SCORED_PAIRS = (
+    ("Sun", "Sun"),
+    ("Sun", "Moon"),
+    ("Moon", "Sun"),
+    ("Sun", "Ascendant"),
+    ("Ascendant", "Sun"),
+    ("Moon", "Ascendant"),
+    ("Ascendant", "Moon"),
+    ("Venus", "Mars"),
+    ("Mars", "Venus"),
+)
+
+position_vector_cache = LRUCache("relationship_score_position_vectors", POSITION_VECTOR_CACHE_SIZE)
+
+
+def _get_aspects_settings() -> list[dict]:
+    """
+    Returns the aspects settings used by the SynastryAspects inside RelationshipScoreFactory,
+    filtered and with the orbs of the default active aspects.
+    """
+
+    aspects_settings = []
+    for aspect_setting in get_settings().aspects:
+        for active_aspect in DEFAULT_ACTIVE_ASPECTS:
+            if aspect_setting["name"] == active_aspect["name"]:
+                aspect_setting["orb"] = active_aspect["orb"]
+                aspects_settings.append(aspect_setting)
+
+    return aspects_settings
+
+
+def _get_position_vector(astrological_subject: AstrologicalSubject) -> tuple:
+    """
+    Returns the absolute positions of the scored points, followed by the quality of the Sun.
+    """
+
+    positions = tuple(astrological_subject[attribute].abs_pos for attribute in VECTOR_ATTRIBUTES)
+
+    return positions + (astrological_subject.sun.quality,)
+
+
+def _get_cached_position_vector(subject: SubjectModel) -> tuple:
+    # The name and the GeoNames username do not change the positions, so they are left out of the key.
+    key = subject.model_dump_json(exclude={"name", "geonames_username"})
+    vector = position_vector_cache.get(key)
+
+    if vector is None:
+        vector = _get_position_vector(get_astrological_subject(subject))
+        position_vector_cache.set(key, vector)
+
+    return vector
+
+
+def _get_candidate_position_vector(candidate: RelationshipScoreCandidateModel) -> tuple:
+    """
+    The position vector of a candidate: the positions sent with it, or those of its subject.
+    """
+
+    if candidate.positions is not None:
+        positions = candidate.positions
+        return tuple(getattr(positions, attribute) for attribute in VECTOR_ATTRIBUTES) + (positions.sun_quality,)
+
+    return _get_cached_position_vector(candidate.subject)
+
+
+def _get_max_pair_points(first_point: str, second_point: str, aspect_name: str) -> int:
+    """
+    Maximum points RelationshipScoreFactory can give to an aspect, whatever its orbit.
+    """
+
+    if first_point == "Sun" and second_point == "Sun":
+        return 11 if aspect_name in {"conjunction", "opposition", "square"} else 4
+
+    if {first_point, second_point} == {"Sun", "Moon"}:
+        return 11 if aspect_name == "conjunction" else 4
+
+    return 4
+
+
+def get_score_upper_bound(first_vector: tuple, second_vector: tuple, aspects_settings: list[dict]) -> int:
+    """
+    Computes, from the position vectors only, a score that RelationshipScoreFactory can never exceed
+    for the same two subjects.
+    """
+
+    bound = 5 if first_vector[-1] == second_vector[-1] else 0
+
+    for first_point, second_point in SCORED_PAIRS:
+        aspect = get_aspect_from_two_points(
+            aspects_settings,
+            first_vector[VECTOR_POINTS.index(first_point)],
+            second_vector[VECTOR_POINTS.index(second_point)],
+        )
+
+        if aspect["verdict"] and aspect["name"] in RelationshipScoreFactory.MAJOR_ASPECTS:
+            bound += _get_max_pair_points(first_point, second_point, aspect["name"])
+
+    return bound
+
+
+def _get_pair_points(first_point: str, second_point: str, aspect: dict) -> int:
+    """
+    The points RelationshipScoreFactory gives to a major aspect between two scored points.
+    """
+
+    if first_point == "Sun" and second_point == "Sun" and aspect["name"] in {"conjunction", "opposition", "square"}:
+        return 11 if aspect["orbit"] <= 2 else 8
+
+    if {first_point, second_point} == {"Sun", "Moon"} and aspect["name"] == "conjunction":
+        return 11 if aspect["orbit"] <= 2 else 8
+
+    return 4
+
+
+def get_relationship_score(first_vector: tuple, second_vector: tuple, aspects_settings: list[dict]) -> dict:
+    """
+    Computes, from the position vectors only, the relationship score RelationshipScoreFactory gives to the
+    same two subjects, with its description and aspects.
+    """
+
+    score = 5 if first_vector[-1] == second_vector[-1] else 0
+    aspects = []
+
+    # In the order of the synastry aspects scored by RelationshipScoreFactory
+    for first_point in VECTOR_POINTS:
+        for second_point in VECTOR_POINTS:
+            if (first_point, second_point) not in SCORED_PAIRS:
+                continue
+
+            aspect = get_aspect_from_two_points(
+                aspects_settings,
+                first_vector[VECTOR_POINTS.index(first_point)],
+                second_vector[VECTOR_POINTS.index(second_point)],
+            )
+
+            if aspect["verdict"] and aspect["name"] in RelationshipScoreFactory.MAJOR_ASPECTS:
+                score += _get_pair_points(first_point, second_point, aspect)
+                aspects.append({"p1_name": first_point, "p2_name": second_point, "aspect": aspect["name"], "orbit": aspect["orbit"]})
+
+    score_description = next(description for description, threshold in RelationshipScoreFactory.SCORE_MAPPING if score < threshold)
+
+    # RelationshipScoreFactory never resets is_destiny_sign, kept as is for the same results
+    return {"score": score, "score_description": score_description, "is_destiny_sign": True, "aspects": aspects}
+
+
+def get_relationship_score_ranking(subject: SubjectModel, candidates: list[RelationshipScoreCandidateModel], top_k: int) -> tuple[list[dict], int]:
+    """
+    Ranks the candidates by their relationship score with the subject and returns the best top_k,
+    together with the number of candidates that had to be fully scored.
+
+    Every candidate gets a cheap upper bound from its position vector; candidates are then fully scored,
+    from the position vectors too, in decreasing bound order, until no remaining bound can enter the top_k.
+    A candidate sent with its positions costs no astrological subject at all.
+    """
+
+    subject_vector = _get_position_vector(get_astrological_subject(subject))
+    aspects_settings = _get_aspects_settings()
+
+    candidate_vectors = []
+    bounds = []
+    for index, candidate in enumerate(candidates):
+        candidate_vector = _get_candidate_position_vector(candidate)
+        candidate_vectors.append(candidate_vector)
+        bounds.append((get_score_upper_bound(subject_vector, candidate_vector, aspects_settings), index))
+
+    bounds.sort(key=lambda item: (-item[0], item[1]))
+
+    # Sorted by score (descending) and then by position in the candidates list.
+    ranking: list[tuple[float, int, dict]] = []
+    for bound, index in bounds:
+        if len(ranking) >= top_k and (-bound, index) > (-ranking[top_k - 1][0], ranking[top_k - 1][1]):
+            break
+
+        score = get_relationship_score(subject_vector, candidate_vectors[index], aspects_settings)
+        ranking.append((score["score"], index, {"id": candidates[index].id, **score}))
+        ranking.sort(key=lambda item: (-item[0], item[1]))
+
+    return [item for _, _, item in ranking[:top_k]], len(ranking)
@@ -0,0 +1,192 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import json
+import queue
+import threading
+from dataclasses import asdict, dataclass, field
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Iterator, Union
+from urllib.parse import parse_qsl, urlencode
+
+from .query_request import SUBJECT_PREFIXES
+
+logger = getLogger(__name__)
+
+# Version of the captured requests format, in the "v" field of every line
+CAPTURE_FORMAT_VERSION = 1
+
+# Headers kept in the captured requests: never the keys nor the cookies
+CAPTURED_HEADERS = ("accept", "accept-encoding", "cache-control", "content-type", "if-none-match")
+
+# Fields of the subjects replaced in the captured requests
+REDACTED_FIELDS = ("name", "geonames_username")
+
+# Fields of the candidates of the relationship score ranking replaced in the captured requests: their
+# identifiers are those of profiles or users
+REDACTED_CANDIDATE_FIELDS = ("id",)
+
+# Fields of the subjects rounded in the captured requests, to COARSENED_DECIMALS decimals (about 11 km)
+COARSENED_FIELDS = ("latitude", "longitude")
+COARSENED_DECIMALS = 1
+
+
+@dataclass
+class CapturedRequest:
+    """
+    A request as captured from the traffic, one JSON object per line (JSONL):
+
+    {"v": 1, "time": 1700000000.0, "method": "POST", "path": "/api/v4/birth-chart", "query": "",
+     "headers": {"content-type": "application/json"}, "body": {...}, "status": 200, "duration_ms": 84.2}
+
+    The body is the decoded JSON (or null without a body); status and duration_ms are those of the
+    captured response, for reference.
+    """
+
+    method: str
+    path: str
+    query: str = ""
+    headers: dict[str, str] = field(default_factory=dict)
+    body: Any = None
+    time: float = 0.0
+    status: Union[int, None] = None
+    duration_ms: Union[float, None] = None
+
+    def to_json(self) -> str:
+        return json.dumps({"v": CAPTURE_FORMAT_VERSION, **asdict(self)}, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, line: str) -> "CapturedRequest":
+        entry = json.loads(line)
+
+        if entry.pop("v", CAPTURE_FORMAT_VERSION) != CAPTURE_FORMAT_VERSION:
+            raise ValueError("Unsupported captured requests format version")
+
+        return cls(**{name: value for name, value in entry.items() if name in cls.__dataclass_fields__})
+
+
+def _redact_field(name: str, value: Any) -> Any:
+    if name in REDACTED_FIELDS:
+        return "REDACTED"
+
+    if name in COARSENED_FIELDS:
+        try:
+            return round(float(value), COARSENED_DECIMALS)
+        except (TypeError, ValueError):
+            return value
+
+    return value
+
+
+def _redact_candidate(candidate: Any) -> Any:
+    if not isinstance(candidate, dict):
+        return redact_body(candidate)
+
+    # The subject of the candidate is redacted as the other subjects
+    return {**redact_body(candidate), **{name: "REDACTED" for name in REDACTED_CANDIDATE_FIELDS if name in candidate}}
+
+
+def redact_body(body: Any) -> Any:
+    """
+    The body without the personal data of its subjects: the names and GeoNames usernames are replaced, and
+    the coordinates coarsened. The identifiers of the ranking candidates are replaced too. The birth dates
+    are kept, as the workload depends on them.
+    """
+
+    if isinstance(body, dict):
+        redacted = {}
+
+        for name, value in body.items():
+            if name in SUBJECT_PREFIXES and isinstance(value, dict):
+                redacted[name] = {field: _redact_field(field, field_value) for field, field_value in value.items()}
+            elif name == "candidates" and isinstance(value, list):
+                redacted[name] = [_redact_candidate(candidate) for candidate in value]
+            else:
+                redacted[name] = redact_body(value)
+
+        return redacted
+
+    if isinstance(body, list):
+        return [redact_body(value) for value in body]
+
+    return body
+
+
+def redact_query(query: str) -> str:
+    """
+    The query of a GET variant without the personal data of its subjects, as redact_body.
+    """
+
+    redacted = []
+
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        field = next((name.removeprefix(prefix) for prefix in SUBJECT_PREFIXES.values() if prefix and name.startswith(prefix)), name)
+        redacted.append((name, _redact_field(field, value)))
+
+    return urlencode(redacted)
+
+
+def read_captured_requests(path: Union[str, Path]) -> Iterator[CapturedRequest]:
+    """
+    The requests of a captured requests file, skipping the blank lines.
+    """
+
+    with open(path, encoding="utf-8") as captured_requests_file:
+        for line_number, line in enumerate(captured_requests_file, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                yield CapturedRequest.from_json(line)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"{path}, line {line_number}: {e}") from e
+
+
+class CapturedRequestsWriter:
+    """
+    Appends the captured requests to a JSONL file from a background thread, through a bounded queue:
+    the requests never wait for the disk, and when the queue is full the captured requests are dropped.
+    """
+
+    def __init__(self, path: Union[str, Path], queue_size: int = 10000) -> None:
+        self.path = Path(path)
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue[Union[CapturedRequest, None]] = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._write_requests, name="request-capture", daemon=True)
+        self._thread.start()
+
+    def _write_requests(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(self.path, "a", encoding="utf-8") as captured_requests_file:
+            while True:
+                captured_request = self._queue.get()
+                if captured_request is None:
+                    return
+
+                try:
+                    captured_requests_file.write(captured_request.to_json() + "\n")
+                    self.written += 1
+
+                    if self._queue.empty():
+                        captured_requests_file.flush()
+
+                except (OSError, TypeError, ValueError) as e:
+                    logger.error(f"Could not capture the request: {e}")
+
+    def write(self, captured_request: CapturedRequest) -> None:
+        try:
+            self._queue.put_nowait(captured_request)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """
+        Writes the requests still in the queue and stops the thread.
+        """
+
+        self._queue.put(None)
+        self._thread.join()
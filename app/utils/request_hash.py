@@ -0,0 +1,63 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import hashlib
+import json
+from functools import cache
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from .timezones import get_timezone_index_path
+
+APP_DIRECTORY = Path(__file__).parent.parent
+
+
+def get_canonical_json(data: Any) -> str:
+    """
+    JSON with the keys sorted and no whitespace.
+    """
+
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def get_canonical_request_json(request_model: BaseModel) -> str:
+    """
+    The canonical JSON of a validated request: defaults filled in, keys sorted and no whitespace, so
+    that equivalent requests (eg. with a different key order or an omitted default) are identical.
+    """
+
+    return get_canonical_json(request_model.model_dump(mode="json"))
+
+
+def get_request_hash(endpoint: str, request_model: BaseModel) -> str:
+    """
+    The hash identifying the result of a request to an endpoint.
+    """
+
+    return hashlib.sha256(f"{endpoint}\n{get_canonical_request_json(request_model)}".encode("utf-8")).hexdigest()
+
+
+@cache
+def get_result_version() -> str:
+    """
+    The version of the results: the version of kerykeion, the hash of the sources of the app and the
+    hash of the timezone index (the timezones resolved from the coordinates). The same request has the
+    same result within a result version, and maybe another one after a deploy.
+    """
+
+    digest = hashlib.sha256(f"kerykeion=={version('kerykeion')}\n".encode())
+
+    for path in sorted(APP_DIRECTORY.rglob("*.py")):
+        digest.update(path.relative_to(APP_DIRECTORY).as_posix().encode() + b"\n")
+        digest.update(path.read_bytes())
+
+    timezone_index_path = get_timezone_index_path()
+    if timezone_index_path is not None and timezone_index_path.exists():
+        digest.update(b"timezone_index\n")
+        digest.update(timezone_index_path.read_bytes())
+
+    return digest.hexdigest()[:16]
@@ -0,0 +1,169 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import json
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import ContextManager, Iterator, Union
+
+from .structured_logging import request_context
+
+PROFILE_FORMATS = ("pstats", "speedscope")
+
+
+class RequestProfiler(ABC):
+    """
+    Profiles the computations of a request, in the threads of the compute pool running them. The
+    profiler is attached to the context of the request by the ProfilingMiddleware, and the profile is
+    written once the computations are done.
+    """
+
+    suffix = ""
+
+    def __init__(self) -> None:
+        self.runs = 0
+
+    @abstractmethod
+    def running(self) -> ContextManager[None]:
+        """
+        Profiles the block, run by a thread of the compute pool.
+        """
+
+    @abstractmethod
+    def write(self, path: Path) -> None:
+        pass
+
+
+class DeterministicProfiler(RequestProfiler):
+    """
+    Every call, with cProfile: exact call counts, written as pstats (python -m pstats, snakeviz).
+    """
+
+    suffix = ".pstats"
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Imported here: only the profiled requests need it.
+        import cProfile
+
+        self._profile = cProfile.Profile()
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        self.runs += 1
+        self._profile.enable()
+
+        try:
+            yield
+
+        finally:
+            self._profile.disable()
+
+    def write(self, path: Path) -> None:
+        self._profile.dump_stats(path)
+
+
+class SamplingProfiler(RequestProfiler):
+    """
+    The stack of the computing thread sampled every `interval` seconds by a background thread: a low
+    overhead, approximate profile, written in the speedscope format (https://www.speedscope.app).
+    """
+
+    suffix = ".speedscope.json"
+
+    def __init__(self, interval: float = 0.001) -> None:
+        super().__init__()
+        self.interval = interval
+        self._frames: list[dict] = []
+        self._frame_indexes: dict[tuple[str, str, int], int] = {}
+        self._samples: list[list[int]] = []
+        self._weights: list[float] = []
+
+    def _get_frame_index(self, name: str, file: str, line: int) -> int:
+        key = (name, file, line)
+        index = self._frame_indexes.get(key)
+
+        if index is None:
+            index = self._frame_indexes[key] = len(self._frames)
+            self._frames.append({"name": name, "file": file, "line": line})
+
+        return index
+
+    def _sample(self, thread_id: int, stop: threading.Event) -> None:
+        sampled_at = time.perf_counter()
+
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            now = time.perf_counter()
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(self._get_frame_index(code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+
+            if stack:
+                self._samples.append(stack[::-1])
+                self._weights.append((now - sampled_at) * 1000)
+
+            sampled_at = now
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        self.runs += 1
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stop), name="profile-sampler", daemon=True)
+        sampler.start()
+
+        try:
+            yield
+
+        finally:
+            stop.set()
+            sampler.join()
+
+    def write(self, path: Path) -> None:
+        total = sum(self._weights)
+        profile = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": path.name,
+            "exporter": "Astrologer API",
+            "shared": {"frames": self._frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": path.name,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": total,
+                    "samples": self._samples,
+                    "weights": self._weights,
+                }
+            ],
+        }
+
+        path.write_text(json.dumps(profile), encoding="utf-8")
+
+
+def get_request_profiler() -> Union[RequestProfiler, None]:
+    """
+    The profiler of the current request, None when it is not profiled.
+    """
+
+    context = request_context.get()
+    return context.get("profiler") if context is not None else None
+
+
+def get_profiler(profile_format: str, sampling_interval: float) -> RequestProfiler:
+    if profile_format == "speedscope":
+        return SamplingProfiler(sampling_interval)
+
+    if profile_format == "pstats":
+        return DeterministicProfiler()
+
+    raise ValueError(f"Unknown profile format: {profile_format}")
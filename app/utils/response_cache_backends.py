@@ -0,0 +1,277 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from typing import Union
+from urllib.parse import unquote, urlparse
+
+from .lru_cache import LRUCache
+
+logger = getLogger(__name__)
+
+
+class ResponseCacheBackend(ABC):
+    """
+    Where the ResponseCacheMiddleware stores the responses: bytes by key, with a time to live in seconds.
+
+    A backend failing (eg. the Redis server going away) must not fail the requests, so the errors are
+    logged and treated as misses.
+    """
+
+    name = "none"
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        # time.monotonic() of the last error
+        self.last_error_at: Union[float, None] = None
+
+    @abstractmethod
+    async def get(self, key: str) -> Union[bytes, None]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def lookup(self, key: str) -> Union[bytes, None]:
+        try:
+            value = await self.get(key)
+
+        except Exception as e:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+            logger.warning(f"Response cache {self.name} get failed: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    async def store(self, key: str, value: bytes, ttl: int) -> None:
+        try:
+            await self.set(key, value, ttl)
+
+        except Exception as e:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+            logger.warning(f"Response cache {self.name} set failed: {e}")
+
+
+class MemoryResponseCacheBackend(ResponseCacheBackend):
+    """
+    An in-process LRU cache of the responses, private to each worker.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int) -> None:
+        super().__init__()
+        self._cache = LRUCache("responses", max_entries)
+
+    async def get(self, key: str) -> Union[bytes, None]:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.time():
+            return None
+
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self._cache.set(key, (time.time() + ttl, value))
+
+
+class SQLiteResponseCacheBackend(ResponseCacheBackend):
+    """
+    The responses in a SQLite database on the local disk, shared by the workers of the host and kept
+    across restarts. When the database has more than max_entries responses, those closer to expiring
+    are removed first.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Union[str, Path], max_entries: int) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+
+    def _get(self, key: str) -> Union[bytes, None]:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM responses WHERE key = ? AND expires_at >= ?", (key, time.time())).fetchone()
+
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: int) -> None:
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)", (key, value, now + ttl))
+            self._connection.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+
+            excess = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._connection.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires_at LIMIT ?)", (excess,))
+
+    async def get(self, key: str) -> Union[bytes, None]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class RedisResponseCacheBackend(ResponseCacheBackend):
+    """
+    The responses in a server speaking the Redis protocol (Redis, Valkey, KeyDB, ...), shared by all
+    the workers and hosts. It only needs GET and SET with PX, so a minimal client is used instead of a
+    dependency; the url is redis://[:password@]host[:port][/db].
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, key_prefix: str = "astrologer-api:response:", timeout: float = 1.0) -> None:
+        super().__init__()
+        parsed_url = urlparse(url)
+        self.host = parsed_url.hostname or "localhost"
+        self.port = parsed_url.port or 6379
+        self.password = unquote(parsed_url.password) if parsed_url.password else None
+        self.db = int(parsed_url.path.strip("/") or 0)
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self._reader: Union[asyncio.StreamReader, None] = None
+        self._writer: Union[asyncio.StreamWriter, None] = None
+        self._lock: Union[asyncio.Lock, None] = None
+
+    @staticmethod
+    def _encode_command(*arguments: Union[str, bytes, int]) -> bytes:
+        encoded = [b"*%d\r\n" % len(arguments)]
+
+        for argument in arguments:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode("utf-8")
+            encoded.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+
+        return b"".join(encoded)
+
+    async def _read_reply(self) -> Union[bytes, int, list, None]:
+        assert self._reader is not None
+        line = await self._reader.readuntil(b"\r\n")
+        prefix, payload = line[:1], line[1:-2]
+
+        if prefix == b"+":
+            return payload
+        if prefix == b"-":
+            raise ConnectionError(payload.decode("utf-8", "replace"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+
+        raise ConnectionError(f"Invalid reply from the Redis server: {line!r}")
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", self.db)
+
+    async def _send(self, *arguments: Union[str, bytes, int]) -> Union[bytes, int, list, None]:
+        assert self._writer is not None
+        self._writer.write(self._encode_command(*arguments))
+        await self._writer.drain()
+
+        return await self._read_reply()
+
+    def close(self) -> None:
+        self._disconnect()
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+        self._reader = self._writer = None
+
+    async def execute(self, *arguments: Union[str, bytes, int]) -> Union[bytes, int, list, None]:
+        """
+        Sends a command on the (single, lazily opened) connection and returns the reply. After an error
+        the connection is dropped, as it could be left in the middle of a reply.
+        """
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await asyncio.wait_for(self._connect(), self.timeout)
+
+                return await asyncio.wait_for(self._send(*arguments), self.timeout)
+
+            except BaseException:
+                self._disconnect()
+                raise
+
+    async def get(self, key: str) -> Union[bytes, None]:
+        value = await self.execute("GET", self.key_prefix + key)
+
+        return value if isinstance(value, bytes) else None
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self.execute("SET", self.key_prefix + key, value, "PX", ttl * 1000)
+
+
+def get_response_cache_backend(name: str, max_entries: int, sqlite_path: str, redis_url: str) -> Union[ResponseCacheBackend, None]:
+    """
+    The backend configured with response_cache_backend: "memory", "sqlite", "redis" or "none".
+    """
+
+    if name == "memory":
+        return MemoryResponseCacheBackend(max_entries)
+
+    if name == "sqlite":
+        path = Path(sqlite_path)
+        if not path.is_absolute():
+            path = Path(__file__).parent.parent / path
+
+        return SQLiteResponseCacheBackend(path, max_entries)
+
+    if name == "redis":
+        return RedisResponseCacheBackend(redis_url)
+
+    if name in ("none", ""):
+        return None
+
+    raise ValueError(f"Unknown response cache backend: {name}")
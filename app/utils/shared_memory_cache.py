@@ -0,0 +1,343 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Iterator, Union
+
+from ..config.settings import settings
+from .request_hash import get_result_version
+
+logger = getLogger(__name__)
+
+MAGIC = b"ASHC"
+FORMAT_VERSION = 1
+# Magic, format version, slots, slot size, ways
+HEADER = struct.Struct("<4sIIII")
+HEADER_SIZE = 64
+# Sequence number (odd while the slot is written), data length, crc32 of the data, key, expiry and last use
+SLOT_HEADER = struct.Struct("<III4x16sdd")
+SEQUENCE = struct.Struct("<I")
+LAST_USED = struct.Struct("<d")
+LAST_USED_OFFSET = SLOT_HEADER.size - LAST_USED.size
+LOCK_STRIPES = 64
+
+
+class SharedMemoryCache:
+    """
+    A cache in a memory mapped file, shared by all the processes (eg. the uvicorn workers) mapping it,
+    so a value computed by a worker is a hit for the others.
+
+    The file is a set associative hash table of fixed size slots: a key can only be in one of the `ways`
+    slots of its bucket, and when they are all used the least recently used one is replaced. Values are
+    pickled and compressed, and those larger than a slot are not cached.
+
+    Reads take no lock: every slot has a sequence number, odd while the slot is written, and a read is
+    discarded when the number changed (or the checksum does not match). Writes lock the bucket only, with
+    a byte range lock on the file for the other processes and a striped lock for the other threads.
+
+    Every instance holds a shared lock on the file while open: a file nobody holds a lock on is not used
+    by a running process, and is created again (emptied) by the next one opening it.
+    """
+
+    def __init__(self, path: Union[str, Path], slots: int, slot_size: int, ttl: int, ways: int = 8) -> None:
+        if ways < 1 or slots < ways:
+            raise ValueError(f"A shared cache needs at least one bucket of {ways} ways, got {slots} slots")
+
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError(f"The slots of a shared cache must be larger than their {SLOT_HEADER.size} bytes header, got {slot_size}")
+
+        self.path = Path(path)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        # Whether this instance created the segment (the first process to open it)
+        self.created = False
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_locks = [Lock() for _ in range(LOCK_STRIPES)]
+
+        # The header lock makes the check of the users and the creation atomic for the other processes.
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                in_use = False
+            except BlockingIOError:
+                in_use = True
+
+            header = os.pread(self._fd, HEADER.size, 0)
+
+            if in_use and len(header) == HEADER.size and header[:4] == MAGIC:
+                _, _, self.slots, self.slot_size, self.ways = HEADER.unpack(header)
+            else:
+                # A new file, or left by processes which are not running anymore.
+                self.slots, self.slot_size, self.ways = slots - slots % ways, slot_size, ways
+                self.created = True
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, HEADER_SIZE + self.slots * self.slot_size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, FORMAT_VERSION, self.slots, self.slot_size, self.ways), 0)
+
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+
+        self.buckets = self.slots // self.ways
+        self.max_value_size = self.slot_size - SLOT_HEADER.size
+        self._mmap = mmap.mmap(self._fd, HEADER_SIZE + self.slots * self.slot_size)
+
+    @staticmethod
+    def get_key(key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _get_bucket(self, digest: bytes) -> int:
+        return int.from_bytes(digest[:8], "little") % self.buckets
+
+    def _get_slot_offset(self, bucket: int, way: int) -> int:
+        return HEADER_SIZE + (bucket * self.ways + way) * self.slot_size
+
+    def _read(self, offset: int, digest: bytes, now: float) -> Union[bytes, None]:
+        sequence, length, crc, slot_digest, expires_at, _ = SLOT_HEADER.unpack_from(self._mmap, offset)
+
+        if sequence & 1 or slot_digest != digest or expires_at < now or length > self.max_value_size:
+            return None
+
+        data = self._mmap[offset + SLOT_HEADER.size : offset + SLOT_HEADER.size + length]
+
+        if SEQUENCE.unpack_from(self._mmap, offset)[0] != sequence or zlib.crc32(data) != crc:
+            return None
+
+        return data
+
+    def _store(self, digest: bytes, data: bytes, expires_at: Union[float, None] = None, last_used: Union[float, None] = None) -> None:
+        """
+        Writes the (compressed) data in a slot of the bucket of the digest: the slot of the same key, or
+        an empty or expired one, or the least recently used one.
+        """
+
+        bucket = self._get_bucket(digest)
+
+        with self._thread_locks[bucket % LOCK_STRIPES]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, HEADER_SIZE + bucket)
+
+            try:
+                now = time.time()
+                chosen_offset, chosen_rank = 0, None
+
+                for way in range(self.ways):
+                    offset = self._get_slot_offset(bucket, way)
+                    _, length, _, slot_digest, slot_expires_at, slot_last_used = SLOT_HEADER.unpack_from(self._mmap, offset)
+
+                    if slot_digest == digest:
+                        chosen_offset, chosen_rank = offset, (-2, 0.0)
+                        break
+
+                    # Empty or expired slots first, then the least recently used one.
+                    rank = (-1, 0.0) if length == 0 or slot_expires_at < now else (0, slot_last_used)
+                    if chosen_rank is None or rank < chosen_rank:
+                        chosen_offset, chosen_rank = offset, rank
+
+                if chosen_rank is not None and chosen_rank[0] == 0:
+                    self.evictions += 1
+
+                writing_sequence = (SEQUENCE.unpack_from(self._mmap, chosen_offset)[0] + 1) & 0xFFFFFFFF
+                SEQUENCE.pack_into(self._mmap, chosen_offset, writing_sequence)
+                self._mmap[chosen_offset + SLOT_HEADER.size : chosen_offset + SLOT_HEADER.size + len(data)] = data
+                SLOT_HEADER.pack_into(self._mmap, chosen_offset, writing_sequence, len(data), zlib.crc32(data), digest, expires_at if expires_at is not None else now + self.ttl, last_used if last_used is not None else now)
+                SEQUENCE.pack_into(self._mmap, chosen_offset, (writing_sequence + 1) & 0xFFFFFFFF)
+
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, HEADER_SIZE + bucket)
+
+    def get(self, key: str) -> Any:
+        """
+        The cached value of the key, or None.
+        """
+
+        digest = self.get_key(key)
+        bucket = self._get_bucket(digest)
+        now = time.time()
+
+        for way in range(self.ways):
+            offset = self._get_slot_offset(bucket, way)
+            data = self._read(offset, digest, now)
+
+            if data is not None:
+                # The last use is only a hint for the eviction, so it is updated without locking.
+                LAST_USED.pack_into(self._mmap, offset + LAST_USED_OFFSET, now)
+                self.hits += 1
+                return pickle.loads(zlib.decompress(data))
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> bool:
+        """
+        Caches the value, returning False when it is too large for a slot.
+        """
+
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        if len(data) > self.max_value_size:
+            return False
+
+        self._store(self.get_key(key), data)
+        self.stores += 1
+        return True
+
+    def get_entries(self) -> Iterator[tuple[bytes, float, float, bytes]]:
+        """
+        The valid entries of the cache, as stored: the digest of the key, the expiry, the last use and the
+        compressed value. The slots written meanwhile are skipped.
+        """
+
+        now = time.time()
+
+        for slot in range(self.slots):
+            offset = HEADER_SIZE + slot * self.slot_size
+            _, length, _, digest, expires_at, last_used = SLOT_HEADER.unpack_from(self._mmap, offset)
+
+            if length == 0:
+                continue
+
+            data = self._read(offset, digest, now)
+            if data is not None:
+                yield digest, expires_at, last_used, data
+
+    def set_entry(self, digest: bytes, expires_at: float, last_used: float, data: bytes) -> bool:
+        """
+        Stores an entry of get_entries (eg. of another segment), unless expired or too large for a slot.
+        """
+
+        if expires_at < time.time() or len(data) > self.max_value_size:
+            return False
+
+        self._store(digest, data, expires_at, last_used)
+        return True
+
+    def get_or_set(self, key: str, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        The cached value of the key, computing and caching it with function(*args) on a miss.
+        """
+
+        value = self.get(key)
+
+        if value is None:
+            value = function(*args)
+            self.set(key, value)
+
+        return value
+
+    def close(self) -> None:
+        self._mmap.close()
+        os.close(self._fd)
+
+
+def _get_segment_path(directory: Path, name: str) -> Path:
+    """
+    The file of a segment. The processes running the same version of the results share it (see
+    get_result_version), unless they set different ASTROLOGER_API_SHARED_CACHE_ID variables.
+    """
+
+    shared_cache_id = os.getenv("ASTROLOGER_API_SHARED_CACHE_ID")
+    suffix = f"-{shared_cache_id}" if shared_cache_id else ""
+
+    return directory / f"{name}-v{FORMAT_VERSION}-{get_result_version()}{suffix}.cache"
+
+
+def _remove_stale_segments(directory: Path) -> None:
+    """
+    Removes the segments of other versions no running process holds a lock on (see SharedMemoryCache).
+    The segments of this version are emptied when opened instead.
+    """
+
+    current_paths = {_get_segment_path(directory, name) for name in settings.shared_cache_segments}
+
+    for path in directory.glob("*.cache"):
+        if path in current_paths:
+            continue
+
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            continue
+
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            path.unlink(missing_ok=True)
+
+        except BlockingIOError:
+            pass
+
+        finally:
+            os.close(fd)
+
+
+_shared_memory_caches: dict[str, Union[SharedMemoryCache, None]] = {}
+_shared_memory_caches_pid = 0
+_shared_memory_caches_lock = Lock()
+
+
+def get_shared_memory_cache(name: str) -> Union[SharedMemoryCache, None]:
+    """
+    The shared cache segment configured in shared_cache_segments, opened on first use in every process.
+    Returns None when the shared cache is disabled (empty shared_cache_directory) or not configured.
+    """
+
+    global _shared_memory_caches_pid
+
+    with _shared_memory_caches_lock:
+        if _shared_memory_caches_pid != os.getpid():
+            _shared_memory_caches.clear()
+            _shared_memory_caches_pid = os.getpid()
+
+        if name in _shared_memory_caches:
+            return _shared_memory_caches[name]
+
+        segment = settings.shared_cache_segments.get(name)
+        if not settings.shared_cache_directory or not segment:
+            _shared_memory_caches[name] = None
+            return None
+
+        directory = Path(settings.shared_cache_directory)
+        if not directory.is_absolute():
+            directory = Path(__file__).parent.parent / directory
+
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            _remove_stale_segments(directory)
+
+            path = _get_segment_path(directory, name)
+            _shared_memory_caches[name] = SharedMemoryCache(path, segment["slots"], segment["slot_size"], settings.shared_cache_ttl)
+
+        except OSError as e:
+            logger.error(f"Shared cache {name} disabled: {e}")
+            _shared_memory_caches[name] = None
+
+        return _shared_memory_caches[name]
+
+
+def get_open_shared_memory_caches() -> dict[str, SharedMemoryCache]:
+    """
+    The shared cache segments opened by this process, by name.
+    """
+
+    with _shared_memory_caches_lock:
+        if _shared_memory_caches_pid != os.getpid():
+            return {}
+
+        return {name: shared_cache for name, shared_cache in _shared_memory_caches.items() if shared_cache is not None}
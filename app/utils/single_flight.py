@@ -0,0 +1,66 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent work: the first caller for a key starts the computation, and the
+    callers arriving while it is in flight await the same result (or exception) instead of repeating it.
+
+    The computation runs in its own task, so a caller going away does not cancel it for the others: it
+    is cancelled when all its callers went away.
+    """
+
+    def __init__(self) -> None:
+        self.started = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _remove(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+        # Marks the exception as retrieved, even if every caller went away.
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(function())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done_task: self._remove(key, done_task))
+        else:
+            self.coalesced += 1
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+
+        try:
+            return await asyncio.shield(task)
+
+        finally:
+            self._waiters[task] -= 1
+
+            if self._waiters[task] == 0:
+                del self._waiters[task]
+
+                if not task.done():
+                    # The next callers start a new computation.
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
+
+                    task.cancel()
+
+
+computations_single_flight = SingleFlight()
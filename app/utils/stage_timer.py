@@ -0,0 +1,55 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Union
+
+from .cancellation import check_cancelled
+from .metrics import stage_duration_seconds
+from .structured_logging import request_context
+
+# The name of the stage running in this context, to name the stages nested in it
+current_stage: ContextVar[Union[str, None]] = ContextVar("current_stage", default=None)
+
+
+def record_stage(name: str, duration: float) -> None:
+    """
+    Adds the duration (seconds) of a stage to the timings of the current request, sent in the Server-Timing
+    header, and to the stage durations histogram. A stage repeated in a request (eg. the subject of a
+    synastry) adds up.
+    """
+
+    context = request_context.get()
+    if context is None:
+        stage_duration_seconds.observe(("", name), duration)
+        return
+
+    timings = context["timings"]
+    timings[name] = timings.get(name, 0.0) + duration
+    stage_duration_seconds.observe((context["scope"].get("path", ""), name), duration)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times the block as a stage of the current request. A stage nested in another one is a sub-stage,
+    named after its parent (eg. "subject.geonames", "render.minify"), so that the durations of the top
+    level stages add up to at most the total. A cancelled computation stops before its next stage (see
+    check_cancelled).
+    """
+
+    check_cancelled()
+    parent = current_stage.get()
+    full_name = f"{parent}.{name}" if parent is not None else name
+    token = current_stage.set(full_name)
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        current_stage.reset(token)
+        record_stage(full_name, time.perf_counter() - start)
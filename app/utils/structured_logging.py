@@ -0,0 +1,178 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import atexit
+import json
+import logging
+import logging.config
+import logging.handlers
+import queue
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Union
+
+# The request being served, set by the RequestContextMiddleware: request id, ASGI scope, start time and
+# the timings of the stages. The compute pool copies it to its threads.
+request_context: ContextVar[Union[dict, None]] = ContextVar("request_context", default=None)
+
+# The attributes of every LogRecord, the others are the `extra` fields of the call
+RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "color_message", "sample_rate"}
+
+
+def get_request_fields() -> dict:
+    """
+    The fields identifying the current request in the logs, empty outside of a request.
+    """
+
+    context = request_context.get()
+    if context is None:
+        return {}
+
+    scope = context["scope"]
+    api_key = scope.get("state", {}).get("api_key")
+
+    return {
+        "request_id": context["request_id"],
+        "key_id": api_key.id if api_key is not None else None,
+        "method": scope.get("method"),
+        "endpoint": scope.get("path"),
+    }
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the fields of the current request to the records, in the thread logging them.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            for name, value in get_request_fields().items():
+                setattr(record, name, value)
+
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one record in `sample_rate` for the records logged with extra={"sample_rate": ...}, eg. the
+    health checks, counting the same message of the same logger.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._counters: dict[tuple[str, Any], int] = {}
+        self._lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = getattr(record, "sample_rate", 1)
+        if sample_rate <= 1:
+            return True
+
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+
+        return count % sample_rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message, the fields of the request and the `extra`
+    fields of the call (eg. status and timings).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for name, value in record.__dict__.items():
+            if name not in RECORD_ATTRIBUTES and value is not None:
+                entry[name] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts the records in a bounded queue, emptied by a QueueListener thread writing them to the real
+    handlers, so a slow stdout or stderr never stalls the event loop. When the queue is full the records
+    are dropped (and counted) instead of waiting.
+
+    The message is formatted by the listener: the record keeps its arguments, with the request fields
+    already added in the logging thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+queue_handlers: list[NonBlockingQueueHandler] = []
+_queue_listeners: list[logging.handlers.QueueListener] = []
+
+
+def stop_logging() -> None:
+    """
+    Writes the records still in the queues and stops the listener threads.
+    """
+
+    while _queue_listeners:
+        _queue_listeners.pop().stop()
+
+    queue_handlers.clear()
+
+
+def setup_logging(logging_config: dict, queue_size: int = 10000) -> None:
+    """
+    Configures the logging with the dictConfig, then moves the handlers of every logger behind a queue
+    with its own listener thread. The request fields and the sampling are added before the queue.
+    """
+
+    stop_logging()
+    logging.config.dictConfig(logging_config)
+
+    sampling_filter = SamplingFilter()
+    request_context_filter = RequestContextFilter()
+
+    for name in logging_config.get("loggers", {}):
+        logger = logging.getLogger(None if name == "root" else name)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, NonBlockingQueueHandler)]
+        if not handlers:
+            continue
+
+        log_queue: queue.Queue = queue.Queue(queue_size)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(sampling_filter)
+        queue_handler.addFilter(request_context_filter)
+
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+
+        queue_handlers.append(queue_handler)
+        _queue_listeners.append(listener)
+
+
+atexit.register(stop_logging)
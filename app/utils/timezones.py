@@ -0,0 +1,322 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import bisect
+import json
+import mmap
+import struct
+from array import array
+from functools import cache
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from typing import Union
+
+import pytz
+
+from ..config.settings import settings
+
+logger = getLogger(__name__)
+
+# Binary timezone index, all little endian:
+#   header: magic, version, cells per degree, zones count, mixed cells count, candidates count, edges count
+#   zones: u32 offsets (zones count + 1) into the utf-8 names blob, then the blob
+#   cells: u32 per cell, row major from (-90, -180): 0 no zone, zone id + 1, or MIXED_CELL_FLAG | mixed cell id
+#   mixed cells: first candidate (u32), candidates count (u16), background zone id + 1 (u16)
+#   candidates: zone id (u16), south west corner inside (u8), padding (u8), first edge (u32), edges count (u32)
+#   edges: x1, y1, x2, y2 as f32 (longitude, latitude)
+INDEX_MAGIC = b"ATZI"
+INDEX_VERSION = 1
+HEADER_STRUCT = struct.Struct("<4sHHIIII")
+MIXED_CELL_STRUCT = struct.Struct("<IHH")
+CANDIDATE_STRUCT = struct.Struct("<HBxII")
+EDGE_STRUCT = struct.Struct("<4f")
+MIXED_CELL_FLAG = 0x80000000
+
+
+@cache
+def get_timezone(tz_str: str) -> pytz.BaseTzInfo:
+    """
+    Returns the pytz timezone, built only once per name.
+    """
+
+    return pytz.timezone(tz_str)
+
+
+def is_valid_timezone(tz_str: str) -> bool:
+    """
+    Checks a timezone name in constant time (pytz.all_timezones is a list).
+    """
+
+    return tz_str in pytz.all_timezones_set
+
+
+def get_nautical_timezone(longitude: float) -> str:
+    """
+    The Etc/GMT zone of the longitude, used on the open sea. The sign of the Etc zones is inverted.
+    """
+
+    offset = max(-12, min(12, round(longitude / 15)))
+    if offset == 0:
+        return "Etc/GMT"
+
+    return f"Etc/GMT{-offset:+d}"
+
+
+def _interpolate(a1: float, b1: float, a2: float, b2: float, a: float) -> float:
+    """
+    The b coordinate at a of the segment from (a1, b1) to (a2, b2), exact at the vertices.
+    """
+
+    if a == a1:
+        return b1
+    if a == a2:
+        return b2
+
+    return b1 + (a - a1) * (b2 - b1) / (a2 - a1)
+
+
+class TimezoneIndex:
+    """
+    Resolves the timezone of a point from a memory mapped grid of the timezone boundaries.
+
+    Cells inside a single zone resolve directly. In cells crossed by boundaries, the index stores which
+    zones contain the south west corner of the cell, and the edges of those zones inside the cell: the
+    point is inside a zone when the path from the corner to it crosses the zone edges an odd number of times.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        with open(path, "rb") as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.cells_per_degree, zones_count, mixed_cells_count, candidates_count, edges_count = HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a timezone index of version {INDEX_VERSION}.")
+
+        offset = HEADER_STRUCT.size
+        names_offsets = struct.unpack_from(f"<{zones_count + 1}I", self._mmap, offset)
+        offset += 4 * (zones_count + 1)
+        names_blob = self._mmap[offset : offset + names_offsets[-1]]
+        self.zones = [names_blob[start:end].decode("utf-8") for start, end in zip(names_offsets, names_offsets[1:])]
+        offset += names_offsets[-1]
+
+        self._columns = 360 * self.cells_per_degree
+        self._rows = 180 * self.cells_per_degree
+        self._cells_offset = offset
+        self._mixed_cells_offset = self._cells_offset + 4 * self._columns * self._rows
+        self._candidates_offset = self._mixed_cells_offset + MIXED_CELL_STRUCT.size * mixed_cells_count
+        self._edges_offset = self._candidates_offset + CANDIDATE_STRUCT.size * candidates_count
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _is_inside(self, corner_inside: int, first_edge: int, edges_count: int, corner_x: float, corner_y: float, x: float, y: float) -> bool:
+        # Ray casting, as used for the corners, gives the status of the point moved infinitesimally west, and even
+        # less north: the path below is taken between the moved points, so that ties on edges and vertices agree.
+        inside = bool(corner_inside)
+
+        for x1, y1, x2, y2 in EDGE_STRUCT.iter_unpack(self._mmap[self._edges_offset + EDGE_STRUCT.size * first_edge : self._edges_offset + EDGE_STRUCT.size * (first_edge + edges_count)]):
+            # Up the west side of the cell, from the corner to the latitude of the point...
+            if (x1 >= corner_x) != (x2 >= corner_x):
+                crossing_y = _interpolate(x1, y1, x2, y2, corner_x)
+                descending = (y2 - y1) * (x2 - x1) < 0
+                above_corner = crossing_y > corner_y or (crossing_y == corner_y and descending)
+                below_point = crossing_y < y or (crossing_y == y and not descending)
+                if above_corner and below_point:
+                    inside = not inside
+
+            # ...then east to the point.
+            if (y1 > y) != (y2 > y):
+                crossing_x = _interpolate(y1, x1, y2, x2, y)
+                if corner_x <= crossing_x < x:
+                    inside = not inside
+
+        return inside
+
+    def lookup(self, latitude: float, longitude: float) -> Union[str, None]:
+        """
+        Returns the timezone containing the point, or None if the point is in no zone.
+        """
+
+        column = min(int((longitude + 180) * self.cells_per_degree), self._columns - 1)
+        row = min(int((latitude + 90) * self.cells_per_degree), self._rows - 1)
+        (cell,) = struct.unpack_from("<I", self._mmap, self._cells_offset + 4 * (row * self._columns + column))
+
+        if not cell & MIXED_CELL_FLAG:
+            return self.zones[cell - 1] if cell else None
+
+        first_candidate, candidates_count, background = MIXED_CELL_STRUCT.unpack_from(self._mmap, self._mixed_cells_offset + MIXED_CELL_STRUCT.size * (cell & ~MIXED_CELL_FLAG))
+        corner_x = column / self.cells_per_degree - 180
+        corner_y = row / self.cells_per_degree - 90
+
+        for candidate in range(first_candidate, first_candidate + candidates_count):
+            zone, corner_inside, first_edge, edges_count = CANDIDATE_STRUCT.unpack_from(self._mmap, self._candidates_offset + CANDIDATE_STRUCT.size * candidate)
+            if self._is_inside(corner_inside, first_edge, edges_count, corner_x, corner_y, longitude, latitude):
+                return self.zones[zone]
+
+        return self.zones[background - 1] if background else None
+
+
+_timezone_index: Union[TimezoneIndex, None] = None
+_timezone_index_loaded = False
+_timezone_index_lock = Lock()
+
+
+def get_timezone_index_path() -> Union[Path, None]:
+    if not settings.timezone_index_path:
+        return None
+
+    path = Path(settings.timezone_index_path)
+    if not path.is_absolute():
+        path = Path(__file__).parent.parent / path
+
+    return path
+
+
+def get_timezone_index() -> Union[TimezoneIndex, None]:
+    """
+    Returns the timezone index, memory mapped on first use, or None if it is not available.
+    """
+
+    global _timezone_index, _timezone_index_loaded
+
+    if _timezone_index_loaded:
+        return _timezone_index
+
+    with _timezone_index_lock:
+        if not _timezone_index_loaded:
+            path = get_timezone_index_path()
+            if path is not None and path.exists():
+                try:
+                    _timezone_index = TimezoneIndex(path)
+                    logger.info(f"Timezone index loaded from {path}")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not load the timezone index {path}: {e}")
+            else:
+                logger.info("No timezone index available, the timezone must be provided with the coordinates")
+
+            _timezone_index_loaded = True
+
+    return _timezone_index
+
+
+def get_timezone_from_coordinates(latitude: float, longitude: float) -> Union[str, None]:
+    """
+    Resolves offline the timezone of a point. Points outside every zone get their nautical Etc/GMT zone.
+    Returns None if the timezone index is not available.
+    """
+
+    timezone_index = get_timezone_index()
+    if timezone_index is None:
+        return None
+
+    return timezone_index.lookup(latitude, longitude) or get_nautical_timezone(longitude)
+
+
+def build_timezone_index(geojson_path: Union[str, Path], output_path: Union[str, Path], cells_per_degree: int = 4) -> None:
+    """
+    Builds the binary index from a GeoJSON of the timezone boundaries, with the zone name in the "tzid"
+    property of the features (eg. the releases of https://github.com/evansiroky/timezone-boundary-builder).
+    """
+
+    with open(geojson_path, "r") as geojson_file:
+        features = json.load(geojson_file)["features"]
+
+    zones: list[str] = []
+    zones_edges: list[list[tuple[float, float, float, float]]] = []
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+
+        # All the rings of a zone, holes included, are a single edges set for the even-odd rule.
+        edges = []
+        for polygon in polygons:
+            for ring in polygon:
+                # Rounded to f32 first, so the corners are calculated on the same edges stored in the index.
+                coordinates = array("f", [value for point in ring for value in point[:2]]).tolist()
+                points = list(zip(coordinates[0::2], coordinates[1::2]))
+                for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+                    if (x1, y1) != (x2, y2):
+                        edges.append((x1, y1, x2, y2))
+
+        zones.append(feature["properties"]["tzid"])
+        zones_edges.append(edges)
+
+    columns, rows = 360 * cells_per_degree, 180 * cells_per_degree
+
+    # Edges of every zone in every cell their bounding box touches, which is enough: the paths of a lookup
+    # never leave the cell.
+    cells_edges: dict[int, dict[int, list[int]]] = {}
+    # Longitudes where the zone edges cross the south boundary of every row, for the corners.
+    rows_crossings: dict[int, dict[int, list[float]]] = {}
+
+    for zone, edges in enumerate(zones_edges):
+        for edge_index, (x1, y1, x2, y2) in enumerate(edges):
+            first_column = max(0, min(int((min(x1, x2) + 180) * cells_per_degree), columns - 1))
+            last_column = max(0, min(int((max(x1, x2) + 180) * cells_per_degree), columns - 1))
+            first_row = max(0, min(int((min(y1, y2) + 90) * cells_per_degree), rows - 1))
+            last_row = max(0, min(int((max(y1, y2) + 90) * cells_per_degree), rows - 1))
+
+            for row in range(first_row, last_row + 1):
+                for column in range(first_column, last_column + 1):
+                    cells_edges.setdefault(row * columns + column, {}).setdefault(zone, []).append(edge_index)
+
+            for row in range(first_row, last_row + 2):
+                row_y = row / cells_per_degree - 90
+                if (y1 > row_y) != (y2 > row_y):
+                    rows_crossings.setdefault(row, {}).setdefault(zone, []).append(_interpolate(y1, x1, y2, x2, row_y))
+
+    for row_crossings in rows_crossings.values():
+        for crossings in row_crossings.values():
+            crossings.sort()
+
+    def corner_zones(row: int, column: int) -> list[int]:
+        corner_x = column / cells_per_degree - 180
+        return [zone for zone, crossings in rows_crossings.get(row, {}).items() if bisect.bisect_left(crossings, corner_x) % 2]
+
+    cells = array("I", bytes(4 * columns * rows))
+    mixed_cells = bytearray()
+    candidates = bytearray()
+    edges_data = bytearray()
+    candidates_count = edges_count = 0
+
+    for row in range(rows):
+        if not any(cell in cells_edges for cell in range(row * columns, (row + 1) * columns)) and row not in rows_crossings:
+            continue
+
+        for column in range(columns):
+            cell = row * columns + column
+            inside_zones = corner_zones(row, column)
+            zones_in_cell = cells_edges.get(cell)
+
+            if not zones_in_cell:
+                cells[cell] = inside_zones[0] + 1 if inside_zones else 0
+                continue
+
+            # Zones containing the corner without edges in the cell contain the whole cell.
+            background = next((zone for zone in inside_zones if zone not in zones_in_cell), None)
+
+            cells[cell] = MIXED_CELL_FLAG | (len(mixed_cells) // MIXED_CELL_STRUCT.size)
+            mixed_cells += MIXED_CELL_STRUCT.pack(candidates_count, len(zones_in_cell), background + 1 if background is not None else 0)
+
+            for zone, edge_indexes in zones_in_cell.items():
+                candidates += CANDIDATE_STRUCT.pack(zone, zone in inside_zones, edges_count, len(edge_indexes))
+                candidates_count += 1
+                for edge_index in edge_indexes:
+                    edges_data += EDGE_STRUCT.pack(*zones_edges[zone][edge_index])
+                    edges_count += 1
+
+    names = [zone.encode("utf-8") for zone in zones]
+    names_offsets = [0]
+    for name in names:
+        names_offsets.append(names_offsets[-1] + len(name))
+
+    with open(output_path, "wb") as output_file:
+        output_file.write(HEADER_STRUCT.pack(INDEX_MAGIC, INDEX_VERSION, cells_per_degree, len(zones), len(mixed_cells) // MIXED_CELL_STRUCT.size, candidates_count, edges_count))
+        output_file.write(struct.pack(f"<{len(names_offsets)}I", *names_offsets))
+        output_file.write(b"".join(names))
+        output_file.write(cells.tobytes())
+        output_file.write(mixed_cells)
+        output_file.write(candidates)
+        output_file.write(edges_data)
@@ -0,0 +1,69 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+from kerykeion import AstrologicalSubject
+
+from .get_astrological_subject import TimedAstrologicalSubject
+from .lru_cache import LRUCache
+from ..config.settings import settings
+from ..types.request_models import SubjectModel, TransitSubjectModel
+
+transit_subject_cache = LRUCache("transit_subjects", settings.transit_subject_cache_size)
+
+
+def get_transit_astrological_subject(transit_subject: TransitSubjectModel, first_subject: SubjectModel) -> tuple[AstrologicalSubject, dict]:
+    """
+    Returns the transit AstrologicalSubject and its serialized data, computing them only once
+    for every moment, location, zodiac, sidereal mode, house system and perspective.
+
+    The transit sky does not depend on the natal subject, apart from the calculation settings, so the same
+    result is shared by all the requests asking for the same transit. The returned objects must not be modified.
+    """
+
+    key = (
+        transit_subject.year,
+        transit_subject.month,
+        transit_subject.day,
+        transit_subject.hour,
+        transit_subject.minute,
+        transit_subject.city,
+        transit_subject.nation,
+        transit_subject.latitude,
+        transit_subject.longitude,
+        transit_subject.timezone,
+        transit_subject.geonames_username,
+        first_subject.zodiac_type,
+        first_subject.sidereal_mode,
+        first_subject.houses_system_identifier,
+        first_subject.perspective_type,
+    )
+
+    cached = transit_subject_cache.get(key)
+    if cached is not None:
+        return cached
+
+    astrological_subject = TimedAstrologicalSubject(
+        name="Transit",
+        year=transit_subject.year,
+        month=transit_subject.month,
+        day=transit_subject.day,
+        hour=transit_subject.hour,
+        minute=transit_subject.minute,
+        city=transit_subject.city,
+        nation=transit_subject.nation,
+        lat=transit_subject.latitude,
+        lng=transit_subject.longitude,
+        tz_str=transit_subject.timezone,
+        zodiac_type=first_subject.zodiac_type, # type: ignore
+        sidereal_mode=first_subject.sidereal_mode,
+        houses_system_identifier=first_subject.houses_system_identifier, # type: ignore
+        perspective_type=first_subject.perspective_type, # type: ignore
+        geonames_username=transit_subject.geonames_username,
+        online=True if transit_subject.geonames_username else False,
+    )
+
+    cached = (astrological_subject, astrological_subject.model().model_dump())
+    transit_subject_cache.set(key, cached)
+
+    return cached
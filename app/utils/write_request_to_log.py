@@ -7,7 +7,9 @@ from fastapi import Request
 
 
 def get_write_request_to_log(logger: Logger):
-    def write_request_to_log(level, request: Request, message: str | Exception):
-        logger.log(level, f"{str(request.url)}: {str(message)}")
+    def write_request_to_log(level, request: Request, message: str | Exception, sample_rate: int = 1):
+        # The message is only formatted when the level is enabled, by the logging thread.
+        if logger.isEnabledFor(level):
+            logger.log(level, "%s: %s", request.url, message, extra={"sample_rate": sample_rate})
 
     return write_request_to_log
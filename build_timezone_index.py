@@ -0,0 +1,22 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import sys
+
+from app.utils.timezones import build_timezone_index
+
+# Builds the offline timezone index used to resolve the timezone from latitude and longitude.
+# The boundaries can be downloaded from https://github.com/evansiroky/timezone-boundary-builder/releases
+# (eg. timezones-with-oceans.geojson.zip, unzipped).
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python build_timezone_index.py <timezones.geojson> [output path] [cells per degree]")
+        sys.exit(1)
+
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "app/tmp/timezones.idx"
+    cells_per_degree = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    build_timezone_index(sys.argv[1], output_path, cells_per_degree)
+    print(f"Timezone index written to {output_path}")
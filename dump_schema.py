@@ -1,13 +1,27 @@
-from app.main import app
+from pathlib import Path
 import json
 
-# with open("openapi.json", "w") as outfile:
-#     json.dump(app.openapi(), outfile)
+from app.utils.openapi_cache import get_openapi_fingerprint, load_cached_openapi
+
+# The cache written by the app (openapi_cache_path in the config)
+OPENAPI_CACHE_PATH = Path(__file__).parent / "app" / "tmp" / "openapi.json"
+
+
+def get_openapi_data():
+    # Importing the app takes most of the time of a run: it is only imported without an up to date cache.
+    openapi_data = load_cached_openapi(OPENAPI_CACHE_PATH, get_openapi_fingerprint())
+    if openapi_data is not None:
+        return openapi_data
+
+    from app.main import app
+
+    return app.openapi()
+
 
 def dump_schema(output_file_path):
     BASE_URL = "https://astrologer.p.rapidapi.com/"
     RAPIDAPI_HOST = "astrologer.p.rapidapi.com" 
-    openapi_data = app.openapi()
+    openapi_data = get_openapi_data()
 
     # Define the rapidapi authentication headers
     rapidapi_auth = {
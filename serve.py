@@ -0,0 +1,32 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+"""
+
+import argparse
+import os
+
+from app.config.settings import settings
+from app.utils.prefork_server import PreforkServer, setup_master_logging
+
+# Runs the app in prefork mode: a master process preloads kerykeion, the ephemeris, the tables, the
+# timezone index and the chart themes once, then forks the workers, which share that memory copy on
+# write, and restarts the workers that exit or stop answering.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the Astrologer API with preforked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 2)))
+    parser.add_argument("--worker-timeout", type=float, default=30, help="Seconds without a heartbeat before a worker is killed and restarted")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.drain_timeout + 10, help="Seconds after which the workers still draining are killed on shutdown")
+    arguments = parser.parse_args()
+
+    setup_master_logging()
+
+    PreforkServer(
+        host=arguments.host,
+        port=arguments.port,
+        workers=arguments.workers,
+        worker_timeout=arguments.worker_timeout,
+        graceful_timeout=arguments.graceful_timeout,
+    ).run()
@@ -0,0 +1,342 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+
+    Micro-benchmarks of every endpoint of the main router (through the app, with validation and
+    serialization), of the stages of the computations (the subject for every house system and sidereal
+    mode, the aspects, the SVG render, its minification and the JSON serialization) and of the startup:
+    importing the app in a new interpreter, and generating its OpenAPI document.
+
+    The results (milliseconds per iteration) are written as JSON and compared with a baseline: the run
+    fails when the median of a case is slower than the baseline by more than --max-regression (25% by
+    default, or the per-case value of the "max_regression" of the baseline) and more than
+    --min-difference-ms, to ignore the noise of the fastest cases. The caches are disabled or cleared
+    before every iteration, so that every iteration computes; the calendar tables, precomputed once per
+    year, stay cached.
+
+    The baseline depends on the machine, so it is created (--update-baseline) on the machine running the
+    comparison and updated after accepting a performance change (eg. a kerykeion upgrade).
+
+    Usage: python tests/benchmarks/benchmark_suite.py [--filter regex] [--iterations 10] [--warmup 2]
+        [--json results.json] [--baseline tests/benchmarks/baseline.json] [--max-regression 0.25]
+        [--min-difference-ms 0.5] [--update-baseline]
+"""
+
+import argparse
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from importlib.metadata import version
+from pathlib import Path
+from typing import Callable, Union, get_args
+from urllib.parse import urlencode
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from kerykeion import KerykeionChartSVG, NatalAspects, SynastryAspects
+from kerykeion.kr_types.kr_literals import HousesSystemIdentifier, SiderealMode
+
+import kerykeion.charts.kerykeion_chart_svg
+
+from app.config.settings import settings
+from app.routers import main_router
+from app.types.request_models import SubjectModel
+from app.utils.get_astrological_subject import build_astrological_subject
+from app.utils.lru_cache import LRUCache
+
+RESULTS_FORMAT_VERSION = 1
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# The caches of precomputed data, kept between the iterations
+KEPT_CACHES = ("calendar_tables",)
+
+FIRST_SUBJECT = {
+    "name": "Benchmark",
+    "year": 1980,
+    "month": 12,
+    "day": 12,
+    "hour": 12,
+    "minute": 12,
+    "longitude": 12.4964,
+    "latitude": 41.9028,
+    "city": "Roma",
+    "nation": "IT",
+    "timezone": "Europe/Rome",
+}
+
+SECOND_SUBJECT = {
+    "name": "Benchmark Partner",
+    "year": 1984,
+    "month": 5,
+    "day": 3,
+    "hour": 7,
+    "minute": 30,
+    "longitude": -73.7949,
+    "latitude": 40.7002,
+    "city": "New York",
+    "nation": "US",
+    "timezone": "America/New_York",
+}
+
+TRANSIT_SUBJECT = {key: value for key, value in FIRST_SUBJECT.items() if key != "name"} | {"year": 2024, "month": 3, "day": 20}
+
+
+def get_query(subject: dict, prefix: str = "") -> str:
+    """
+    The query string of a subject for the GET endpoints, with the prefix of its fields (eg. "first_").
+    """
+
+    return urlencode({f"{prefix}{name}": value for name, value in subject.items()})
+
+
+# Method, path and body (or query string) of every endpoint of the main router. /api/v4/now is left out:
+# it asks the time to an external service.
+ENDPOINTS: list[tuple[str, str, Union[dict, str, None]]] = [
+    ("GET", "/", None),
+    ("GET", "/api/v4/health", None),
+    ("POST", "/api/v4/birth-data", {"subject": FIRST_SUBJECT}),
+    ("GET", "/api/v4/birth-data", get_query(FIRST_SUBJECT)),
+    ("POST", "/api/v4/birth-chart", {"subject": FIRST_SUBJECT}),
+    ("GET", "/api/v4/birth-chart", get_query(FIRST_SUBJECT)),
+    ("POST", "/api/v4/synastry-chart", {"first_subject": FIRST_SUBJECT, "second_subject": SECOND_SUBJECT}),
+    ("POST", "/api/v4/transit-chart", {"first_subject": FIRST_SUBJECT, "transit_subject": TRANSIT_SUBJECT}),
+    ("POST", "/api/v4/transit-aspects-data", {"first_subject": FIRST_SUBJECT, "transit_subject": TRANSIT_SUBJECT}),
+    ("POST", "/api/v4/synastry-aspects-data", {"first_subject": FIRST_SUBJECT, "second_subject": SECOND_SUBJECT}),
+    ("GET", "/api/v4/synastry-aspects-data", f"{get_query(FIRST_SUBJECT, 'first_')}&{get_query(SECOND_SUBJECT, 'second_')}"),
+    ("POST", "/api/v4/natal-aspects-data", {"subject": FIRST_SUBJECT}),
+    ("GET", "/api/v4/natal-aspects-data", get_query(FIRST_SUBJECT)),
+    ("POST", "/api/v4/relationship-score", {"first_subject": FIRST_SUBJECT, "second_subject": SECOND_SUBJECT}),
+    (
+        "POST",
+        "/api/v4/relationship-score-ranking",
+        {"subject": FIRST_SUBJECT, "candidates": [{"id": f"candidate-{day}", "subject": {**SECOND_SUBJECT, "day": day}} for day in range(1, 29)], "top_k": 5},
+    ),
+    ("POST", "/api/v4/composite-chart", {"first_subject": FIRST_SUBJECT, "second_subject": SECOND_SUBJECT}),
+    ("POST", "/api/v4/composite-aspects-data", {"first_subject": FIRST_SUBJECT, "second_subject": SECOND_SUBJECT}),
+    ("GET", "/api/v4/composite-aspects-data", f"{get_query(FIRST_SUBJECT, 'first_')}&{get_query(SECOND_SUBJECT, 'second_')}"),
+    ("POST", "/api/v4/lunar-phases-calendar", {"start_year": 2024, "end_year": 2024, "timezone": "Europe/Rome"}),
+    ("POST", "/api/v4/sign-ingresses-calendar", {"start_year": 2024, "end_year": 2024, "timezone": "Europe/Rome"}),
+    ("POST", "/api/v4/retrograde-stations-calendar", {"start_year": 2024, "end_year": 2024, "timezone": "Europe/Rome"}),
+    ("GET", "/metrics", None),
+]
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    function: Callable[[], object]
+
+
+@dataclass
+class Regression:
+    case: str
+    baseline_ms: float
+    median_ms: float
+    max_regression: float
+
+    def __str__(self) -> str:
+        return f"{self.case}: {self.median_ms:.3f} ms, {self.median_ms / self.baseline_ms - 1:+.1%} over the baseline ({self.baseline_ms:.3f} ms, at most {self.max_regression:+.0%})"
+
+
+def clear_caches() -> None:
+    for name, cache in list(LRUCache.registry.items()):
+        if name not in KEPT_CACHES:
+            cache.clear()
+
+
+def get_endpoint_cases() -> list[BenchmarkCase]:
+    app = FastAPI()
+    app.include_router(main_router.router)
+    client = TestClient(app)
+
+    def get_request(method: str, path: str, payload: Union[dict, str, None]) -> Callable[[], object]:
+        def request() -> object:
+            clear_caches()
+
+            if method == "GET":
+                response = client.get(f"{path}?{payload}" if payload else path)
+            else:
+                response = client.post(path, json=payload)
+
+            if response.status_code != 200:
+                raise RuntimeError(f"{method} {path}: {response.status_code} {response.text[:200]}")
+
+            return response
+
+        return request
+
+    return [BenchmarkCase(f"endpoint/{method} {path}", get_request(method, path, payload)) for method, path, payload in ENDPOINTS]
+
+
+def get_stage_cases() -> list[BenchmarkCase]:
+    first_subject_model = SubjectModel(**FIRST_SUBJECT)
+    second_subject_model = SubjectModel(**SECOND_SUBJECT)
+    first_subject = build_astrological_subject(first_subject_model)
+    second_subject = build_astrological_subject(second_subject_model)
+    template = KerykeionChartSVG(first_subject).makeTemplate(minify=False)
+    birth_chart_content = {"status": "OK", "chart": template, "data": first_subject.model().model_dump(), "aspects": [aspect.model_dump() for aspect in NatalAspects(first_subject).relevant_aspects]}
+
+    cases = [
+        BenchmarkCase(
+            f"subject/Tropic-{houses_system_identifier}",
+            lambda houses_system_identifier=houses_system_identifier: build_astrological_subject(first_subject_model.model_copy(update={"houses_system_identifier": houses_system_identifier})),
+        )
+        for houses_system_identifier in get_args(HousesSystemIdentifier)
+    ]
+
+    cases += [
+        BenchmarkCase(
+            f"subject/Sidereal-{sidereal_mode}",
+            lambda sidereal_mode=sidereal_mode: build_astrological_subject(first_subject_model.model_copy(update={"zodiac_type": "Sidereal", "sidereal_mode": sidereal_mode})),
+        )
+        for sidereal_mode in get_args(SiderealMode)
+    ]
+
+    cases += [
+        BenchmarkCase("aspects/natal", lambda: NatalAspects(first_subject).relevant_aspects),
+        BenchmarkCase("aspects/synastry", lambda: SynastryAspects(first_subject, second_subject).relevant_aspects),
+        BenchmarkCase("render/natal", lambda: KerykeionChartSVG(first_subject).makeTemplate(minify=False)),
+        BenchmarkCase("render/synastry", lambda: KerykeionChartSVG(first_subject, "Synastry", second_subject).makeTemplate(minify=False)),
+        BenchmarkCase("minify/natal", lambda: kerykeion.charts.kerykeion_chart_svg.scourString(template)),
+        BenchmarkCase("serialization/birth-chart", lambda: JSONResponse(content=birth_chart_content).body),
+    ]
+
+    return cases
+
+
+def get_startup_cases() -> list[BenchmarkCase]:
+    from app.main import app, openapi
+
+    def generate_openapi() -> dict:
+        app.openapi_schema = None
+        return FastAPI.openapi(app)
+
+    return [
+        BenchmarkCase("startup/import app.main", lambda: subprocess.run([sys.executable, "-c", "import app.main"], cwd=Path(__file__).parent.parent.parent, check=True)),
+        BenchmarkCase("startup/openapi", generate_openapi),
+        BenchmarkCase("startup/openapi (cached)", lambda: (setattr(app, "openapi_schema", None), openapi())),
+    ]
+
+
+def run_case(case: BenchmarkCase, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        case.function()
+
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        case.function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+
+    return {
+        "iterations": iterations,
+        "median_ms": round(statistics.median(durations), 4),
+        "mean_ms": round(statistics.fmean(durations), 4),
+        "min_ms": round(durations[0], 4),
+        "p95_ms": round(durations[min(len(durations) - 1, int(0.95 * len(durations)))], 4),
+        "stdev_ms": round(statistics.stdev(durations), 4) if len(durations) > 1 else 0.0,
+    }
+
+
+def run_benchmarks(filter_pattern: str = "", iterations: int = 10, warmup: int = 2) -> dict:
+    """
+    Runs the cases whose name matches the filter, and returns the results in the results format.
+    """
+
+    # Every iteration computes: no shared cache between the iterations (nor with a running server).
+    settings.shared_cache_directory = ""
+
+    cases = [case for case in [*get_stage_cases(), *get_endpoint_cases(), *get_startup_cases()] if re.search(filter_pattern, case.name)]
+
+    return {
+        "version": RESULTS_FORMAT_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "kerykeion": version("kerykeion"),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": {case.name: run_case(case, iterations, warmup) for case in cases},
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, max_regression: float = 0.25, min_difference_ms: float = 0.5) -> list[Regression]:
+    """
+    The cases slower than in the baseline by more than the allowed regression (the per-case value in
+    the "max_regression" of the baseline, or max_regression) and by more than min_difference_ms. The
+    cases missing from the baseline are not compared.
+    """
+
+    if baseline.get("version") != results.get("version"):
+        raise ValueError("The baseline has another results format version, update it")
+
+    regressions = []
+
+    for case, result in results["results"].items():
+        baseline_result = baseline["results"].get(case)
+        if baseline_result is None:
+            continue
+
+        allowed_regression = baseline.get("max_regression", {}).get(case, max_regression)
+        baseline_ms = baseline_result["median_ms"]
+
+        if result["median_ms"] > baseline_ms * (1 + allowed_regression) and result["median_ms"] - baseline_ms > min_difference_ms:
+            regressions.append(Regression(case, baseline_ms, result["median_ms"], allowed_regression))
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the endpoints and of the stages of the computations")
+    parser.add_argument("--filter", default="", help="Only the cases matching this regular expression")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--json", type=Path, help="Where to write the results")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed slowdown of the median over the baseline (0.25: 25%%)")
+    parser.add_argument("--min-difference-ms", type=float, default=0.5, help="Slowdowns smaller than this are never regressions")
+    parser.add_argument("--update-baseline", action="store_true", help="Writes the results as the new baseline instead of comparing")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.filter, arguments.iterations, arguments.warmup)
+
+    print(f"{'case':<58}{'median ms':>11}{'p95 ms':>10}{'stdev ms':>10}")
+    for case, result in results["results"].items():
+        print(f"{case:<58}{result['median_ms']:>11.3f}{result['p95_ms']:>10.3f}{result['stdev_ms']:>10.3f}")
+
+    if arguments.json:
+        arguments.json.write_text(json.dumps(results, indent=2))
+
+    if arguments.update_baseline:
+        baseline = json.loads(arguments.baseline.read_text()) if arguments.baseline.exists() else {}
+        results["max_regression"] = baseline.get("max_regression", {})
+        results["results"] = {**baseline.get("results", {}), **results["results"]}
+        arguments.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {arguments.baseline}")
+        return
+
+    if not arguments.baseline.exists():
+        print(f"No baseline at {arguments.baseline}, nothing to compare")
+        return
+
+    regressions = compare_with_baseline(results, json.loads(arguments.baseline.read_text()), arguments.max_regression, arguments.min_difference_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if regressions:
+        sys.exit(1)
+
+    print("No regression over the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+
+    Replays captured requests (see RequestCaptureMiddleware, or the workload generator) against the app,
+    in process or over HTTP, at a given concurrency and rate, and reports the throughput, the p50, p95
+    and p99 latencies and the error rate of every endpoint, and the memory growth of the server.
+
+    Usage: python tests/benchmarks/replay.py <captured requests.jsonl> [--url http://localhost:8000]
+        [--concurrency 8] [--rate 0] [--repeat 1] [--limit 0] [--header "Name: value"]
+        [--geonames-username username] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.utils.metrics import get_process_memory
+from app.utils.request_capture import CapturedRequest, read_captured_requests
+
+RESIDENT_MEMORY_PATTERN = re.compile(r'^astrologer_api_process_memory_bytes\{type="resident"\} (\S+)$', re.MULTILINE)
+
+
+@dataclass
+class ReplayedRequest:
+    # The position of the request in the replayed requests
+    index: int
+    path: str
+    status: int
+    latency: float
+    # The exception when the request failed without a response
+    error: Union[str, None] = None
+
+
+def get_percentile(sorted_values: list[float], percentile: float) -> float:
+    """
+    The nearest-rank percentile of sorted values.
+    """
+
+    if not sorted_values:
+        return 0.0
+
+    return sorted_values[max(0, math.ceil(percentile / 100 * len(sorted_values)) - 1)]
+
+
+def with_geonames_username(body: object, geonames_username: str) -> object:
+    """
+    Puts back a GeoNames username in place of the redacted ones.
+    """
+
+    if isinstance(body, dict):
+        return {
+            name: geonames_username if name == "geonames_username" and value == "REDACTED" else with_geonames_username(value, geonames_username)
+            for name, value in body.items()
+        }
+
+    if isinstance(body, list):
+        return [with_geonames_username(value, geonames_username) for value in body]
+
+    return body
+
+
+async def send_request(client: httpx.AsyncClient, index: int, captured_request: CapturedRequest, headers: dict[str, str], geonames_username: str) -> ReplayedRequest:
+    body = with_geonames_username(captured_request.body, geonames_username) if geonames_username else captured_request.body
+    query = captured_request.query.replace("geonames_username=REDACTED", f"geonames_username={geonames_username}") if geonames_username else captured_request.query
+    url = f"{captured_request.path}?{query}" if query else captured_request.path
+    start = time.perf_counter()
+
+    try:
+        response = await client.request(
+            captured_request.method,
+            url,
+            headers={**captured_request.headers, **headers},
+            content=json.dumps(body).encode("utf-8") if body is not None else None,
+        )
+        return ReplayedRequest(index, captured_request.path, response.status_code, time.perf_counter() - start)
+
+    except httpx.HTTPError as e:
+        return ReplayedRequest(index, captured_request.path, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    captured_requests: list[CapturedRequest],
+    concurrency: int = 8,
+    rate: float = 0,
+    headers: Union[dict[str, str], None] = None,
+    geonames_username: str = "",
+) -> list[ReplayedRequest]:
+    """
+    Sends the requests in order from `concurrency` concurrent workers. With a `rate`, the requests are
+    started at that many per second (an open model: a slow server does not slow down the arrivals, up to
+    the concurrency); without, as fast as the workers go.
+    """
+
+    replayed_requests: list[ReplayedRequest] = []
+    next_index = 0
+    start = time.perf_counter()
+
+    async def worker() -> None:
+        nonlocal next_index
+
+        while next_index < len(captured_requests):
+            index = next_index
+            next_index += 1
+
+            if rate > 0:
+                delay = start + index / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            replayed_requests.append(await send_request(client, index, captured_requests[index], headers or {}, geonames_username))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    return replayed_requests
+
+
+def summarize(replayed_requests: list[ReplayedRequest], elapsed: float) -> dict:
+    """
+    The throughput, latencies (milliseconds) and errors, in total and by endpoint, with the indices of
+    the slowest and of the failed requests. A request is an error when it got no response or a 5xx; the
+    4xx are counted apart, as they are usually the client's.
+    """
+
+    def get_statistics(requests: list[ReplayedRequest]) -> dict:
+        latencies = sorted(request.latency * 1000 for request in requests)
+        errors = sum(1 for request in requests if request.status == 0 or request.status >= 500)
+
+        return {
+            "requests": len(requests),
+            "throughput": round(len(requests) / elapsed, 3) if elapsed > 0 else 0.0,
+            "p50_ms": round(get_percentile(latencies, 50), 3),
+            "p95_ms": round(get_percentile(latencies, 95), 3),
+            "p99_ms": round(get_percentile(latencies, 99), 3),
+            "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+            "errors": errors,
+            "error_rate": round(errors / len(requests), 4) if requests else 0.0,
+            "client_errors": sum(1 for request in requests if 400 <= request.status < 500),
+        }
+
+    endpoints: dict[str, list[ReplayedRequest]] = {}
+    for replayed_request in replayed_requests:
+        endpoints.setdefault(replayed_request.path, []).append(replayed_request)
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": get_statistics(replayed_requests),
+        "endpoints": {path: get_statistics(requests) for path, requests in sorted(endpoints.items())},
+        "failures": sorted({request.error for request in replayed_requests if request.error})[:10],
+        "slowest": [
+            {"index": request.index, "path": request.path, "status": request.status, "latency_ms": round(request.latency * 1000, 3)}
+            for request in sorted(replayed_requests, key=lambda request: request.latency, reverse=True)[:10]
+        ],
+        "failed": sorted(request.index for request in replayed_requests if request.status == 0 or request.status >= 400),
+    }
+
+
+async def get_server_memory(client: httpx.AsyncClient, in_process: bool) -> Union[float, None]:
+    """
+    The resident memory of the server: of this process in process, otherwise from its /metrics.
+    """
+
+    if in_process:
+        return get_process_memory().get(("resident",))
+
+    try:
+        match = RESIDENT_MEMORY_PATTERN.search((await client.get("/metrics")).text)
+    except httpx.HTTPError:
+        return None
+
+    return float(match.group(1)) if match else None
+
+
+async def run_replay(
+    captured_requests: list[CapturedRequest],
+    url: str = "",
+    concurrency: int = 8,
+    rate: float = 0,
+    headers: Union[dict[str, str], None] = None,
+    geonames_username: str = "",
+    timeout: float = 60,
+) -> dict:
+    """
+    Replays the requests against the server at `url`, or against the app in this process without it,
+    and returns the summary with the memory growth of the server.
+    """
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=timeout, limits=httpx.Limits(max_connections=concurrency))
+    else:
+        from app.main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver", timeout=timeout)
+
+    async with client:
+        memory_before = await get_server_memory(client, not url)
+        start = time.perf_counter()
+        replayed_requests = await replay(client, captured_requests, concurrency, rate, headers, geonames_username)
+        elapsed = time.perf_counter() - start
+        memory_after = await get_server_memory(client, not url)
+
+    summary = summarize(replayed_requests, elapsed)
+    summary["memory"] = {
+        "before_bytes": memory_before,
+        "after_bytes": memory_after,
+        "growth_bytes": memory_after - memory_before if memory_before is not None and memory_after is not None else None,
+    }
+
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    print(f"{'endpoint':<42}{'requests':>9}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+    for path, statistics in [*summary["endpoints"].items(), ("total", summary["total"])]:
+        print(
+            f"{path:<42}{statistics['requests']:>9}{statistics['throughput']:>9.1f}{statistics['p50_ms']:>10.1f}"
+            f"{statistics['p95_ms']:>10.1f}{statistics['p99_ms']:>10.1f}{statistics['error_rate']:>8.1%}"
+        )
+
+    if summary["memory"]["growth_bytes"] is not None:
+        print(f"Memory growth: {summary['memory']['growth_bytes'] / 1024 / 1024:.1f} MiB")
+
+    for request in summary["slowest"]:
+        print(f"Slow: #{request['index']} {request['path']} {request['status']} {request['latency_ms']:.1f} ms")
+
+    if summary["failed"]:
+        print(f"Failed requests: {', '.join(f'#{index}' for index in summary['failed'][:50])}")
+
+    for failure in summary["failures"]:
+        print(f"Failure: {failure}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays captured requests against the Astrologer API")
+    parser.add_argument("path", help="The captured requests (JSONL)")
+    parser.add_argument("--url", default="", help="The server, e.g. http://localhost:8000 (the app in this process without)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="Requests started per second (0: as fast as possible)")
+    parser.add_argument("--repeat", type=int, default=1, help="Times the requests are replayed")
+    parser.add_argument("--limit", type=int, default=0, help="Maximum number of captured requests read (0: all)")
+    parser.add_argument("--header", action="append", default=[], help='Header sent with every request, e.g. "X-RapidAPI-Proxy-Secret: ..."')
+    parser.add_argument("--geonames-username", default="", help="Replaces the redacted GeoNames usernames")
+    parser.add_argument("--json", help="Writes the summary to this file")
+    arguments = parser.parse_args()
+
+    captured_requests = list(read_captured_requests(arguments.path))
+    if arguments.limit > 0:
+        captured_requests = captured_requests[: arguments.limit]
+
+    headers = dict((part.strip() for part in header.split(":", 1)) for header in arguments.header)
+    summary = asyncio.run(
+        run_replay(
+            captured_requests * arguments.repeat,
+            url=arguments.url,
+            concurrency=arguments.concurrency,
+            rate=arguments.rate,
+            headers=headers,
+            geonames_username=arguments.geonames_username,
+        )
+    )
+
+    print_summary(summary)
+
+    if arguments.json:
+        Path(arguments.json).write_text(json.dumps(summary, indent=2))
@@ -0,0 +1,139 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+
+    Hit rate and throughput of the subjects cache with several worker processes, with the cache shared by
+    the workers (SharedMemoryCache) and with a private LRU cache in every worker, as without it. The same
+    workload is split among the workers, as a load balancer would do.
+
+    Usage: python tests/benchmarks/shared_cache_benchmark.py [--workers 1 4 16] [--requests 1600] [--json results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.types.request_models import SubjectModel
+from app.utils.get_astrological_subject import build_astrological_subject
+from app.utils.lru_cache import LRUCache
+from app.utils.request_hash import get_canonical_request_json
+from app.utils.shared_memory_cache import SharedMemoryCache
+
+SLOTS = 4096
+SLOT_SIZE = 8192
+
+
+def get_subjects(distinct: int, seed: int) -> list[SubjectModel]:
+    generator = random.Random(seed)
+
+    return [
+        SubjectModel(
+            name="Benchmark",
+            year=generator.randint(1900, 2020),
+            month=generator.randint(1, 12),
+            day=generator.randint(1, 28),
+            hour=generator.randint(0, 23),
+            minute=generator.randint(0, 59),
+            longitude=round(generator.uniform(-180, 180), 4),
+            latitude=round(generator.uniform(-60, 60), 4),
+            city="Benchmark",
+            nation="US",
+            timezone="UTC",
+        )
+        for _ in range(distinct)
+    ]
+
+
+def compute_subject(subject: SubjectModel) -> dict:
+    return build_astrological_subject(subject).model().model_dump()
+
+
+def run_worker(worker: int, workers: int, mode: str, path: str, subjects: list[SubjectModel], requests: int, results: "multiprocessing.Queue") -> None:
+    # The popularity of the subjects follows a Zipf distribution, as the famous birth charts do.
+    generator = random.Random(0)
+    weights = [1 / rank for rank in range(1, len(subjects) + 1)]
+    workload = generator.choices(subjects, weights=weights, k=requests * workers)[worker::workers]
+
+    shared_cache = SharedMemoryCache(path, SLOTS, SLOT_SIZE, ttl=3600) if mode == "shared" else None
+    private_cache = LRUCache(f"benchmark-{worker}", SLOTS)
+    hits = 0
+
+    start = time.perf_counter()
+    for subject in workload:
+        key = get_canonical_request_json(subject)
+
+        if shared_cache is not None:
+            value = shared_cache.get(key)
+            if value is None:
+                shared_cache.set(key, compute_subject(subject))
+            else:
+                hits += 1
+
+        else:
+            value = private_cache.get(key)
+            if value is None:
+                private_cache.set(key, compute_subject(subject))
+            else:
+                hits += 1
+
+    results.put((hits, len(workload), time.perf_counter() - start))
+
+
+def run_benchmark(workers: int, mode: str, subjects: list[SubjectModel], requests: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "subjects.cache")
+        results: multiprocessing.Queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_worker, args=(worker, workers, mode, path, subjects, requests // workers, results)) for worker in range(workers)]
+
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+
+        worker_results = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+    hits = sum(result[0] for result in worker_results)
+    total = sum(result[1] for result in worker_results)
+
+    return {
+        "workers": workers,
+        "mode": mode,
+        "requests": total,
+        "hit_rate": round(hits / total, 4),
+        "throughput": round(total / elapsed, 1),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark of the subjects cache shared by the workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=1600, help="Requests split among the workers")
+    parser.add_argument("--distinct", type=int, default=500, help="Distinct subjects in the workload")
+    parser.add_argument("--json", type=Path, help="Where to write the results")
+    arguments = parser.parse_args()
+
+    subjects = get_subjects(arguments.distinct, seed=0)
+    results = []
+
+    print(f"{'workers':>8} {'mode':>8} {'requests':>9} {'hit rate':>9} {'req/s':>9}")
+    for workers in arguments.workers:
+        for mode in ("private", "shared"):
+            result = run_benchmark(workers, mode, subjects, arguments.requests)
+            results.append(result)
+            print(f"{result['workers']:>8} {result['mode']:>8} {result['requests']:>9} {result['hit_rate']:>9.1%} {result['throughput']:>9}")
+
+    if arguments.json:
+        arguments.json.write_text(json.dumps({"benchmark": "shared_cache", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
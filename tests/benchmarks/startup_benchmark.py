@@ -0,0 +1,118 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+
+    Import time breakdown of the app: imports app.main in a new interpreter with python -X importtime and
+    reports the total, the time by package (the self time of all its modules) and the slowest modules
+    of the app, then checks the startup budget:
+
+    - the modules of the app (their own code, without the packages they import) take at most
+      APP_IMPORT_BUDGET_MS;
+    - the LAZY_MODULES, only needed by some requests or some configurations, are not imported.
+
+    The packages (fastapi and pydantic, kerykeion, requests) take most of the import, and are needed by
+    every worker. The timings of -X importtime include its own overhead.
+
+    Usage: python tests/benchmarks/startup_benchmark.py [--module app.main] [--top 15] [--json results.json]
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+ROOT_DIRECTORY = Path(__file__).parent.parent.parent
+
+APP_IMPORT_BUDGET_MS = 300
+
+# Imported when needed, with the default config: uvicorn for its log formatters (the text logs),
+# cProfile for the profiled requests.
+LAZY_MODULES = ("uvicorn", "cProfile")
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def get_import_times(module: str = "app.main") -> dict[str, ImportTime]:
+    """
+    The import times of every module imported by `import <module>`, in a new interpreter.
+    """
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT_DIRECTORY, capture_output=True, text=True, check=True)
+
+    import_times = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            import_times[match.group(4)] = ImportTime(match.group(4), int(match.group(1)), int(match.group(2)))
+
+    return import_times
+
+
+def get_startup_report(import_times: dict[str, ImportTime], module: str = "app.main", top: int = 15) -> dict:
+    """
+    The total import time, the time by package and the slowest modules of the app (milliseconds).
+    """
+
+    packages: dict[str, int] = {}
+    for import_time in import_times.values():
+        package = import_time.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + import_time.self_us
+
+    app_modules = sorted((import_time for import_time in import_times.values() if import_time.module.split(".")[0] == "app"), key=lambda import_time: -import_time.self_us)
+
+    return {
+        "total_ms": round(import_times[module].cumulative_us / 1000, 1) if module in import_times else None,
+        "app_ms": round(packages.get("app", 0) / 1000, 1),
+        "packages": {package: round(self_us / 1000, 1) for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        "app_modules": {import_time.module: round(import_time.self_us / 1000, 1) for import_time in app_modules[:top]},
+        "lazy_modules_imported": [lazy_module for lazy_module in LAZY_MODULES if lazy_module in import_times],
+    }
+
+
+def check_startup_budget(report: dict) -> list[str]:
+    """
+    The violations of the startup budget.
+    """
+
+    violations = [f"The app modules take {report['app_ms']} ms to import, over the budget of {APP_IMPORT_BUDGET_MS} ms"] if report["app_ms"] > APP_IMPORT_BUDGET_MS else []
+    violations += [f"{lazy_module} is imported at startup" for lazy_module in report["lazy_modules_imported"]]
+
+    return violations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import time breakdown of the app")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", type=Path, help="Where to write the report")
+    arguments = parser.parse_args()
+
+    report = get_startup_report(get_import_times(arguments.module), arguments.module, arguments.top)
+
+    print(f"import {arguments.module}: {report['total_ms']} ms, of which the app modules {report['app_ms']} ms")
+    for title, times in (("package", report["packages"]), ("app module", report["app_modules"])):
+        print(f"\n{title:<58}{'ms':>8}")
+        for name, milliseconds in times.items():
+            print(f"{name:<58}{milliseconds:>8.1f}")
+
+    if arguments.json:
+        arguments.json.write_text(json.dumps(report, indent=2))
+
+    violations = check_startup_budget(report)
+    for violation in violations:
+        print(f"\nOver budget: {violation}")
+
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+    This is part of Astrologer API (C) 2023 Giacomo Battaglia
+
+    Generates synthetic workloads in the captured requests format, to be replayed (replay.py) like the
+    real traffic. The subjects are a mix of:
+
+    - realistic subjects: births of the last century in populated cities, mostly tropical with Placidus;
+    - adversarial subjects: every house system, every sidereal mode and every perspective type, polar
+      latitudes (where most quadrant house systems break down), longitudes on the date line, local times
+      skipped or repeated by the DST transitions, and the edges of the supported years (1800 and 2100).
+
+    Every value of the house systems, sidereal modes and perspective types appears at least once, and
+    the endpoints are drawn with the weights of --mix. The generation is deterministic for a seed, and
+    every request is validated with the request models of the API.
+
+    Usage: python tests/benchmarks/workload_generator.py <output.jsonl> [--requests 1000]
+        [--adversarial 0.3] [--mix birth-data=40,birth-chart=15,...] [--seed 0]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, get_args
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from kerykeion.kr_types.kr_literals import HousesSystemIdentifier, PerspectiveType, SiderealMode
+
+from app.types import request_models
+from app.utils.request_capture import CapturedRequest
+
+# Name, nation, latitude, longitude and timezone of the cities of the realistic subjects
+CITIES = [
+    ("New York", "US", 40.7128, -74.006, "America/New_York"),
+    ("Los Angeles", "US", 34.0522, -118.2437, "America/Los_Angeles"),
+    ("Mexico City", "MX", 19.4326, -99.1332, "America/Mexico_City"),
+    ("Sao Paulo", "BR", -23.5505, -46.6333, "America/Sao_Paulo"),
+    ("London", "GB", 51.5074, -0.1278, "Europe/London"),
+    ("Roma", "IT", 41.9028, 12.4964, "Europe/Rome"),
+    ("Berlin", "DE", 52.52, 13.405, "Europe/Berlin"),
+    ("Moscow", "RU", 55.7558, 37.6173, "Europe/Moscow"),
+    ("Cairo", "EG", 30.0444, 31.2357, "Africa/Cairo"),
+    ("Lagos", "NG", 6.5244, 3.3792, "Africa/Lagos"),
+    ("Mumbai", "IN", 19.076, 72.8777, "Asia/Kolkata"),
+    ("Beijing", "CN", 39.9042, 116.4074, "Asia/Shanghai"),
+    ("Tokyo", "JP", 35.6762, 139.6503, "Asia/Tokyo"),
+    ("Sydney", "AU", -33.8688, 151.2093, "Australia/Sydney"),
+]
+
+# Polar places: near and beyond the polar circles, up to the poles
+POLAR_PLACES = [
+    ("Tromso", "NO", 69.6492, 18.9553, "Europe/Oslo"),
+    ("Longyearbyen", "NO", 78.2232, 15.6267, "Arctic/Longyearbyen"),
+    ("Utqiagvik", "US", 71.2906, -156.7886, "America/Anchorage"),
+    ("Alert", "CA", 82.5018, -62.3481, "America/Toronto"),
+    ("North Pole", None, 89.9999, 0.0, "UTC"),
+    ("McMurdo", "AQ", -77.8419, 166.6863, "Antarctica/McMurdo"),
+    ("South Pole", "AQ", -89.9999, 0.0, "Antarctica/McMurdo"),
+]
+
+# Places on the date line
+DATE_LINE_PLACES = [
+    ("Apia", "WS", -13.8333, -171.7667, "Pacific/Apia"),
+    ("Kiritimati", "KI", 1.8721, -157.4278, "Pacific/Kiritimati"),
+    ("Date Line West", None, 0.0, -180.0, "Etc/GMT+12"),
+    ("Date Line East", None, 0.0, 180.0, "Etc/GMT-12"),
+    ("Taveuni", "FJ", -16.8, 179.9999, "Pacific/Fiji"),
+    ("Chatham Islands", "NZ", -43.9535, -176.5597, "Pacific/Chatham"),
+]
+
+# Local times skipped (spring forward) and repeated (fall back) by the DST transitions: place and
+# (year, month, day, hour, minute)
+DST_TRANSITIONS = [
+    (CITIES[5], (2021, 3, 28, 2, 30)),
+    (CITIES[5], (2021, 10, 31, 2, 30)),
+    (CITIES[0], (2021, 3, 14, 2, 30)),
+    (CITIES[0], (2021, 11, 7, 1, 30)),
+    (CITIES[13], (2021, 4, 4, 2, 30)),
+    (CITIES[13], (2021, 10, 3, 2, 30)),
+    (CITIES[4], (1971, 10, 31, 2, 30)),
+    (DATE_LINE_PLACES[5], (2021, 4, 4, 3, 30)),
+]
+
+# The first and last minutes of the supported years
+YEAR_EDGES = [(1800, 1, 1, 0, 0), (1800, 12, 31, 23, 59), (2100, 1, 1, 0, 0), (2100, 12, 31, 23, 59)]
+
+DEFAULT_MIX = {
+    "birth-data": 35,
+    "birth-chart": 15,
+    "natal-aspects-data": 10,
+    "synastry-aspects-data": 8,
+    "synastry-chart": 5,
+    "transit-chart": 4,
+    "transit-aspects-data": 4,
+    "relationship-score": 8,
+    "relationship-score-ranking": 1,
+    "composite-chart": 2,
+    "composite-aspects-data": 3,
+    "lunar-phases-calendar": 2,
+    "sign-ingresses-calendar": 2,
+    "retrograde-stations-calendar": 1,
+}
+
+
+def get_subject(place: tuple, moment: tuple, name: str = "Workload", **options: object) -> dict:
+    city, nation, latitude, longitude, timezone = place
+    year, month, day, hour, minute = moment
+
+    return {
+        "name": name,
+        "year": year,
+        "month": month,
+        "day": day,
+        "hour": hour,
+        "minute": minute,
+        "latitude": latitude,
+        "longitude": longitude,
+        "city": city,
+        "nation": nation,
+        "timezone": timezone,
+        **options,
+    }
+
+
+def get_random_moment(generator: random.Random, first_year: int = 1940, last_year: int = 2010) -> tuple:
+    return (generator.randint(first_year, last_year), generator.randint(1, 12), generator.randint(1, 28), generator.randint(0, 23), generator.randint(0, 59))
+
+
+def get_realistic_subject(generator: random.Random) -> dict:
+    options: dict = {}
+    if generator.random() < 0.1:
+        options["houses_system_identifier"] = generator.choice(["W", "K", "R", "A"])
+    if generator.random() < 0.05:
+        options.update(zodiac_type="Sidereal", sidereal_mode=generator.choice(["LAHIRI", "FAGAN_BRADLEY", "RAMAN"]))
+
+    return get_subject(generator.choice(CITIES), get_random_moment(generator), **options)
+
+
+def get_adversarial_subjects() -> list[dict]:
+    """
+    Every adversarial case once: the house systems, sidereal modes and perspective types (at a polar
+    latitude for the house systems), the polar and date line places, the DST transitions and the
+    year edges.
+    """
+
+    moment = (1990, 6, 21, 12, 0)
+    subjects = [get_subject(POLAR_PLACES[0], moment, houses_system_identifier=houses_system_identifier) for houses_system_identifier in get_args(HousesSystemIdentifier)]
+    subjects += [get_subject(CITIES[10], moment, zodiac_type="Sidereal", sidereal_mode=sidereal_mode) for sidereal_mode in get_args(SiderealMode)]
+    subjects += [get_subject(CITIES[4], moment, perspective_type=perspective_type) for perspective_type in get_args(PerspectiveType)]
+    subjects += [get_subject(place, (1990, 12, 21, 0, 0)) for place in POLAR_PLACES]
+    subjects += [get_subject(place, (2000, 1, 1, 0, 0)) for place in DATE_LINE_PLACES]
+    subjects += [get_subject(place, transition) for place, transition in DST_TRANSITIONS]
+    subjects += [get_subject(place, edge) for edge in YEAR_EDGES for place in (CITIES[4], DATE_LINE_PLACES[3], POLAR_PLACES[4])]
+
+    return subjects
+
+
+def get_random_adversarial_subject(generator: random.Random, adversarial_subjects: list[dict]) -> dict:
+    """
+    An adversarial case combined with a random house system, zodiac or perspective.
+    """
+
+    subject = dict(generator.choice(adversarial_subjects))
+
+    choice = generator.random()
+    if choice < 0.3:
+        subject["houses_system_identifier"] = generator.choice(get_args(HousesSystemIdentifier))
+    elif choice < 0.5:
+        subject.update(zodiac_type="Sidereal", sidereal_mode=generator.choice(get_args(SiderealMode)))
+    elif choice < 0.6:
+        subject["perspective_type"] = generator.choice(get_args(PerspectiveType))
+
+    return subject
+
+
+def get_transit_subject(subject: dict) -> dict:
+    return {name: value for name, value in subject.items() if name in request_models.TransitSubjectModel.model_fields}
+
+
+def get_calendar_request(generator: random.Random, subject: dict) -> dict:
+    start_year = generator.choice([1800, 1900, 1969, 2000, 2024, 2099])
+    sidereal_mode = subject.get("sidereal_mode")
+
+    return {"start_year": start_year, "end_year": start_year, "timezone": subject["timezone"], **({"sidereal_mode": sidereal_mode} if sidereal_mode else {})}
+
+
+# Path, request model and body of every endpoint, from a subject and a second one
+ENDPOINT_BODIES: dict[str, tuple[type, Callable[[random.Random, dict, dict], dict]]] = {
+    "birth-data": (request_models.BirthDataRequestModel, lambda generator, first, second: {"subject": first}),
+    "birth-chart": (request_models.BirthChartRequestModel, lambda generator, first, second: {"subject": first, "theme": generator.choice(["classic", "dark", "light"])}),
+    "natal-aspects-data": (request_models.NatalAspectsRequestModel, lambda generator, first, second: {"subject": first}),
+    "synastry-aspects-data": (request_models.SynastryAspectsRequestModel, lambda generator, first, second: {"first_subject": first, "second_subject": second}),
+    "synastry-chart": (request_models.SynastryChartRequestModel, lambda generator, first, second: {"first_subject": first, "second_subject": second}),
+    "transit-chart": (request_models.TransitChartRequestModel, lambda generator, first, second: {"first_subject": first, "transit_subject": get_transit_subject(second)}),
+    "transit-aspects-data": (request_models.TransitChartRequestModel, lambda generator, first, second: {"first_subject": first, "transit_subject": get_transit_subject(second)}),
+    "relationship-score": (request_models.RelationshipScoreRequestModel, lambda generator, first, second: {"first_subject": first, "second_subject": second}),
+    "relationship-score-ranking": (
+        request_models.RelationshipScoreRankingRequestModel,
+        lambda generator, first, second: {"subject": first, "candidates": [{"id": f"candidate-{day}", "subject": {**second, "day": day}} for day in range(1, 29)], "top_k": 5},
+    ),
+    "composite-chart": (request_models.CompositeChartRequestModel, lambda generator, first, second: {"first_subject": first, "second_subject": second}),
+    "composite-aspects-data": (request_models.CompositeChartRequestModel, lambda generator, first, second: {"first_subject": first, "second_subject": second}),
+    "lunar-phases-calendar": (request_models.CalendarRequestModel, lambda generator, first, second: get_calendar_request(generator, first)),
+    "sign-ingresses-calendar": (request_models.CalendarRequestModel, lambda generator, first, second: get_calendar_request(generator, first)),
+    "retrograde-stations-calendar": (request_models.CalendarRequestModel, lambda generator, first, second: get_calendar_request(generator, first)),
+}
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+
+    for entry in mix.split(","):
+        endpoint, _, weight = entry.partition("=")
+        if endpoint.strip() not in ENDPOINT_BODIES:
+            raise ValueError(f"Unknown endpoint in the mix: {endpoint}")
+
+        weights[endpoint.strip()] = float(weight)
+
+    return weights
+
+
+def generate_workload(requests: int, adversarial: float = 0.3, mix: dict[str, float] = DEFAULT_MIX, seed: int = 0) -> list[CapturedRequest]:
+    """
+    The requests of the workload: first every adversarial subject once (with the birth data endpoint,
+    when the workload is large enough), then subjects drawn at random, adversarial with probability
+    `adversarial`, sent to endpoints drawn with the weights of the mix.
+    """
+
+    generator = random.Random(seed)
+    adversarial_subjects = get_adversarial_subjects()
+    endpoints, weights = list(mix), list(mix.values())
+
+    def draw_subject() -> dict:
+        return get_random_adversarial_subject(generator, adversarial_subjects) if generator.random() < adversarial else get_realistic_subject(generator)
+
+    planned = [("birth-data", subject, draw_subject()) for subject in adversarial_subjects] if adversarial > 0 and requests >= len(adversarial_subjects) else []
+    planned += [(generator.choices(endpoints, weights)[0], draw_subject(), draw_subject()) for _ in range(requests - len(planned))]
+
+    workload = []
+    for index, (endpoint, first_subject, second_subject) in enumerate(planned):
+        request_model, get_body = ENDPOINT_BODIES[endpoint]
+        body = get_body(generator, first_subject, {**second_subject, "name": "Workload Partner"})
+
+        # Fails on the requests the API would reject: the workload is made of valid requests only.
+        request_model.model_validate(body)
+
+        workload.append(
+            CapturedRequest(
+                method="POST",
+                path=f"/api/v4/{endpoint}",
+                headers={"content-type": "application/json"},
+                body=body,
+                time=round(time.time(), 3) + index * 0.001,
+            )
+        )
+
+    return workload
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generates a synthetic workload in the captured requests format")
+    parser.add_argument("path", type=Path, help="Where to write the requests (JSONL)")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--adversarial", type=float, default=0.3, help="Share of the adversarial subjects")
+    parser.add_argument("--mix", default="", help="Weights of the endpoints, e.g. birth-data=50,birth-chart=50")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    workload = generate_workload(arguments.requests, arguments.adversarial, parse_mix(arguments.mix) if arguments.mix else DEFAULT_MIX, arguments.seed)
+    arguments.path.write_text("".join(captured_request.to_json() + "\n" for captured_request in workload), encoding="utf-8")
+
+    print(f"{len(workload)} requests written to {arguments.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -203,3 +203,1469 @@ def test_birth_chart():
     assert round(response.json()["aspects"][0]["diff"]) == 58
     assert response.json()["aspects"][0]["p1"] == 0
     assert response.json()["aspects"][0]["p2"] == 1
+
+
+def test_relationship_score_ranking():
+    """
+    Tests if the relationship score ranking returns the same scores of the relationship score endpoint
+    """
+
+    subject = {
+        "name": "FastAPI Unit Test",
+        "year": 1946,
+        "month": 6,
+        "day": 16,
+        "hour": 10,
+        "minute": 10,
+        "longitude": 12.4963655,
+        "latitude": 41.9027835,
+        "city": "Roma",
+        "nation": "IT",
+        "timezone": "Europe/Rome",
+    }
+
+    candidates = [
+        {"id": "same", "subject": subject},
+        {"id": "london", "subject": {**subject, "year": 1980, "month": 12, "day": 12, "longitude": 0, "latitude": 51.4825766, "city": "London", "nation": "GB", "timezone": "Europe/London"}},
+        {"id": "older", "subject": {**subject, "year": 1920, "month": 2, "day": 3}},
+        {"id": "spring-1957", "subject": {**subject, "year": 1957, "month": 3, "day": 9}},
+        {"id": "spring-1975", "subject": {**subject, "year": 1975, "month": 3, "day": 9}},
+    ]
+
+    response = client.post(
+        "/api/v4/relationship-score-ranking",
+        json={"subject": subject, "candidates": candidates, "top_k": 2},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "OK"
+    assert response.json()["candidates_count"] == 5
+    # The candidates whose upper bound cannot enter the top 2 are not scored
+    assert response.json()["scored_count"] < response.json()["candidates_count"]
+    assert len(response.json()["ranking"]) == 2
+
+    for item in response.json()["ranking"]:
+        candidate = next(candidate for candidate in candidates if candidate["id"] == item["id"])
+        single_pair_response = client.post(
+            "/api/v4/relationship-score",
+            json={"first_subject": subject, "second_subject": candidate["subject"]},
+        )
+
+        assert item["score"] == single_pair_response.json()["score"]
+        assert item["aspects"] == single_pair_response.json()["aspects"]
+
+    assert response.json()["ranking"][0]["score"] >= response.json()["ranking"][1]["score"]
+
+    # The candidates sent with the positions returned by the birth data endpoint rank the same
+    positions_candidates = []
+    for candidate in candidates:
+        data = client.post("/api/v4/birth-data", json={"subject": candidate["subject"]}).json()["data"]
+        positions = {point: data[point]["abs_pos"] for point in ("sun", "moon", "venus", "mars", "ascendant")}
+        positions_candidates.append({"id": candidate["id"], "positions": {**positions, "sun_quality": data["sun"]["quality"]}})
+
+    positions_response = client.post(
+        "/api/v4/relationship-score-ranking",
+        json={"subject": subject, "candidates": positions_candidates, "top_k": 2},
+    )
+
+    assert positions_response.status_code == 200
+    assert positions_response.json()["ranking"] == response.json()["ranking"]
+
+    for invalid_candidate in [{"id": "none"}, {**positions_candidates[0], "subject": subject}]:
+        response = client.post(
+            "/api/v4/relationship-score-ranking",
+            json={"subject": subject, "candidates": [invalid_candidate], "top_k": 2},
+        )
+
+        assert response.status_code == 422
+
+    too_many_candidates = [{**positions_candidates[0], "id": str(index)} for index in range(50001)]
+    response = client.post(
+        "/api/v4/relationship-score-ranking",
+        json={"subject": subject, "candidates": too_many_candidates, "top_k": 2},
+    )
+
+    assert response.status_code == 422
+
+
+def test_transit_aspects_data_shares_transit_subject():
+    """
+    Tests if the transit side is computed once and reused for different natal subjects
+    """
+
+    from app.utils.transit_subject_cache import transit_subject_cache
+
+    transit_subject = {
+        "year": 2024,
+        "month": 3,
+        "day": 20,
+        "hour": 12,
+        "minute": 0,
+        "longitude": 0,
+        "latitude": 51.4825766,
+        "city": "London",
+        "nation": "GB",
+        "timezone": "Europe/London",
+    }
+
+    first_subject = {
+        "name": "FastAPI Unit Test",
+        "year": 1980,
+        "month": 12,
+        "day": 12,
+        "hour": 12,
+        "minute": 12,
+        "longitude": 0,
+        "latitude": 51.4825766,
+        "city": "London",
+        "nation": "GB",
+        "timezone": "Europe/London",
+    }
+
+    transit_subject_cache.clear()
+
+    first_response = client.post("/api/v4/transit-aspects-data", json={"first_subject": first_subject, "transit_subject": transit_subject})
+    second_response = client.post("/api/v4/transit-aspects-data", json={"first_subject": {**first_subject, "year": 1990}, "transit_subject": transit_subject})
+
+    assert first_response.status_code == 200
+    assert second_response.status_code == 200
+    assert first_response.json()["data"]["transit"] == second_response.json()["data"]["transit"]
+    assert first_response.json()["data"]["subject"]["year"] == 1980
+    assert second_response.json()["data"]["subject"]["year"] == 1990
+    assert transit_subject_cache.misses == 1
+    assert transit_subject_cache.hits == 1
+
+
+def test_birth_data_variants():
+    """
+    Tests if the house systems and sidereal modes variants match the data of single requests
+    """
+
+    subject = {
+        "name": "FastAPI Unit Test",
+        "year": 1980,
+        "month": 12,
+        "day": 12,
+        "hour": 12,
+        "minute": 12,
+        "longitude": 0,
+        "latitude": 51.4825766,
+        "city": "London",
+        "nation": "GB",
+        "timezone": "Europe/London",
+    }
+
+    response = client.post(
+        "/api/v4/birth-data",
+        json={"subject": subject, "houses_system_identifiers": ["K", "W"], "sidereal_modes": ["LAHIRI"]},
+    )
+
+    assert response.status_code == 200
+    assert set(response.json()["variants"]) == {"Tropic/P", "Tropic/K", "Tropic/W", "LAHIRI/P", "LAHIRI/K", "LAHIRI/W"}
+    assert response.json()["variants"]["Tropic/P"] == response.json()["data"]
+
+    single_response = client.post(
+        "/api/v4/birth-data",
+        json={"subject": {**subject, "zodiac_type": "Sidereal", "sidereal_mode": "LAHIRI", "houses_system_identifier": "W"}},
+    )
+    variant = response.json()["variants"]["LAHIRI/W"]
+
+    for point in ["sun", "moon", "pluto", "first_house", "tenth_house"]:
+        assert round(variant[point]["abs_pos"], 6) == round(single_response.json()["data"][point]["abs_pos"], 6)
+        assert variant[point]["house"] == single_response.json()["data"][point]["house"]
+
+
+def test_birth_chart_variants():
+    """
+    Tests if the themes and languages variants are identical to the charts of single requests
+    """
+
+    subject = {
+        "name": "FastAPI Unit Test",
+        "year": 1980,
+        "month": 12,
+        "day": 12,
+        "hour": 12,
+        "minute": 12,
+        "longitude": 0,
+        "latitude": 51.4825766,
+        "city": "London",
+        "nation": "GB",
+        "timezone": "Europe/London",
+    }
+
+    response = client.post(
+        "/api/v4/birth-chart",
+        json={"subject": subject, "theme": "classic", "language": "EN", "themes": ["dark"], "languages": ["IT"]},
+    )
+
+    assert response.status_code == 200
+    assert set(response.json()["charts"]) == {"classic/EN", "classic/IT", "dark/EN", "dark/IT"}
+    assert response.json()["charts"]["classic/EN"] == response.json()["chart"]
+
+    single_response = client.post(
+        "/api/v4/birth-chart",
+        json={"subject": subject, "theme": "dark", "language": "IT"},
+    )
+
+    assert response.json()["charts"]["dark/IT"] == single_response.json()["chart"]
+    assert single_response.json()["charts"] is None
+
+
+def test_lunar_phases_calendar():
+    """
+    Tests the lunar phases calendar against a birth data request for the same day
+    """
+
+    response = client.post(
+        "/api/v4/lunar-phases-calendar",
+        json={"start_year": 2024, "start_month": 1, "end_year": 2024, "end_month": 1, "timezone": "Europe/Rome"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["lunar_phases"][1] == {"date": "2024-01-11T12:57:25+01:00", "phase": "New Moon"}
+    assert len(response.json()["days"]) == 31
+
+    birth_data_response = client.post(
+        "/api/v4/birth-data",
+        json={
+            "subject": {
+                "name": "Calendar",
+                "year": 2024,
+                "month": 1,
+                "day": 25,
+                "hour": 12,
+                "minute": 0,
+                "longitude": 0,
+                "latitude": 51.4825766,
+                "city": "London",
+                "nation": "GB",
+                "timezone": "UTC",
+            }
+        },
+    )
+
+    day = response.json()["days"][24]
+    assert day["date"] == "2024-01-25"
+    assert day["lunar_phase"]["moon_phase"] == birth_data_response.json()["data"]["lunar_phase"]["moon_phase"]
+
+
+def test_sign_ingresses_and_retrograde_stations_calendar():
+    """
+    Tests the sign ingresses and retrograde stations calendars
+    """
+
+    response = client.post("/api/v4/sign-ingresses-calendar", json={"start_year": 2024, "start_month": 3, "end_year": 2024, "end_month": 3})
+
+    assert response.status_code == 200
+    sun_ingresses = [ingress for ingress in response.json()["sign_ingresses"] if ingress["planet"] == "Sun"]
+    assert sun_ingresses == [{"date": "2024-03-20T03:06:24+00:00", "planet": "Sun", "sign": "Ari", "sign_num": 0, "emoji": "♈️", "retrograde": False}]
+
+    response = client.post("/api/v4/retrograde-stations-calendar", json={"start_year": 2024, "start_month": 4, "end_year": 2024, "end_month": 4})
+
+    assert response.status_code == 200
+    assert [(station["planet"], station["station"]) for station in response.json()["retrograde_stations"]] == [("Mercury", "retrograde"), ("Mercury", "direct")]
+
+
+def test_calendar_year_tables_of_range(monkeypatch):
+    """
+    Tests if a calendar range loads only the tables of the years it covers
+    """
+
+    from app.utils import astrological_calendar
+
+    loaded_years = []
+
+    def get_year_tables(year, sidereal_mode=None):
+        loaded_years.append(year)
+        return {"lunar_phases": []}
+
+    monkeypatch.setattr(astrological_calendar, "get_year_tables", get_year_tables)
+
+    start, end = astrological_calendar._get_utc_range(2024, 1, 2024, 12, "UTC")
+    astrological_calendar._get_events("lunar_phases", start, end, None)
+    assert loaded_years == [2024]
+
+    # Midnight of the 1st of January in New York is already in the next year in UTC
+    loaded_years.clear()
+    start, end = astrological_calendar._get_utc_range(2024, 1, 2024, 12, "America/New_York")
+    astrological_calendar._get_events("lunar_phases", start, end, None)
+    assert loaded_years == [2024, 2025]
+
+
+def test_timezone_from_coordinates(tmp_path, monkeypatch):
+    """
+    Tests the offline timezone resolution from latitude and longitude
+    """
+
+    import json
+    from app.utils import timezones
+
+    def square(west, south, east, north):
+        return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+    geojson_path = tmp_path / "timezones.geojson"
+    geojson_path.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"properties": {"tzid": "Europe/Rome"}, "geometry": {"type": "Polygon", "coordinates": [square(6.5, 36.5, 18.5, 47.1), square(12.4, 41.8, 12.6, 42)]}},
+                    {"properties": {"tzid": "Europe/Vatican"}, "geometry": {"type": "MultiPolygon", "coordinates": [[square(12.4, 41.8, 12.6, 42)]]}},
+                ],
+            }
+        )
+    )
+    timezones.build_timezone_index(geojson_path, tmp_path / "timezones.idx")
+
+    monkeypatch.setattr(timezones, "_timezone_index", timezones.TimezoneIndex(tmp_path / "timezones.idx"))
+    monkeypatch.setattr(timezones, "_timezone_index_loaded", True)
+
+    assert timezones.get_timezone_from_coordinates(41.9, 12.5) == "Europe/Vatican"
+    assert timezones.get_timezone_from_coordinates(41.9, 12.3) == "Europe/Rome"
+    assert timezones.get_timezone_from_coordinates(40, -30) == "Etc/GMT+2"
+
+    response = client.post(
+        "/api/v4/birth-data",
+        json={"subject": {"name": "Roma", "year": 1980, "month": 12, "day": 12, "hour": 12, "minute": 12, "latitude": 41.9, "longitude": 12.3, "city": "Roma"}},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["data"]["tz_str"] == "Europe/Rome"
+
+
+def test_identical_concurrent_requests_are_coalesced():
+    """
+    Tests if identical requests in flight at the same time share a single computation
+    """
+
+    import asyncio
+    import httpx
+    from app.utils.single_flight import computations_single_flight
+
+    request_body = {
+        "subject": {
+            "name": "FastAPI Unit Test",
+            "year": 1975,
+            "month": 10,
+            "day": 10,
+            "hour": 21,
+            "minute": 15,
+            "longitude": 12.4963655,
+            "latitude": 41.9027835,
+            "city": "Roma",
+            "nation": "IT",
+            "timezone": "Europe/Rome",
+        }
+    }
+
+    async def post_concurrently():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as async_client:
+            return await asyncio.gather(*[async_client.post("/api/v4/birth-chart", json=request_body) for _ in range(5)])
+
+    started, coalesced = computations_single_flight.started, computations_single_flight.coalesced
+    responses = asyncio.run(post_concurrently())
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert computations_single_flight.started - started == 1
+    assert computations_single_flight.coalesced - coalesced == 4
+
+
+def test_get_variants_are_cacheable(monkeypatch):
+    """
+    Tests if the GET variants validate and compute as the POST endpoints, with ETag and Cache-Control
+    """
+
+    subject = {
+        "name": "FastAPI Unit Test",
+        "year": 1946,
+        "month": 6,
+        "day": 16,
+        "hour": 10,
+        "minute": 10,
+        "longitude": 12.4963655,
+        "latitude": 41.9027835,
+        "city": "Roma",
+        "nation": "IT",
+        "timezone": "Europe/Rome",
+    }
+
+    post_response = client.post("/api/v4/natal-aspects-data", json={"subject": subject, "active_points": ["Sun", "Moon", "Mars"]})
+    get_response = client.get("/api/v4/natal-aspects-data", params={**subject, "active_points": ["Sun", "Moon", "Mars"]})
+
+    assert get_response.status_code == 200
+    assert get_response.json() == post_response.json()
+    assert get_response.headers["cache-control"].startswith("public")
+
+    # The same request with the parameters in another order has the same ETag
+    reordered_response = client.get("/api/v4/natal-aspects-data", params={"active_points": ["Sun", "Moon", "Mars"], **dict(reversed(subject.items()))})
+    assert reordered_response.headers["etag"] == get_response.headers["etag"]
+
+    not_modified_response = client.get("/api/v4/natal-aspects-data", params={**subject, "active_points": ["Sun", "Moon", "Mars"]}, headers={"If-None-Match": get_response.headers["etag"]})
+    assert not_modified_response.status_code == 304
+    assert not_modified_response.content == b""
+
+    # After a deploy changing the results, the ETags of the previous version do not match
+    from app.routers import main_router
+
+    monkeypatch.setattr(main_router, "get_result_version", lambda: "0" * 16)
+    modified_response = client.get("/api/v4/natal-aspects-data", params={**subject, "active_points": ["Sun", "Moon", "Mars"]}, headers={"If-None-Match": get_response.headers["etag"]})
+    assert modified_response.status_code == 200
+    assert modified_response.headers["etag"] != get_response.headers["etag"]
+
+    synastry_response = client.get(
+        "/api/v4/synastry-aspects-data",
+        params={
+            **{f"first_{key}": value for key, value in subject.items()},
+            **{f"second_{key}": value for key, value in subject.items()},
+            "active_aspects": ["conjunction:10", "opposition:8"],
+        },
+    )
+    assert synastry_response.status_code == 200
+    assert {aspect["aspect"] for aspect in synastry_response.json()["aspects"]} <= {"conjunction", "opposition"}
+
+    invalid_response = client.get("/api/v4/birth-data", params={**subject, "month": 13})
+    assert invalid_response.status_code == 422
+    assert invalid_response.json()["detail"][0]["loc"] == ["query", "subject", "month"]
+
+    # The query parameters are documented as the fields of the request model
+    parameters = {parameter["name"]: parameter for parameter in app.openapi()["paths"]["/api/v4/synastry-aspects-data"]["get"]["parameters"]}
+    assert {"first_year", "second_city", "active_points", "active_aspects"} <= set(parameters)
+    assert parameters["first_year"]["required"] is True
+    assert parameters["active_points"]["required"] is False
+
+
+def test_result_version(tmp_path, monkeypatch):
+    """
+    Tests if the version of the results changes with the timezone index
+    """
+
+    from app.config.settings import settings
+    from app.utils.request_hash import get_result_version
+
+    timezone_index_path = tmp_path / "timezones.idx"
+    timezone_index_path.write_bytes(b"first index")
+    monkeypatch.setattr(settings, "timezone_index_path", str(timezone_index_path))
+    get_result_version.cache_clear()
+
+    try:
+        first_version = get_result_version()
+        assert get_result_version() == first_version
+
+        timezone_index_path.write_bytes(b"rebuilt index")
+        get_result_version.cache_clear()
+        assert get_result_version() != first_version
+
+    finally:
+        monkeypatch.undo()
+        get_result_version.cache_clear()
+
+
+def test_response_cache_middleware(tmp_path):
+    """
+    Tests if the responses of the cached endpoints are stored by canonical request, with every backend
+    """
+
+    from fastapi import FastAPI
+    from app.middleware.response_cache_middleware import ResponseCacheMiddleware
+    from app.routers import main_router
+    from app.utils.response_cache_backends import MemoryResponseCacheBackend, SQLiteResponseCacheBackend
+
+    # The endpoints without the middleware of the app
+    endpoints_app = FastAPI()
+    endpoints_app.include_router(main_router.router)
+
+    request_body = {
+        "subject": {
+            "name": "FastAPI Unit Test",
+            "year": 1962,
+            "month": 3,
+            "day": 3,
+            "hour": 3,
+            "minute": 3,
+            "longitude": 12.4963655,
+            "latitude": 41.9027835,
+            "city": "Roma",
+            "nation": "IT",
+            "timezone": "Europe/Rome",
+        }
+    }
+    reordered_request_body = {"subject": dict(reversed(request_body["subject"].items()))}
+
+    for backend in [MemoryResponseCacheBackend(16), SQLiteResponseCacheBackend(tmp_path / "responses.sqlite3", 16)]:
+        cached_client = TestClient(ResponseCacheMiddleware(endpoints_app, backend=backend, routes={"/api/v4/birth-data": {"ttl": 60, "max_size": 1048576}, "/api/v4/birth-chart": {"ttl": 60, "max_size": 1024}}))
+
+        first_response = cached_client.post("/api/v4/birth-data", json=request_body)
+        second_response = cached_client.post("/api/v4/birth-data", json=reordered_request_body)
+
+        assert first_response.headers["x-cache"] == "MISS"
+        assert second_response.headers["x-cache"] == "HIT"
+        assert second_response.json() == first_response.json()
+        assert second_response.headers["content-type"] == "application/json"
+
+        # The chart is larger than the maximum size of its route, so it is not stored
+        cached_client.post("/api/v4/birth-chart", json=request_body)
+        assert cached_client.post("/api/v4/birth-chart", json=request_body).headers["x-cache"] == "MISS"
+
+        # Errors are not stored
+        cached_client.post("/api/v4/birth-data", json={"subject": {**request_body["subject"], "month": 13}})
+        assert cached_client.post("/api/v4/birth-data", json={"subject": {**request_body["subject"], "month": 13}}).headers["x-cache"] == "MISS"
+
+
+def test_redis_response_cache_backend():
+    """
+    Tests the Redis backend against a minimal stand-in server speaking the Redis protocol
+    """
+
+    import asyncio
+    import time
+    from app.utils.response_cache_backends import RedisResponseCacheBackend
+
+    async def run():
+        store: dict[bytes, tuple[bytes, float]] = {}
+        commands: list[bytes] = []
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            while not reader.at_eof():
+                header = await reader.readline()
+                if not header:
+                    break
+
+                arguments = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    arguments.append((await reader.readexactly(length + 2))[:-2])
+
+                commands.append(arguments[0])
+                if arguments[0] == b"SELECT":
+                    writer.write(b"+OK\r\n")
+                elif arguments[0] == b"SET":
+                    store[arguments[1]] = (arguments[2], time.time() + int(arguments[4]) / 1000)
+                    writer.write(b"+OK\r\n")
+                elif arguments[0] == b"GET" and arguments[1] in store and store[arguments[1]][1] > time.time():
+                    writer.write(b"$%d\r\n%s\r\n" % (len(store[arguments[1]][0]), store[arguments[1]][0]))
+                elif arguments[0] == b"GET":
+                    writer.write(b"$-1\r\n")
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+
+                await writer.drain()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        backend = RedisResponseCacheBackend(f"redis://127.0.0.1:{port}/2")
+
+        assert await backend.lookup("key") is None
+        await backend.store("key", b"\x00binary\r\nvalue", 60)
+        assert await backend.lookup("key") == b"\x00binary\r\nvalue"
+        assert commands[0] == b"SELECT"
+        assert (backend.hits, backend.misses, backend.errors) == (1, 1, 0)
+
+        # An unreachable server is a miss, not an error of the request
+        unreachable_backend = RedisResponseCacheBackend("redis://127.0.0.1:1/0")
+        assert await unreachable_backend.lookup("key") is None
+        assert unreachable_backend.errors == 1
+
+        backend.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def _set_shared_memory_cache_value(path, key, value):
+    from app.utils.shared_memory_cache import SharedMemoryCache
+
+    SharedMemoryCache(path, 16, 1024, ttl=60, ways=4).set(key, value)
+
+
+def test_shared_memory_cache(tmp_path):
+    """
+    Tests if the values cached by a process are read by the others, and the eviction of the least recently used
+    """
+
+    import multiprocessing
+    import os
+    import pytest
+    from app.utils.shared_memory_cache import SharedMemoryCache
+
+    path = tmp_path / "shared.cache"
+    cache = SharedMemoryCache(path, 16, 1024, ttl=60, ways=4)
+
+    process = multiprocessing.get_context("spawn").Process(target=_set_shared_memory_cache_value, args=(path, "subject", {"sun": "Gem"}))
+    process.start()
+    process.join()
+
+    assert cache.get("subject") == {"sun": "Gem"}
+    assert cache.get("missing") is None
+    assert cache.set("large", os.urandom(2048)) is False
+
+    # A bucket keeps four keys: the least recently used one is replaced
+    cache = SharedMemoryCache(tmp_path / "eviction.cache", 16, 1024, ttl=60, ways=4)
+    keys = [f"key-{index}" for index in range(200)]
+    same_bucket_keys = [key for key in keys if cache._get_bucket(cache.get_key(key)) == cache._get_bucket(cache.get_key(keys[0]))][:5]
+    for key in same_bucket_keys[:4]:
+        cache.set(key, key)
+    cache.get(same_bucket_keys[0])
+    cache.set(same_bucket_keys[4], same_bucket_keys[4])
+
+    assert cache.get(same_bucket_keys[0]) == same_bucket_keys[0]
+    assert cache.get(same_bucket_keys[1]) is None
+    assert cache.get(same_bucket_keys[4]) == same_bucket_keys[4]
+    assert cache.evictions == 1
+
+    # A segment no process has open anymore (eg. left by a killed server) is emptied by the next one
+    cache.close()
+    stale_cache = SharedMemoryCache(tmp_path / "eviction.cache", 16, 1024, ttl=60, ways=4)
+    assert stale_cache.created
+    assert stale_cache.get(same_bucket_keys[4]) is None
+
+    # A segment needs at least one bucket, of slots larger than their header
+    with pytest.raises(ValueError):
+        SharedMemoryCache(tmp_path / "small.cache", 4, 1024, ttl=60, ways=8)
+    with pytest.raises(ValueError):
+        SharedMemoryCache(tmp_path / "small.cache", 16, 32, ttl=60, ways=4)
+
+
+def test_secret_key_checker_middleware_key_store(tmp_path):
+    """
+    Tests if the keys of the key store are accepted, reloaded when the file changes, and described in the request scope
+    """
+
+    import os
+    from starlette.responses import JSONResponse
+    from app.middleware.secret_key_checker_middleware import SecretKeyCheckerMiddleware
+    from app.utils.api_key_store import ApiKeyStore, add_api_key
+
+    async def echo_api_key(scope, receive, send):
+        from starlette.responses import JSONResponse
+
+        api_key = scope["state"]["api_key"]
+        await JSONResponse({"id": api_key.id, "tier": api_key.tier, "limits": api_key.limits})(scope, receive, send)
+
+    for keys_path in [tmp_path / "keys.json", tmp_path / "keys.sqlite3"]:
+        first_key = add_api_key(keys_path, "first-customer", "pro", {"requests_per_minute": 600})
+        key_store = ApiKeyStore(keys_path, reload_interval=0)
+        checked_client = TestClient(SecretKeyCheckerMiddleware(echo_api_key, secret_key_name="X-API-Key", secret_keys=["proxy-secret"], key_store=key_store))
+
+        assert checked_client.get("/", headers={"X-API-Key": first_key}).json() == {"id": "first-customer", "tier": "pro", "limits": {"requests_per_minute": 600}}
+        assert checked_client.get("/", headers={"X-API-Key": "proxy-secret"}).json()["id"] == "secret-key-0"
+        assert checked_client.get("/", headers={"X-API-Key": "wrong"}).status_code == 400
+        assert checked_client.get("/").status_code == 400
+
+        # The scraper of /metrics does not need an API key
+        exempt_client = TestClient(SecretKeyCheckerMiddleware(lambda scope, receive, send: JSONResponse({})(scope, receive, send), secret_key_name="X-API-Key", key_store=key_store, exempt_paths=("/metrics",)))
+        assert exempt_client.get("/metrics").status_code == 200
+        assert exempt_client.get("/api/v4/health").status_code == 400
+
+        # A key added while running is accepted without restarting
+        second_key = add_api_key(keys_path, "second-customer")
+        os.utime(keys_path, ns=(0, os.stat(keys_path).st_mtime_ns + 1_000_000))
+
+        assert checked_client.get("/", headers={"X-API-Key": second_key}).json()["tier"] == "default"
+        assert checked_client.get("/", headers={"X-API-Key": first_key}).status_code == 200
+
+
+def test_rate_limit_middleware(tmp_path):
+    """
+    Tests if the requests of every key are limited by the cost of their endpoints
+    """
+
+    from starlette.datastructures import Headers
+    from starlette.responses import JSONResponse
+    from app.middleware.rate_limit_middleware import RateLimitMiddleware
+    from app.utils.api_key_store import ApiKey
+    from app.utils.rate_limit_backends import MemoryRateLimitBackend, SQLiteRateLimitBackend
+
+    async def ok(scope, receive, send):
+        await JSONResponse({"status": "OK"})(scope, receive, send)
+
+    for backend in [MemoryRateLimitBackend(), SQLiteRateLimitBackend(tmp_path / "rate_limit.sqlite3")]:
+        rate_limit = RateLimitMiddleware(ok, backend=backend, secret_key_name="X-API-Key", rate=0.1, burst=10, costs={"/api/v4/birth-chart": 4, "/api/v4/health": 0})
+
+        # The limits of the keys in the keys file: a higher burst, a fixed quota and a burst lower than the chart cost
+        key_limits = {"premium": {"burst": 100}, "quota": {"rate": 0, "burst": 8}, "small": {"burst": 2}}
+
+        async def with_premium_key(scope, receive, send):
+            key = Headers(scope=scope).get("X-API-Key")
+            if key in key_limits:
+                scope.setdefault("state", {})["api_key"] = ApiKey(id=key, limits=key_limits[key])
+            await rate_limit(scope, receive, send)
+
+        limited_client = TestClient(with_premium_key)
+        first_key, second_key, premium_key = {"X-API-Key": "first"}, {"X-API-Key": "second"}, {"X-API-Key": "premium"}
+
+        responses = [limited_client.get("/api/v4/birth-chart", headers=first_key) for _ in range(3)]
+
+        assert [response.status_code for response in responses] == [200, 200, 429]
+        assert responses[0].headers["ratelimit-limit"] == "10"
+        assert responses[0].headers["ratelimit-remaining"] == "6"
+        assert responses[1].headers["ratelimit-remaining"] == "2"
+        assert int(responses[2].headers["retry-after"]) == 20
+
+        # The requests cheaper than the tokens left, those of the other keys and those without cost still pass
+        assert limited_client.get("/api/v4/birth-data", headers=first_key).status_code == 200
+        assert limited_client.get("/api/v4/birth-chart", headers=second_key).status_code == 200
+        assert limited_client.get("/api/v4/health", headers=first_key).status_code == 200
+        assert all(limited_client.get("/api/v4/birth-chart", headers=premium_key).status_code == 200 for _ in range(20))
+
+        # A rate of 0 is a fixed quota, never refilled: no window, no reset and no retry
+        quota_responses = [limited_client.get("/api/v4/birth-chart", headers={"X-API-Key": "quota"}) for _ in range(3)]
+
+        assert [response.status_code for response in quota_responses] == [200, 200, 429]
+        assert quota_responses[0].headers["ratelimit-policy"] == "8"
+        assert "ratelimit-reset" not in quota_responses[0].headers
+        assert "retry-after" not in quota_responses[2].headers
+        assert "quota of the API key is exhausted" in quota_responses[2].json()["message"]
+
+        # A request costing more than the burst can never pass
+        too_expensive = limited_client.get("/api/v4/birth-chart", headers={"X-API-Key": "small"})
+
+        assert too_expensive.status_code == 403
+        assert "retry-after" not in too_expensive.headers
+        assert limited_client.get("/api/v4/birth-data", headers={"X-API-Key": "small"}).status_code == 200
+
+
+def test_app_with_every_rate_limit_backend(tmp_path):
+    """
+    Tests if the app starts and shuts down with every configured rate limit backend, closing it
+    """
+
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    # A fresh interpreter for every backend, the app being built when app.main is imported
+    script = "\n".join(
+        [
+            "from fastapi.testclient import TestClient",
+            "from app.main import app, rate_limit_backend",
+            "with TestClient(app) as client:",
+            "    assert client.get('/api/v4/health/live').status_code == 200",
+            "print(type(rate_limit_backend).__name__)",
+        ]
+    )
+
+    for name, backend_class in [("memory", "MemoryRateLimitBackend"), ("sqlite", "SQLiteRateLimitBackend"), ("none", "NoneType")]:
+        environment = {**os.environ, "RATE_LIMIT_BACKEND": name, "RATE_LIMIT_SQLITE_PATH": str(tmp_path / "rate_limit.sqlite3")}
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=Path(__file__).parent.parent,
+            env=environment,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == backend_class
+        assert "Could not close the rate limit backend" not in result.stdout + result.stderr
+
+
+def test_structured_logging():
+    """
+    Tests if the log records have the fields of their request, and if the health checks are sampled
+    """
+
+    import json
+    import logging
+    from app.utils.structured_logging import JsonFormatter, RequestContextFilter, SamplingFilter, request_context
+
+    response = client.get("/api/v4/health", headers={"X-Request-ID": "unit-test-request"})
+    assert response.headers["x-request-id"] == "unit-test-request"
+    assert len(client.get("/api/v4/health", headers={"X-Request-ID": "invalid request id!"}).headers["x-request-id"]) == 32
+
+    token = request_context.set({"request_id": "unit-test-request", "scope": {"method": "POST", "path": "/api/v4/birth-data"}, "timings": {}})
+    record = logging.makeLogRecord({"name": "app", "levelno": 20, "levelname": "INFO", "msg": "%s: %s", "args": ("url", "message"), "duration_ms": 1.5})
+    RequestContextFilter().filter(record)
+    request_context.reset(token)
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "url: message"
+    assert entry["request_id"] == "unit-test-request"
+    assert entry["endpoint"] == "/api/v4/birth-data"
+    assert entry["duration_ms"] == 1.5
+    assert "key_id" not in entry
+
+    sampling_filter = SamplingFilter()
+    sampled_records = [logging.makeLogRecord({"name": "app", "msg": "Health check", "sample_rate": 10}) for _ in range(25)]
+    assert sum(sampling_filter.filter(sampled_record) for sampled_record in sampled_records) == 3
+
+
+def test_server_timing():
+    """
+    Tests if the durations of the stages are sent in the Server-Timing header to the keys enabling it,
+    and aggregated in the stage durations histogram
+    """
+
+    from fastapi import FastAPI
+    from starlette.datastructures import Headers
+    from app.routers import main_router
+    from app.middleware.request_context_middleware import RequestContextMiddleware
+    from app.utils.api_key_store import ApiKey
+    from app.utils.metrics import stage_duration_seconds
+
+    endpoints_app = FastAPI()
+    endpoints_app.include_router(main_router.router)
+
+    async def with_timing_key(scope, receive, send):
+        if Headers(scope=scope).get("X-API-Key") == "timing":
+            scope.setdefault("state", {})["api_key"] = ApiKey(id="timing", server_timing=True)
+        await endpoints_app(scope, receive, send)
+
+    timed_client = TestClient(RequestContextMiddleware(with_timing_key))
+    request_body = {
+        "subject": {
+            "name": "Server Timing Unit Test",
+            "year": 1971,
+            "month": 11,
+            "day": 23,
+            "hour": 7,
+            "minute": 45,
+            "longitude": 9.19,
+            "latitude": 45.4642,
+            "city": "Milano",
+            "nation": "IT",
+            "timezone": "Europe/Rome",
+        }
+    }
+
+    response = timed_client.post("/api/v4/birth-chart", json=request_body, headers={"X-API-Key": "timing"})
+    assert response.status_code == 200
+
+    timings = dict(entry.split(";dur=") for entry in response.headers["server-timing"].split(", "))
+    assert {"queue", "subject", "aspects", "render", "render.minify", "serialization", "total"} <= set(timings)
+    assert all(float(duration) >= 0 for duration in timings.values())
+    # The sub-stages are part of their stage: the stages add up to at most the total
+    assert sum(float(duration) for name, duration in timings.items() if "." not in name and name != "total") <= float(timings["total"])
+
+    assert "server-timing" not in timed_client.post("/api/v4/birth-chart", json=request_body).headers
+    assert ("/api/v4/birth-chart", "render") in stage_duration_seconds.collect()
+
+
+def test_metrics(monkeypatch):
+    """
+    Tests if the metrics are exposed in the Prometheus text format, to the scraper with the metrics key
+    """
+
+    from app.config.settings import settings
+    from app.utils.metrics import Histogram, Metric, render_metrics
+
+    client.get("/api/v4/health")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'astrologer_api_requests_total{endpoint="/api/v4/health",method="GET",status="200"}' in response.text
+    assert 'astrologer_api_request_duration_seconds_bucket{endpoint="/api/v4/health",le="+Inf"}' in response.text
+    assert 'astrologer_api_compute_pool_tasks{state="queued"}' in response.text
+    assert 'astrologer_api_process_memory_bytes{type="resident"}' in response.text
+
+    monkeypatch.setattr(settings, "metrics_key", "scraper-key")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scraper-key"}).status_code == 200
+    monkeypatch.undo()
+
+    histogram = Histogram("unit_test_duration_seconds", "Unit test", ("endpoint",), buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 0.5, 5]:
+        histogram.observe(('/api/v4/"quoted"',), value)
+
+    metrics_text = render_metrics()
+    del Metric.registry[histogram.name]
+
+    assert '# TYPE unit_test_duration_seconds histogram' in metrics_text
+    assert 'unit_test_duration_seconds_bucket{endpoint="/api/v4/\\"quoted\\"",le="0.1"} 1' in metrics_text
+    assert 'unit_test_duration_seconds_bucket{endpoint="/api/v4/\\"quoted\\"",le="1.0"} 3' in metrics_text
+    assert 'unit_test_duration_seconds_bucket{endpoint="/api/v4/\\"quoted\\"",le="+Inf"} 4' in metrics_text
+    assert 'unit_test_duration_seconds_count{endpoint="/api/v4/\\"quoted\\""} 4' in metrics_text
+
+
+def test_profiling_middleware(tmp_path):
+    """
+    Tests if the requests of the authorized keys and the sampled requests are profiled
+    """
+
+    import json
+    import pstats
+    from fastapi import FastAPI
+    from starlette.datastructures import Headers
+    from app.routers import main_router
+    from app.middleware.profiling_middleware import ProfilingMiddleware
+    from app.middleware.request_context_middleware import RequestContextMiddleware
+    from app.middleware.response_cache_middleware import ResponseCacheMiddleware
+    from app.utils.api_key_store import ApiKey
+    from app.utils.response_cache_backends import MemoryResponseCacheBackend
+
+    endpoints_app = FastAPI()
+    endpoints_app.include_router(main_router.router)
+
+    cached_app = ResponseCacheMiddleware(endpoints_app, backend=MemoryResponseCacheBackend(16), routes={"/api/v4/birth-data": {"ttl": 60}})
+    profiling_app = ProfilingMiddleware(cached_app, tmp_path, key_ids=["profiler"], sample_rate=3)
+
+    async def with_profiler_key(scope, receive, send):
+        if Headers(scope=scope).get("X-API-Key") == "profiler":
+            scope.setdefault("state", {})["api_key"] = ApiKey(id="profiler")
+        await profiling_app(scope, receive, send)
+
+    profiled_client = TestClient(RequestContextMiddleware(with_profiler_key))
+    request_body = {
+        "subject": {
+            "name": "Profiling Unit Test",
+            "year": 1983,
+            "month": 2,
+            "day": 9,
+            "hour": 21,
+            "minute": 5,
+            "longitude": 18.0686,
+            "latitude": 59.3293,
+            "city": "Stockholm",
+            "nation": "SE",
+            "timezone": "Europe/Stockholm",
+        }
+    }
+
+    response = profiled_client.post("/api/v4/birth-data", json=request_body, headers={"X-API-Key": "profiler", "X-Profile": "pstats"})
+    assert response.status_code == 200
+    assert response.headers["x-profile"].endswith(".pstats")
+    assert pstats.Stats(str(tmp_path / response.headers["x-profile"])).total_calls > 0
+
+    response = profiled_client.post("/api/v4/birth-data", json=request_body, headers={"X-API-Key": "profiler", "X-Profile": "speedscope"})
+    speedscope_profile = json.loads((tmp_path / response.headers["x-profile"]).read_text())
+    assert speedscope_profile["profiles"][0]["type"] == "sampled"
+
+    # The header of the other keys is ignored, and one request in three is profiled
+    responses = [profiled_client.post("/api/v4/birth-data", json=request_body, headers={"X-API-Key": "other", "X-Profile": "pstats"}) for _ in range(3)]
+    assert ["x-profile" in response.headers for response in responses] == [False, False, True]
+    # The profiled requests compute, even when the response is cached
+    assert [response.headers["x-cache"] for response in responses] == ["HIT", "HIT", "MISS"]
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_request_capture_and_replay(tmp_path):
+    """
+    Tests if the captured requests are written in the captured requests format, and replayed
+    """
+
+    import asyncio
+    from pathlib import Path
+    from fastapi import FastAPI
+    from app.routers import main_router
+    from app.middleware.request_capture_middleware import RequestCaptureMiddleware
+    from app.utils.request_capture import CapturedRequestsWriter, read_captured_requests, redact_body, redact_query
+    from tests.benchmarks.replay import run_replay
+
+    endpoints_app = FastAPI()
+    endpoints_app.include_router(main_router.router)
+
+    writer = CapturedRequestsWriter(tmp_path / "captured.jsonl")
+    capturing_client = TestClient(RequestCaptureMiddleware(endpoints_app, writer, sample_rate=2))
+    subject = {
+        "name": "Capture Unit Test",
+        "year": 1990,
+        "month": 7,
+        "day": 14,
+        "hour": 16,
+        "minute": 20,
+        "longitude": 2.3522,
+        "latitude": 48.8566,
+        "city": "Paris",
+        "nation": "FR",
+        "timezone": "Europe/Paris",
+    }
+
+    for _ in range(4):
+        assert capturing_client.post("/api/v4/birth-data", json={"subject": subject}, headers={"X-API-Key": "secret-key"}).status_code == 200
+    capturing_client.get("/api/v4/health")
+    writer.close()
+
+    captured_requests = list(read_captured_requests(tmp_path / "captured.jsonl"))
+    assert len(captured_requests) == 2
+    assert captured_requests[0].path == "/api/v4/birth-data"
+    assert captured_requests[0].status == 200
+    assert captured_requests[0].body == {"subject": {**subject, "name": "REDACTED", "longitude": 2.4, "latitude": 48.9}}
+    assert "x-api-key" not in captured_requests[0].headers
+    assert redact_body({"subject": {**subject, "geonames_username": "secret"}})["subject"]["geonames_username"] == "REDACTED"
+    # The identifiers of the ranking candidates are those of profiles
+    ranking_body = redact_body({"subject": subject, "candidates": [{"id": "user-42", "subject": subject}], "top_k": 1})
+    assert ranking_body["candidates"] == [{"id": "REDACTED", "subject": {**subject, "name": "REDACTED", "longitude": 2.4, "latitude": 48.9}}]
+    # The names of the active aspects are not personal data
+    assert redact_body({"active_aspects": [{"name": "conjunction", "orb": 10}]}) == {"active_aspects": [{"name": "conjunction", "orb": 10}]}
+    assert redact_query("city=Paris&geonames_username=secret") == "city=Paris&geonames_username=REDACTED"
+    assert redact_query("first_name=Jane&first_latitude=48.8566&second_name=John") == "first_name=REDACTED&first_latitude=48.9&second_name=REDACTED"
+
+    summary = asyncio.run(run_replay(list(read_captured_requests(Path(__file__).parent / "benchmarks" / "captured_requests.sample.jsonl")), concurrency=2))
+    assert summary["total"]["requests"] == 8
+    assert summary["total"]["error_rate"] == 0
+    assert summary["endpoints"]["/api/v4/birth-data"]["requests"] == 3
+    assert summary["total"]["p50_ms"] <= summary["total"]["p99_ms"]
+    assert sorted(request["index"] for request in summary["slowest"]) == list(range(8))
+    assert summary["failed"] == []
+
+
+def test_benchmark_suite_regressions():
+    """
+    Tests if the benchmark results slower than the baseline beyond the allowed regression are reported
+    """
+
+    from tests.benchmarks.benchmark_suite import BenchmarkCase, compare_with_baseline, run_case
+
+    result = run_case(BenchmarkCase("unit-test", lambda: sum(range(1000))), iterations=5, warmup=1)
+    assert result["iterations"] == 5
+    assert result["min_ms"] <= result["median_ms"] <= result["p95_ms"]
+
+    baseline = {
+        "version": 1,
+        "results": {"fast": {"median_ms": 0.1}, "stable": {"median_ms": 10.0}, "slower": {"median_ms": 10.0}, "noisy": {"median_ms": 10.0}},
+        "max_regression": {"noisy": 1.0},
+    }
+    results = {
+        "version": 1,
+        "results": {"fast": {"median_ms": 0.3}, "stable": {"median_ms": 11.0}, "slower": {"median_ms": 14.0}, "noisy": {"median_ms": 18.0}, "new": {"median_ms": 100.0}},
+    }
+
+    regressions = compare_with_baseline(results, baseline, max_regression=0.25, min_difference_ms=0.5)
+    assert [regression.case for regression in regressions] == ["slower"]
+    assert [regression.case for regression in compare_with_baseline(results, baseline, max_regression=0.05, min_difference_ms=0.5)] == ["stable", "slower"]
+
+
+def test_workload_generator():
+    """
+    Tests if the generated workload covers every house system, sidereal mode and perspective type, and
+    is the same for the same seed
+    """
+
+    from typing import get_args
+
+    from kerykeion.kr_types.kr_literals import HousesSystemIdentifier, PerspectiveType, SiderealMode
+
+    from tests.benchmarks.workload_generator import generate_workload, parse_mix
+
+    workload = generate_workload(150, seed=1)
+    subjects = [subject for request in workload for subject in (request.body.get("subject"), request.body.get("first_subject")) if subject]
+
+    assert len(workload) == 150
+    assert {subject.get("houses_system_identifier") for subject in subjects} >= set(get_args(HousesSystemIdentifier))
+    assert {subject.get("sidereal_mode") for subject in subjects} >= set(get_args(SiderealMode))
+    assert {subject.get("perspective_type") for subject in subjects} >= set(get_args(PerspectiveType))
+    assert {subject["year"] for subject in subjects} >= {1800, 2100}
+    assert any(abs(subject["latitude"]) > 89 for subject in subjects)
+    assert any(abs(subject["longitude"]) == 180 for subject in subjects)
+    assert [request.body for request in generate_workload(150, seed=1)] == [request.body for request in workload]
+
+    workload = generate_workload(20, adversarial=0, mix=parse_mix("birth-chart=1,lunar-phases-calendar=1"))
+    assert {request.path for request in workload} == {"/api/v4/birth-chart", "/api/v4/lunar-phases-calendar"}
+
+
+def test_readiness():
+    """
+    Tests if the worker reports ready once warmed up, and not ready when saturated or when a required
+    dependency is failing
+    """
+
+    import time
+
+    from app.utils.drain import drain
+    from app.utils.readiness import DependencyHealth, Readiness
+    from app.utils.response_cache_backends import MemoryResponseCacheBackend
+
+    with TestClient(app) as probed_client:
+        for _ in range(100):
+            response = probed_client.get("/api/v4/health/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.1)
+
+        assert response.status_code == 200
+        assert response.json()["warmed_up"] is True
+        assert response.json()["failing"] == []
+        assert probed_client.get("/api/v4/health/live").json() == {"status": "OK"}
+
+    # The shutdown of the app drained the process: the other tests use it without a lifespan.
+    drain.reset()
+
+    readiness = Readiness(max_queue_depth=0, max_event_loop_lag=0.1, required_dependencies=("unit_test",))
+    dependency = DependencyHealth("unit_test", failure_threshold=2)
+
+    try:
+        assert readiness.get_report()[1]["failing"] == ["warm_up"]
+
+        readiness.warmed_up = True
+        dependency.record(False)
+        assert readiness.get_report()[0] is True
+
+        dependency.record(False)
+        ready, report = readiness.get_report()
+        assert ready is False
+        assert report["failing"] == ["unit_test"]
+        assert report["dependencies"]["unit_test"] == "failing"
+
+        dependency.record(True)
+        readiness.event_loop_lag_monitor.lag = 0.2
+        readiness.max_queue_depth = -1
+        assert readiness.get_report()[1]["failing"] == ["queue", "event_loop_lag"]
+
+        # Every probe sees a response cache error for the error window, not only the first one after it
+        readiness.response_cache_backend = MemoryResponseCacheBackend(1)
+        readiness.response_cache_backend.last_error_at = time.monotonic()
+        assert [readiness.get_cache_statuses()["response_cache"] for _ in range(3)] == ["failing"] * 3
+
+        readiness.response_cache_backend.last_error_at -= readiness.cache_error_window
+        assert readiness.get_cache_statuses()["response_cache"] == "ok"
+
+    finally:
+        del DependencyHealth.registry["unit_test"]
+
+
+def test_drain():
+    """
+    Tests if a draining worker reports not ready and refuses new computations with a 503, and if the
+    drain waits for the computations in progress
+    """
+
+    import asyncio
+    import time
+    import uuid
+
+    from app.utils.compute_pool import compute_pool
+    from app.utils.drain import Drain, drain
+
+    body = {"subject": {"name": f"Drain {uuid.uuid4()}", "year": 1980, "month": 12, "day": 12, "hour": 12, "minute": 12, "longitude": -0.1278, "latitude": 51.5074, "city": "London", "nation": "GB", "timezone": "Europe/London"}}
+
+    drain.start()
+
+    try:
+        response = client.post("/api/v4/birth-data", json=body)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert response.json()["status"] == "KO"
+
+        response = client.get("/api/v4/health/ready")
+        assert response.status_code == 503
+        assert "draining" in response.json()["failing"]
+
+    finally:
+        drain.reset()
+
+    assert client.post("/api/v4/birth-data", json=body).status_code == 200
+
+    async def drain_while_computing() -> float:
+        test_drain = Drain(timeout=5)
+        computation = asyncio.create_task(compute_pool.run(time.sleep, 0.3))
+        await asyncio.sleep(0.05)
+
+        closed = []
+        test_drain.add_closer("the test writer", lambda: closed.append(True))
+        await test_drain.finish()
+        assert closed == [True]
+        assert computation.done()
+
+        return time.monotonic() - test_drain.started_at
+
+    try:
+        assert 0.2 < asyncio.run(drain_while_computing()) < 5
+        assert compute_pool.queued == 0 and compute_pool.running == 0
+
+    finally:
+        drain.reset()
+
+
+def test_compute_deadline():
+    """
+    Tests if a computation over the deadline of its endpoint is answered with a 504 timeout error
+    """
+
+    import time
+    import uuid
+
+    from app.config.settings import settings
+    from app.utils.compute_pool import compute_pool
+
+    body = {"subject": {"name": f"Deadline {uuid.uuid4()}", "year": 1980, "month": 12, "day": 12, "hour": 12, "minute": 12, "longitude": -0.1278, "latitude": 51.5074, "city": "London", "nation": "GB", "timezone": "Europe/London"}}
+    deadline = settings.compute_deadlines["/api/v4/birth-chart"]
+    settings.compute_deadlines["/api/v4/birth-chart"] = 0.001
+
+    try:
+        response = client.post("/api/v4/birth-chart", json=body)
+    finally:
+        settings.compute_deadlines["/api/v4/birth-chart"] = deadline
+
+    assert response.status_code == 504
+    assert response.json()["status"] == "KO"
+    assert "0.001 seconds" in response.json()["message"]
+
+    # The cancelled computation stops at its next stage.
+    for _ in range(50):
+        if compute_pool.running == 0 and compute_pool.queued == 0:
+            break
+        time.sleep(0.1)
+
+    assert compute_pool.running == 0 and compute_pool.queued == 0
+
+
+def test_computation_cancellation():
+    """
+    Tests if a cancelled computation is dropped when queued and stopped at its next stage when running,
+    if a client disconnect cancels its computation, and if a coalesced computation is only cancelled when
+    all its callers went away
+    """
+
+    import asyncio
+    import time
+
+    import pytest
+
+    from app.utils.cancellation import ClientDisconnectedError, ComputationTimeoutError, run_with_deadline
+    from app.utils.compute_pool import ComputePool
+    from app.utils.single_flight import SingleFlight
+    from app.utils.stage_timer import stage
+
+    stages = []
+
+    def compute(steps: int) -> int:
+        for step in range(steps):
+            with stage("unit_test"):
+                stages.append(step)
+                time.sleep(0.02)
+
+        return steps
+
+    class DisconnectingRequest:
+        def __init__(self, disconnect_after: float) -> None:
+            self.disconnect_at = time.monotonic() + disconnect_after
+
+        async def is_disconnected(self) -> bool:
+            return time.monotonic() > self.disconnect_at
+
+    async def cancel_computations(pool: ComputePool) -> None:
+        running = asyncio.ensure_future(pool.run(compute, 100))
+        queued = asyncio.ensure_future(pool.run(compute, 100))
+        await asyncio.sleep(0.1)
+
+        running.cancel()
+        queued.cancel()
+        await asyncio.gather(running, queued, return_exceptions=True)
+
+        assert pool.cancelled == 1
+
+        with pytest.raises(ComputationTimeoutError):
+            await run_with_deadline(DisconnectingRequest(60), pool.run(compute, 100), 0.1)
+
+        with pytest.raises(ClientDisconnectedError):
+            await run_with_deadline(DisconnectingRequest(0.1), pool.run(compute, 100), 60)
+
+        assert await run_with_deadline(DisconnectingRequest(60), pool.run(compute, 2), 60) == 2
+
+    pool = ComputePool(1)
+    asyncio.run(cancel_computations(pool))
+    pool.shutdown()
+
+    # Every cancelled computation stopped after a few stages, instead of the 300 of their 3 runs.
+    assert 0 < len(stages) < 100
+    assert pool.queued == 0 and pool.running == 0
+
+    async def leave_coalesced_computation() -> None:
+        single_flight = SingleFlight()
+        computation_cancelled = asyncio.Event()
+
+        async def computation() -> str:
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                computation_cancelled.set()
+                raise
+
+            return "computed"
+
+        first = asyncio.ensure_future(single_flight.run("key", computation))
+        second = asyncio.ensure_future(single_flight.run("key", computation))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not computation_cancelled.is_set()
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        assert computation_cancelled.is_set()
+        assert single_flight.in_flight == 0
+
+    asyncio.run(leave_coalesced_computation())
+
+
+def test_startup_budget():
+    """
+    Tests if importing the app stays within the startup budget, without the lazily imported modules
+    """
+
+    from tests.benchmarks.startup_benchmark import check_startup_budget, get_import_times, get_startup_report
+
+    report = get_startup_report(get_import_times("app.main"))
+
+    assert report["total_ms"] is not None
+    assert "app.routers.main_router" in report["app_modules"]
+    assert check_startup_budget(report) == []
+
+
+def test_openapi_cache(tmp_path):
+    """
+    Tests if the OpenAPI document is generated once, then read from the cache until the fingerprint changes
+    """
+
+    import json
+
+    from app.utils.openapi_cache import get_cached_openapi
+
+    generated = []
+
+    def generate() -> dict:
+        generated.append(True)
+        return {"openapi": "3.1.0", "paths": {}}
+
+    cache_path = tmp_path / "openapi.json"
+    assert get_cached_openapi(cache_path, generate) == {"openapi": "3.1.0", "paths": {}}
+    assert get_cached_openapi(cache_path, generate) == {"openapi": "3.1.0", "paths": {}}
+    assert len(generated) == 1
+
+    cache_path.write_text(json.dumps({"fingerprint": "stale", "openapi": {}}))
+    assert get_cached_openapi(cache_path, generate) == {"openapi": "3.1.0", "paths": {}}
+    assert len(generated) == 2
+
+    assert client.get("/openapi.json").json()["info"]["title"] == "Astrologer API"
+
+
+def test_prefork_server():
+    """
+    Tests if the prefork server serves from its workers, restarts a killed worker and stops on SIGTERM
+    """
+
+    import os
+    import signal
+    import socket
+    import subprocess
+    import sys
+    import time
+    from pathlib import Path
+
+    import requests
+
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port = free_socket.getsockname()[1]
+
+    def get_workers(pid: int) -> set[int]:
+        return {int(child) for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()}
+
+    def wait_for(condition, timeout: float = 30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if condition():
+                    return True
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+
+        return False
+
+    master = subprocess.Popen(
+        [sys.executable, "serve.py", "--port", str(port), "--workers", "2", "--graceful-timeout", "5"],
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        assert wait_for(lambda: requests.get(f"http://127.0.0.1:{port}/api/v4/health/live", timeout=5).status_code == 200)
+        assert wait_for(lambda: len(get_workers(master.pid)) == 2)
+
+        workers = get_workers(master.pid)
+        killed = workers.pop()
+        os.kill(killed, signal.SIGKILL)
+
+        assert wait_for(lambda: len(get_workers(master.pid)) == 2 and killed not in get_workers(master.pid))
+        assert workers <= get_workers(master.pid)
+        assert wait_for(lambda: requests.get(f"http://127.0.0.1:{port}/api/v4/health/ready", timeout=5).status_code == 200)
+
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=15) == 0
+
+    finally:
+        master.kill()
+        master.wait()
+
+
+def test_cache_snapshots(tmp_path):
+    """
+    Tests if a shared cache is restored from its snapshot, without the expired entries, and if a snapshot of another version or a corrupted one is discarded
+    """
+
+    from app.utils.cache_snapshots import load_snapshot, save_snapshot
+    from app.utils.shared_memory_cache import SharedMemoryCache
+
+    cache = SharedMemoryCache(tmp_path / "previous.cache", 64, 4096, 3600)
+    assert cache.created
+    for index in range(10):
+        cache.set(f"key-{index}", {"index": index})
+
+    expired_digest = SharedMemoryCache.get_key("expired")
+    cache.set_entry(expired_digest, 1.0, 1.0, b"expired")
+
+    snapshot_path = tmp_path / "subjects.snapshot"
+    assert save_snapshot(cache, snapshot_path, b"a" * 32) == 10
+
+    restored_cache = SharedMemoryCache(tmp_path / "restored.cache", 64, 4096, 3600)
+    assert load_snapshot(restored_cache, snapshot_path, b"a" * 32) == 10
+    assert [restored_cache.get(f"key-{index}") for index in range(10)] == [{"index": index} for index in range(10)]
+    assert not SharedMemoryCache(tmp_path / "restored.cache", 64, 4096, 3600).created
+
+    # Saved by another version of kerykeion or of the models
+    assert load_snapshot(SharedMemoryCache(tmp_path / "other.cache", 64, 4096, 3600), snapshot_path, b"b" * 32) == 0
+
+    # Truncated in the middle of the last entry
+    snapshot_path.write_bytes(snapshot_path.read_bytes()[:-1])
+    assert load_snapshot(SharedMemoryCache(tmp_path / "truncated.cache", 64, 4096, 3600), snapshot_path, b"a" * 32) == 9
+
+    assert load_snapshot(cache, tmp_path / "missing.snapshot", b"a" * 32) == 0
+
+
+def test_cache_snapshots_on_restart(tmp_path, monkeypatch):
+    """
+    Tests if the snapshots of the shared caches are saved, once by the workers sharing them, and restored by the next server
+    """
+
+    import time
+
+    from app.utils import cache_snapshots as cache_snapshots_module
+    from app.utils.cache_snapshots import CacheSnapshots, get_snapshot_fingerprint, load_snapshot
+    from app.utils.shared_memory_cache import SharedMemoryCache, get_shared_memory_cache
+
+    cache_snapshots = CacheSnapshots(tmp_path, 0)
+    cache_snapshots.open_shared_memory_caches()
+
+    subjects_cache = get_shared_memory_cache("subjects")
+    assert subjects_cache is not None
+    subjects_cache.set("snapshot-test", {"name": "Snapshot"})
+
+    assert cache_snapshots.save()["subjects"] >= 1
+    assert (tmp_path / "subjects.snapshot").exists()
+
+    # Saved by another worker since
+    assert cache_snapshots.save(unless_saved_since=time.time() - 60) == {}
+
+    next_cache = SharedMemoryCache(tmp_path / "next-subjects.cache", 64, 8192, 3600)
+    assert load_snapshot(next_cache, tmp_path / "subjects.snapshot", get_snapshot_fingerprint()) >= 1
+    assert next_cache.get("snapshot-test") == {"name": "Snapshot"}
+
+    # A deploy changing the sources computing the results discards the snapshots
+    fingerprint = get_snapshot_fingerprint()
+    monkeypatch.setattr(cache_snapshots_module, "get_result_version", lambda: "0" * 16)
+    get_snapshot_fingerprint.cache_clear()
+
+    try:
+        assert get_snapshot_fingerprint() != fingerprint
+    finally:
+        monkeypatch.undo()
+        get_snapshot_fingerprint.cache_clear()